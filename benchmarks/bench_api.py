@@ -0,0 +1,123 @@
+"""In-process load test of the real app: throughput and p50/p95/p99 per route.
+
+Requests go straight into the ASGI app (benchmarks.common.asgi_request), with
+--concurrency clients per route issuing --requests in total, so the numbers
+include routing, auth, middleware, caches and serialization but no sockets.
+
+Against DATABASE_URL the app starts through its own lifespan and the seeded
+dataset is loaded into it. With --fake the pool is benchmarks.fakepool and
+only the routes it can serve are run. Rate limits are off unless
+--rate-limits is given; admission control stays on.
+
+    python -m benchmarks.bench_api --requests 2000 --concurrency 32
+    python -m benchmarks.bench_api --fake --route blogs --route blog
+"""
+import argparse
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Callable, Optional
+from urllib.parse import urlencode
+
+from benchmarks.common import asgi_request, emit, percentiles
+from benchmarks.fakepool import FakePool
+from benchmarks.seed import LOGIN_PASSWORD, Dataset, generate, load, login_password
+from benchmarks.bench_services import busiest_blog
+from blog_crud import ratelimit
+from blog_crud.auth import create_access_token
+from blog_crud.db import InstrumentedPool, db, get_db
+from blog_crud.main import app
+
+# name -> (method, path for the i-th request, needs the database)
+Route=tuple[str,Callable[[int],str],bool]
+
+
+def routes(data:Dataset,rng:random.Random)->dict[str,Route]:
+    blogs=[b[0] for b in data.blogs]
+    busiest=busiest_blog(data)
+    return {
+        "blogs":("GET",lambda i:"/blogs",False),
+        "blogs_summary":("GET",lambda i:"/blogs?summary=true",False),
+        "blogs_counts":("GET",lambda i:"/blogs?counts=true",False),
+        "blog":("GET",lambda i:f"/blog/{blogs[rng.randrange(len(blogs))]}",False),
+        "blog_full":("GET",lambda i:f"/blog/{busiest}/full",True),
+        "comments":("GET",lambda i:f"/blog/comments/{busiest}",False),
+        "user_comments":("GET",lambda i:"/user/comments",False),
+        "search":("GET",lambda i:f"/search?q={data.blogs[i%len(blogs)][2].split()[0]}",True),
+        "login":("POST",lambda i:"/login",False),
+    }
+
+
+async def drive(method:str,path:Callable[[int],str],headers:dict,body:bytes,requests:int,concurrency:int)->dict:
+    samples,statuses=[],{}
+    queue=iter(range(requests))
+
+    async def client():
+        for i in queue:
+            start=time.perf_counter()
+            status,_=await asgi_request(app,method,path(i),headers,body)
+            samples.append(time.perf_counter()-start)
+            statuses[status]=statuses.get(status,0)+1
+
+    start=time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed=time.perf_counter()-start
+    return {"requests":requests,"seconds":round(elapsed,3),"requests_per_second":round(requests/elapsed,1),
+            "statuses":{str(k):v for k,v in sorted(statuses.items())},**percentiles(samples)}
+
+
+@asynccontextmanager
+async def running_app(data:Dataset,fake:bool):
+    if fake:
+        db.pool=InstrumentedPool(FakePool(data))
+        try:
+            yield data
+        finally:
+            db.pool=None
+        return
+    async with app.router.lifespan_context(app):
+        yield await load(get_db(),data)
+
+
+async def run(users:int,blogs:int,comments:int,requests:int,login_requests:int,concurrency:int,
+              seed:int,fake:bool,only:Optional[list[str]],rate_limits:bool)->dict:
+    ratelimit.RATE_LIMITS_ENABLED=rate_limits
+    data=generate(users,blogs,comments,seed,password=await login_password())
+    results={"backend":"fake" if fake else "postgres","dataset":data.describe(),
+             "concurrency":concurrency,"rate_limits":rate_limits,"routes":{}}
+    async with running_app(data,fake) as data:
+        rng=random.Random(seed)
+        user_id,name,_=data.users[0]
+        auth={"Authorization":f"Bearer {create_access_token(user_id=user_id,name=name)}"}
+        for route,(method,path,needs_database) in routes(data,rng).items():
+            if (only and route not in only) or (fake and needs_database):
+                continue
+            headers,body,count=auth,b"",requests
+            if route=="login":
+                # argon2 is the cost here; fewer requests say as much
+                headers={"Content-Type":"application/x-www-form-urlencoded"}
+                body=urlencode({"username":name,"password":LOGIN_PASSWORD}).encode()
+                count=login_requests
+            if not count:
+                continue
+            results["routes"][route]=await drive(method,path,headers,body,count,concurrency)
+    return results
+
+
+if __name__=="__main__":
+    parser=argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users",type=int,default=1000)
+    parser.add_argument("--blogs",type=int,default=10_000)
+    parser.add_argument("--comments",type=int,default=100_000)
+    parser.add_argument("--requests",type=int,default=2000,help="per route")
+    parser.add_argument("--login-requests",type=int,default=100)
+    parser.add_argument("--concurrency",type=int,default=32)
+    parser.add_argument("--seed",type=int,default=7)
+    parser.add_argument("--fake",action="store_true",help="use the in-memory pool instead of DATABASE_URL")
+    parser.add_argument("--route",action="append",help="run only these routes (repeatable)")
+    parser.add_argument("--rate-limits",action="store_true")
+    parser.add_argument("--output",help="also write the JSON report to this file")
+    args=parser.parse_args()
+    emit("api",asyncio.run(run(args.users,args.blogs,args.comments,args.requests,args.login_requests,args.concurrency,
+                               args.seed,args.fake,args.route,args.rate_limits)),args.output)
@@ -0,0 +1,99 @@
+"""Idle comment-feed subscribers in one worker.
+
+Opens --subscribers SSE streams (sse_stream consumers, as the route runs
+them) spread over --blogs blogs, then reports memory per subscriber, CPU
+used while idle, and how long one new comment takes to reach every
+subscriber of a blog. The feed reads from an in-memory comments table, so
+this measures the fan-out itself; no database or sockets are involved.
+
+    python -m benchmarks.bench_feed --subscribers 10000
+"""
+import argparse
+import asyncio
+import resource
+import time
+import tracemalloc
+
+from benchmarks.common import emit, percentiles
+from blog_crud.feed import CommentFeed, sse_stream
+
+
+class MemoryComments:
+    def __init__(self):
+        self.rows=[]
+
+    def add(self,blog_id:int):
+        self.rows.append({"id":len(self.rows)+1,"blog_id":blog_id,"user_id":1,"content":"x"*200})
+
+    async def fetchval(self,query,blog_id):
+        return max((r["id"] for r in self.rows if r["blog_id"]==blog_id),default=0)
+
+    async def fetch(self,query,blog_id,after,limit):
+        return [r for r in self.rows if r["blog_id"]==blog_id and r["id"]>after][:limit]
+
+
+async def consume(feed,sub,received:dict,blog_id:int):
+    async for frame in sse_stream(feed,sub,heartbeat=30):
+        if frame.startswith(b"id:"):
+            received[blog_id].append(time.perf_counter())
+
+
+async def run(subscribers:int,blogs:int,idle:float,rounds:int)->dict:
+    comments=MemoryComments()
+    feed=CommentFeed(max_subscribers=subscribers)
+    feed.bind(lambda:comments)
+    received={b:[] for b in range(blogs)}
+
+    tracemalloc.start()
+    before=tracemalloc.get_traced_memory()[0]
+    start=time.perf_counter()
+    tasks=[]
+    for i in range(subscribers):
+        blog_id=i%blogs
+        sub=await feed.subscribe(blog_id)
+        tasks.append(asyncio.create_task(consume(feed,sub,received,blog_id)))
+    await asyncio.sleep(0.1)
+    subscribe_seconds=time.perf_counter()-start
+    per_subscriber=(tracemalloc.get_traced_memory()[0]-before)/subscribers
+    tracemalloc.stop()
+
+    cpu=time.process_time()
+    await asyncio.sleep(idle)
+    idle_cpu=time.process_time()-cpu
+
+    fanout=[]
+    for _ in range(rounds):
+        for b in received:
+            received[b].clear()
+        comments.add(0)
+        sent=time.perf_counter()
+        feed.on_event({"entity":"comments","id":0})
+        expected=len(feed.topics[0].subscribers)
+        while len(received[0])<expected:
+            await asyncio.sleep(0)
+        fanout.append(max(received[0])-sent)
+
+    feed.close_all()
+    await asyncio.gather(*tasks)
+    return {
+        "subscribers":subscribers,
+        "blogs":blogs,
+        "subscribe_seconds":round(subscribe_seconds,3),
+        "bytes_per_subscriber":round(per_subscriber),
+        "max_rss_mb":round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024,1),
+        "idle_seconds":idle,
+        "idle_cpu_seconds":round(idle_cpu,4),
+        "subscribers_per_hot_blog":expected,
+        "fanout_to_all":percentiles(fanout),
+    }
+
+
+if __name__=="__main__":
+    parser=argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subscribers",type=int,default=10_000)
+    parser.add_argument("--blogs",type=int,default=10)
+    parser.add_argument("--idle",type=float,default=5.0)
+    parser.add_argument("--rounds",type=int,default=20)
+    parser.add_argument("--output",help="also write the JSON report to this file")
+    args=parser.parse_args()
+    emit("feed",asyncio.run(run(args.subscribers,args.blogs,args.idle,args.rounds)),args.output)
@@ -0,0 +1,62 @@
+"""Per-row inserts (POST /blog, POST /comment) against the COPY path behind
+POST /blogs:batch and /comments:batch.
+
+    python -m benchmarks.bench_ingest --rows 10000
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.common import database, bench_user, emit, rate
+from blog_crud.service import BlogService, CommentService
+
+USER="bench_ingest"
+
+
+async def run(rows:int,chunk:int)->dict:
+    results={}
+    async with database() as db:
+        pool=db.pool
+        user_id=await bench_user(pool,USER)
+        try:
+            start=time.perf_counter()
+            blog_ids=[]
+            for i in range(rows):
+                blog_ids.append(await BlogService.create(f"title {i}",f"content {i}",user_id,pool))
+            results["blogs_per_row"]=rate(rows,time.perf_counter()-start)
+
+            start=time.perf_counter()
+            async with pool.acquire() as conn:
+                async with conn.transaction():
+                    for offset in range(0,rows,chunk):
+                        batch=[(f"title {i}",f"content {i}") for i in range(offset,min(offset+chunk,rows))]
+                        await BlogService.create_many(batch,user_id,conn)
+            results["blogs_copy"]=rate(rows,time.perf_counter()-start)
+
+            start=time.perf_counter()
+            for i in range(rows):
+                await CommentService.create(blog_ids[i%len(blog_ids)],f"comment {i}",user_id,pool)
+            results["comments_per_row"]=rate(rows,time.perf_counter()-start)
+
+            start=time.perf_counter()
+            async with pool.acquire() as conn:
+                async with conn.transaction():
+                    for offset in range(0,rows,chunk):
+                        batch=[(blog_ids[i%len(blog_ids)],f"comment {i}") for i in range(offset,min(offset+chunk,rows))]
+                        await CommentService.create_many(batch,user_id,conn)
+            results["comments_copy"]=rate(rows,time.perf_counter()-start)
+        finally:
+            await pool.execute("DELETE FROM users WHERE id=$1;",user_id)
+    for kind in ("blogs","comments"):
+        per_row,copy=results[f"{kind}_per_row"],results[f"{kind}_copy"]
+        results[f"{kind}_speedup"]=round(copy["rows_per_second"]/per_row["rows_per_second"],1)
+    return results
+
+
+if __name__=="__main__":
+    parser=argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows",type=int,default=5000)
+    parser.add_argument("--chunk",type=int,default=1000)
+    parser.add_argument("--output",help="also write the JSON report to this file")
+    args=parser.parse_args()
+    emit("ingest",asyncio.run(run(args.rows,args.chunk)),args.output)
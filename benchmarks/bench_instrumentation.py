@@ -0,0 +1,90 @@
+"""Overhead of MetricsMiddleware, of ServerTimingMiddleware with timing off
+and on, and of InstrumentedPool's per-query timing.
+
+Both are measured in-process against no-op targets (an endpoint returning a
+constant, a connection returning a constant), so the difference is the full
+cost of the instrumentation itself. No database is needed.
+
+    python -m benchmarks.bench_instrumentation --requests 20000
+"""
+import argparse
+import asyncio
+import time
+from typing import Optional
+
+from fastapi import FastAPI
+
+from benchmarks.common import asgi_request, emit
+from blog_crud.db import InstrumentedPool
+from blog_crud.middleware import MetricsMiddleware, ServerTimingMiddleware
+from blog_crud.profiling import ServerTiming, TimedRoute
+
+
+def make_app(instrumented:bool,timing:Optional[ServerTiming]=None)->FastAPI:
+    app=FastAPI()
+    if instrumented:
+        app.add_middleware(MetricsMiddleware)
+    if timing is not None:
+        app.router.route_class=TimedRoute
+        app.add_middleware(ServerTimingMiddleware,timing=timing)
+
+    @app.get("/blog/{blog_id}")
+    async def blog(blog_id:int):
+        return {"id":blog_id}
+
+    return app
+
+
+class NullConnection:
+    async def fetchrow(self,query,*args,timeout=None,record_class=None):
+        return {"id":1}
+
+
+class NullPool:
+    async def acquire(self,timeout=None):
+        return NullConnection()
+
+    async def release(self,conn):
+        pass
+
+
+async def per_call(fn,count:int)->float:
+    start=time.perf_counter()
+    for i in range(count):
+        await fn(i)
+    return (time.perf_counter()-start)/count*1e6
+
+
+async def run(requests:int,queries:int)->dict:
+    results={}
+    for name,instrumented in (("http_plain",False),("http_instrumented",True)):
+        app=make_app(instrumented)
+        results[name+"_us"]=round(await per_call(lambda i:asgi_request(app,"GET",f"/blog/{i}"),requests),2)
+    results["http_overhead_us"]=round(results["http_instrumented_us"]-results["http_plain_us"],2)
+    for name,rate in (("http_server_timing_off",0.0),("http_server_timing_on",1.0)):
+        timing=ServerTiming(rate)
+        app=make_app(False,timing)
+        results[name+"_us"]=round(await per_call(lambda i:asgi_request(app,"GET",f"/blog/{i}"),requests),2)
+    results["server_timing_off_overhead_us"]=round(results["http_server_timing_off_us"]-results["http_plain_us"],2)
+
+    pool=InstrumentedPool(NullPool())
+    query="SELECT * FROM blogs WHERE id=$1;"
+
+    async def untimed(i):
+        # the acquire wrapper predates query timing and is not counted
+        async with pool.acquire() as conn:
+            return await conn.fetchrow(query,i)
+
+    results["query_untimed_us"]=round(await per_call(untimed,queries),3)
+    results["query_timed_us"]=round(await per_call(lambda i:pool.fetchrow(query,i),queries),3)
+    results["query_overhead_us"]=round(results["query_timed_us"]-results["query_untimed_us"],3)
+    return results
+
+
+if __name__=="__main__":
+    parser=argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests",type=int,default=20000)
+    parser.add_argument("--queries",type=int,default=200000)
+    parser.add_argument("--output",help="also write the JSON report to this file")
+    args=parser.parse_args()
+    emit("instrumentation",asyncio.run(run(args.requests,args.queries)),args.output)
@@ -0,0 +1,74 @@
+"""Likes on a single hot blog: UPDATE blogs SET likes=likes+1 per click
+against LikeService, where each click only inserts its blog_likes row and
+blogs.likes is written behind by LikeBuffer.
+
+    python -m benchmarks.bench_likes --clicks 20000 --concurrency 64
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.common import database, bench_user, emit, rate
+from blog_crud.likes import LikeBuffer
+from blog_crud.service import BlogService, LikeService
+from blog_crud import service
+
+USER="bench_likes"
+
+
+async def clicks(concurrency:int,count:int,click):
+    queue=iter(range(count))
+
+    async def worker():
+        for i in queue:
+            await click(i)
+
+    start=time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter()-start
+
+
+async def run(count:int,concurrency:int,interval:float)->dict:
+    results={"clicks":count,"concurrency":concurrency,"flush_interval":interval}
+    async with database() as db:
+        pool=db.pool
+        owner=await bench_user(pool,USER)
+        try:
+            # likers are inserted directly; one per click so every like is new
+            likers=await pool.fetch('''
+                INSERT INTO users (name,password)
+                SELECT $1||'_'||i,'' FROM generate_series(1,$2) AS i
+                RETURNING id;
+                ''',USER,count)
+            likers=[r["id"] for r in likers]
+            blog_id=await BlogService.create("hot","post",owner,pool)
+
+            async def naive(i):
+                await pool.execute("UPDATE blogs SET likes=likes+1 WHERE id=$1;",blog_id)
+            results["row_update"]=rate(count,await clicks(concurrency,count,naive))
+
+            await pool.execute("UPDATE blogs SET likes=0 WHERE id=$1;",blog_id)
+            buffer=LikeBuffer(interval=interval)
+            service.like_buffer=buffer
+            buffer.start(pool)
+
+            async def buffered(i):
+                await LikeService.like(blog_id,likers[i],pool)
+            elapsed=await clicks(concurrency,count,buffered)
+            await buffer.stop()
+            results["write_behind"]=rate(count,elapsed)
+            results["likes_after_flush"]=await pool.fetchval("SELECT likes FROM blogs WHERE id=$1;",blog_id)
+        finally:
+            await pool.execute("DELETE FROM users WHERE name LIKE $1||'%';",USER)
+    results["speedup"]=round(results["write_behind"]["rows_per_second"]/results["row_update"]["rows_per_second"],1)
+    return results
+
+
+if __name__=="__main__":
+    parser=argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clicks",type=int,default=20000)
+    parser.add_argument("--concurrency",type=int,default=64)
+    parser.add_argument("--interval",type=float,default=1.0)
+    parser.add_argument("--output",help="also write the JSON report to this file")
+    args=parser.parse_args()
+    emit("likes",asyncio.run(run(args.clicks,args.concurrency,args.interval)),args.output)
@@ -0,0 +1,84 @@
+"""GET /search latency (BlogService.search) over a large blogs table.
+
+Seeds --rows blogs through the COPY path with Zipf-distributed vocabulary,
+so "term1" matches most rows and "term4000" almost none. The seeded data is
+kept between runs and reused when it is already large enough.
+
+    python -m benchmarks.bench_search --rows 1000000
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import time
+
+from benchmarks.common import database, bench_user, emit, percentiles
+from blog_crud.service import BlogService
+
+USER="bench_search"
+VOCABULARY=5000
+TERMS=[f"term{r}" for r in range(1,VOCABULARY+1)]
+CUM_WEIGHTS=list(itertools.accumulate(1/r for r in range(1,VOCABULARY+1)))
+QUERIES={
+    "rare":"term4000",
+    "medium":"term200",
+    "common":"term1",
+    "and":"term3 term70",
+    "phrase":'"term2 term5"',
+}
+
+
+def document(rng:random.Random,words:int)->str:
+    return " ".join(rng.choices(TERMS,cum_weights=CUM_WEIGHTS,k=words))
+
+
+async def seed(pool,rows:int,chunk:int)->int:
+    user_id=await pool.fetchval("SELECT id FROM users WHERE name=$1;",USER)
+    if user_id is not None:
+        existing=await pool.fetchval("SELECT count(*) FROM blogs WHERE user_id=$1;",user_id)
+        if existing>=rows:
+            return user_id
+    user_id=await bench_user(pool,USER)
+    rng=random.Random(12)
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            for offset in range(0,rows,chunk):
+                batch=[(document(rng,6),document(rng,80)) for _ in range(min(chunk,rows-offset))]
+                await BlogService.create_many(batch,user_id,conn)
+    await pool.execute("VACUUM ANALYZE blogs;")
+    return user_id
+
+
+async def run(rows:int,chunk:int,repeat:int,limit:int)->dict:
+    results={"rows":rows,"limit":limit}
+    async with database() as db:
+        pool=db.pool
+        start=time.perf_counter()
+        await seed(pool,rows,chunk)
+        results["seed_seconds"]=round(time.perf_counter()-start,2)
+        for name,q in QUERIES.items():
+            first,deep=[],[]
+            hits,cursor=await BlogService.search(q,pool,limit=limit)
+            for _ in range(repeat):
+                start=time.perf_counter()
+                hits,cursor=await BlogService.search(q,pool,limit=limit)
+                first.append(time.perf_counter()-start)
+            if cursor:
+                for _ in range(repeat):
+                    start=time.perf_counter()
+                    await BlogService.search(q,pool,limit=limit,after=cursor)
+                    deep.append(time.perf_counter()-start)
+            matches=await pool.fetchval("SELECT count(*) FROM blogs WHERE search @@ websearch_to_tsquery('english',$1);",q)
+            results[name]={"q":q,"matches":matches,"first_page":percentiles(first),"second_page":percentiles(deep) if deep else None}
+    return results
+
+
+if __name__=="__main__":
+    parser=argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows",type=int,default=1_000_000)
+    parser.add_argument("--chunk",type=int,default=10_000)
+    parser.add_argument("--repeat",type=int,default=50)
+    parser.add_argument("--limit",type=int,default=20)
+    parser.add_argument("--output",help="also write the JSON report to this file")
+    args=parser.parse_args()
+    emit("search",asyncio.run(run(args.rows,args.chunk,args.repeat,args.limit)),args.output)
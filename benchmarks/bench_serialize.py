@@ -0,0 +1,78 @@
+"""List response serialization: pydantic models (Blogs(blogs=[dict(r) ...]),
+validated again by FastAPI) against RowsResponse writing the asyncpg Records
+directly, for JSON, msgpack and gzip.
+
+Rows come from generate_series, so no tables are needed, only DATABASE_URL.
+
+    python -m benchmarks.bench_serialize --rows 200 --requests 500
+"""
+import argparse
+import asyncio
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from benchmarks.common import database, emit, percentiles
+from blog_crud.responses import RowsResponse, msgpack
+from blog_crud.schema import Blogs
+
+ROWS='''
+    SELECT g AS id,1 AS user_id,'title '||g AS title,repeat('lorem ipsum ',40) AS content
+    FROM generate_series(1,$1) AS g;
+    '''
+
+
+async def fetch_rows(count:int):
+    async with database() as db:
+        return await db.pool.fetch(ROWS,count)
+
+
+def make_app(records)->FastAPI:
+    app=FastAPI()
+
+    @app.get("/pydantic",response_model=Blogs)
+    async def pydantic_path():
+        return Blogs(blogs=[dict(r) for r in records],next_cursor=None)
+
+    @app.get("/rows")
+    async def rows_path(request:Request):
+        return RowsResponse({"blogs":records,"next_cursor":None},request)
+
+    return app
+
+
+def measure(client:TestClient,path:str,requests:int,headers:dict)->dict:
+    samples=[]
+    size=None
+    for _ in range(requests):
+        start=time.perf_counter()
+        resp=client.get(path,headers=headers)
+        samples.append(time.perf_counter()-start)
+        size=int(resp.headers.get("content-length",len(resp.content)))
+    return {**percentiles(samples),"bytes":size}
+
+
+def run(rows:int,requests:int)->dict:
+    records=asyncio.run(fetch_rows(rows))
+    client=TestClient(make_app(records))
+    identity={"Accept-Encoding":"identity"}
+    results={
+        "rows":rows,
+        "pydantic_json":measure(client,"/pydantic",requests,identity),
+        "rows_json":measure(client,"/rows",requests,identity),
+        "rows_json_gzip":measure(client,"/rows",requests,{"Accept-Encoding":"gzip"}),
+    }
+    if msgpack is not None:
+        results["rows_msgpack"]=measure(client,"/rows",requests,{**identity,"Accept":"application/msgpack"})
+    results["speedup_p50"]=round(results["pydantic_json"]["p50_ms"]/results["rows_json"]["p50_ms"],2)
+    return results
+
+
+if __name__=="__main__":
+    parser=argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows",type=int,default=200)
+    parser.add_argument("--requests",type=int,default=500)
+    parser.add_argument("--output",help="also write the JSON report to this file")
+    args=parser.parse_args()
+    emit("serialize",run(args.rows,args.requests),args.output)
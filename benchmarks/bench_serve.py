@@ -0,0 +1,97 @@
+"""Cold start and throughput per core of python -m blog_crud.serve.
+
+For each --workers count the server is started as a subprocess with
+SKIP_MIGRATIONS and rate limits off. The report has the time until /ready
+first answers 200 and, from --concurrency HTTP clients over --seconds,
+requests/s on GET /blogs, requests/s per worker and the latency
+percentiles. Last comes the time from SIGTERM to exit, which includes the
+drain. Needs DATABASE_URL and a free --port.
+
+    python -m benchmarks.bench_serve --workers 1 2 4 --seconds 10
+"""
+import argparse
+import asyncio
+import signal
+import subprocess
+import sys
+import time
+import os
+
+import httpx
+
+from benchmarks.common import database, bench_user, emit, percentiles
+from blog_crud.auth import create_access_token
+
+USER="bench_serve"
+
+
+async def wait_ready(base:str,timeout:float)->float:
+    start=time.perf_counter()
+    async with httpx.AsyncClient(base_url=base) as client:
+        while time.perf_counter()-start<timeout:
+            try:
+                if (await client.get("/ready")).status_code==200:
+                    return time.perf_counter()-start
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.02)
+    raise TimeoutError(f"{base} was not ready after {timeout}s")
+
+
+async def load(base:str,headers:dict,concurrency:int,seconds:float)->dict:
+    samples,statuses=[],{}
+    deadline=time.perf_counter()+seconds
+    limits=httpx.Limits(max_connections=concurrency,max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base,headers=headers,limits=limits) as client:
+        async def worker():
+            while time.perf_counter()<deadline:
+                start=time.perf_counter()
+                resp=await client.get("/blogs",params={"limit":20})
+                samples.append(time.perf_counter()-start)
+                statuses[resp.status_code]=statuses.get(resp.status_code,0)+1
+
+        start=time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed=time.perf_counter()-start
+    return {"requests_per_second":round(len(samples)/elapsed,1),
+            "statuses":{str(k):v for k,v in sorted(statuses.items())},**percentiles(samples)}
+
+
+async def run_one(workers:int,port:int,headers:dict,concurrency:int,seconds:float)->dict:
+    env={**os.environ,"SKIP_MIGRATIONS":"true","RATE_LIMITS_ENABLED":"false"}
+    base=f"http://127.0.0.1:{port}"
+    proc=subprocess.Popen([sys.executable,"-m","blog_crud.serve","--workers",str(workers),
+                           "--host","127.0.0.1","--port",str(port)],env=env)
+    try:
+        cold_start=await wait_ready(base,timeout=60)
+        result=await load(base,headers,concurrency,seconds)
+        result["requests_per_second_per_worker"]=round(result["requests_per_second"]/workers,1)
+        stop=time.perf_counter()
+        proc.send_signal(signal.SIGTERM)
+        await asyncio.get_running_loop().run_in_executor(None,proc.wait,60)
+        return {"workers":workers,"cold_start_seconds":round(cold_start,3),
+                "shutdown_seconds":round(time.perf_counter()-stop,3),**result}
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+
+
+async def run(workers:list[int],port:int,concurrency:int,seconds:float)->dict:
+    async with database() as db:
+        user_id=await bench_user(db.pool,USER)
+    headers={"Authorization":f"Bearer {create_access_token(user_id=user_id,name=USER)}"}
+    results={"concurrency":concurrency,"seconds":seconds,"cpus":os.cpu_count(),"runs":[]}
+    for count in workers:
+        results["runs"].append(await run_one(count,port,headers,concurrency,seconds))
+    return results
+
+
+if __name__=="__main__":
+    parser=argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers",type=int,nargs="+",default=[1,2,4])
+    parser.add_argument("--port",type=int,default=8765)
+    parser.add_argument("--concurrency",type=int,default=64)
+    parser.add_argument("--seconds",type=float,default=10)
+    parser.add_argument("--output",help="also write the JSON report to this file")
+    args=parser.parse_args()
+    emit("serve",asyncio.run(run(args.workers,args.port,args.concurrency,args.seconds)),args.output)
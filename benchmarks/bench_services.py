@@ -0,0 +1,150 @@
+"""Per-method latency of UserService, BlogService and CommentService.
+
+Each case calls one service method --iterations times on seeded data and
+reports ops/s with p50/p95/p99. Cached reads run twice: "cold" evicts the
+read cache entry first (outside the timed call) and "warm" does not.
+
+Against DATABASE_URL the dataset is loaded with benchmarks.seed, and the
+write methods and the full-text search run too. With --fake the same
+dataset is served by benchmarks.fakepool, which leaves the cost of the
+service layer itself; cases the fake cannot answer are skipped.
+
+    python -m benchmarks.bench_services --blogs 10000 --comments 100000
+    python -m benchmarks.bench_services --fake
+"""
+import argparse
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Optional
+
+from benchmarks.common import database, emit, percentiles
+from benchmarks.fakepool import FakePool
+from benchmarks.seed import LOGIN_PASSWORD, Dataset, generate, load, login_password
+from blog_crud.cache import read_cache
+from blog_crud.db import InstrumentedPool
+from blog_crud.service import BlogService, CommentService, UserService, blog_key, comments_key
+
+Call=Callable[[int],Awaitable]
+
+
+async def measure(call:Call,iterations:int,setup:Optional[Call]=None)->dict:
+    samples=[]
+    start=time.perf_counter()
+    for i in range(iterations):
+        if setup:
+            await setup(i)
+        t=time.perf_counter()
+        await call(i)
+        samples.append(time.perf_counter()-t)
+    busy=sum(samples)
+    return {**percentiles(samples),"ops_per_second":round(iterations/busy,1) if busy else None,
+            "wall_seconds":round(time.perf_counter()-start,3)}
+
+
+def busiest_blog(data:Dataset)->int:
+    # the blog with most comments, the one a comment listing benchmark cares about
+    counts={}
+    for c in data.comments:
+        counts[c[1]]=counts.get(c[1],0)+1
+    return max(counts,key=counts.get) if counts else data.blogs[0][0]
+
+
+def read_cases(data:Dataset,pool,rng:random.Random)->dict[str,tuple[Call,Optional[Call]]]:
+    blogs=[b[0] for b in data.blogs]
+    users=[u[0] for u in data.users]
+    busiest=busiest_blog(data)
+    pick=lambda i:blogs[rng.randrange(len(blogs))]
+
+    async def evict_blog(i):
+        await read_cache.delete(blog_key(busiest))
+
+    async def evict_comments(i):
+        await read_cache.delete(comments_key(busiest))
+
+    return {
+        "UserService.read_principal":(lambda i:UserService.read_principal(users[i%len(users)],pool),None),
+        "UserService.exists":(lambda i:UserService.exists(data.users[i%len(users)][1],pool),None),
+        "BlogService.read.cold":(lambda i:BlogService.read(busiest,pool),evict_blog),
+        "BlogService.read.warm":(lambda i:BlogService.read(busiest,pool),None),
+        "BlogService.version":(lambda i:BlogService.version(pick(i),pool),None),
+        "BlogService.page_versions":(lambda i:BlogService.page_versions(pool),None),
+        "BlogService.read_page":(lambda i:BlogService.read_page(pool),None),
+        "BlogService.read_page.summary":(lambda i:BlogService.read_page(pool,summary=True),None),
+        "BlogService.read_page_with_counts":(lambda i:BlogService.read_page_with_counts(pool),None),
+        "CommentService.read_listing.cold":(lambda i:CommentService.read_listing(busiest,pool),evict_comments),
+        "CommentService.read_listing.warm":(lambda i:CommentService.read_listing(busiest,pool),None),
+        "CommentService.version":(lambda i:CommentService.version(pick(i),pool),None),
+        "CommentService.read_all_from_user":(lambda i:CommentService.read_all_from_user(users[i%len(users)],pool),None),
+    }
+
+
+def database_cases(data:Dataset,pool,rng:random.Random)->dict[str,tuple[Call,Optional[Call]]]:
+    # statements the fake pool does not implement
+    author=data.users[0][0]
+    busiest=busiest_blog(data)
+    words=data.blogs[0][2].split()
+    created:list[int]=[]
+    comments:list[int]=[]
+
+    async def create_blog(i):
+        created.append(await BlogService.create(f"bench {i}","content",author,pool))
+
+    async def create_comment(i):
+        comments.append(await CommentService.create(busiest,f"bench {i}",author,pool))
+
+    return {
+        "UserService.validate":(lambda i:UserService.validate(data.users[0][1],LOGIN_PASSWORD,pool),None),
+        "BlogService.read_full":(lambda i:BlogService.read_full(busiest,pool),None),
+        "BlogService.search":(lambda i:BlogService.search(words[i%len(words)],pool),None),
+        "CommentService.search":(lambda i:CommentService.search(words[i%len(words)],pool),None),
+        # writes run in this order, each on the rows the previous one made
+        "BlogService.create":(create_blog,None),
+        "BlogService.update":(lambda i:BlogService.update(created[i%len(created)],f"edited {i}",None,pool,user_id=author),None),
+        "BlogService.delete":(lambda i:BlogService.delete(created.pop(),pool,user_id=author),None),
+        "CommentService.create":(create_comment,None),
+        "CommentService.update":(lambda i:CommentService.update(comments[i%len(comments)],f"edited {i}",pool,user_id=author),None),
+        "CommentService.delete":(lambda i:CommentService.delete(comments.pop(),pool,user_id=author),None),
+    }
+
+
+@asynccontextmanager
+async def seeded_pool(data:Dataset,fake:bool):
+    if fake:
+        yield data,InstrumentedPool(FakePool(data))
+        return
+    async with database() as db:
+        yield await load(db.pool,data),db.pool
+
+
+async def run(users:int,blogs:int,comments:int,iterations:int,seed:int,fake:bool,only:Optional[str])->dict:
+    data=generate(users,blogs,comments,seed,password=await login_password())
+    results={"backend":"fake" if fake else "postgres","dataset":data.describe(),"iterations":iterations,"cases":{}}
+    async with seeded_pool(data,fake) as (data,pool):
+        rng=random.Random(seed)
+        cases=read_cases(data,pool,rng)
+        if not fake:
+            cases.update(database_cases(data,pool,rng))
+        for name,(call,setup) in cases.items():
+            if only and only not in name:
+                continue
+            # argon2 is deliberately slow; a few calls say enough
+            count=min(iterations,20) if name=="UserService.validate" else iterations
+            await read_cache.clear()
+            results["cases"][name]=await measure(call,count,setup)
+    return results
+
+
+if __name__=="__main__":
+    parser=argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users",type=int,default=1000)
+    parser.add_argument("--blogs",type=int,default=10_000)
+    parser.add_argument("--comments",type=int,default=100_000)
+    parser.add_argument("--iterations",type=int,default=1000)
+    parser.add_argument("--seed",type=int,default=7)
+    parser.add_argument("--fake",action="store_true",help="use the in-memory pool instead of DATABASE_URL")
+    parser.add_argument("--only",help="run only cases whose name contains this")
+    parser.add_argument("--output",help="also write the JSON report to this file")
+    args=parser.parse_args()
+    emit("services",asyncio.run(run(args.users,args.blogs,args.comments,args.iterations,args.seed,args.fake,args.only)),args.output)
@@ -0,0 +1,94 @@
+from contextlib import asynccontextmanager
+from typing import Optional
+import subprocess
+import platform
+import json
+import time
+import sys
+import os
+
+from blog_crud.db import Database
+from blog_crud.migrate import migrate
+
+
+def git_revision()->Optional[str]:
+    try:
+        return subprocess.check_output(["git","rev-parse","--short","HEAD"],text=True,stderr=subprocess.DEVNULL).strip()
+    except (OSError,subprocess.CalledProcessError):
+        return None
+
+
+def emit(name:str,results:dict,output:Optional[str]=None):
+    # one JSON document per run so results can be diffed across commits
+    report={
+        "benchmark":name,
+        "revision":git_revision(),
+        "python":platform.python_version(),
+        "timestamp":time.time(),
+        "results":results,
+    }
+    text=json.dumps(report,indent=2)
+    if output:
+        with open(output,"w") as f:
+            f.write(text+"\n")
+    print(text,file=sys.stdout)
+
+
+def rate(count:int,seconds:float)->dict:
+    return {"rows":count,"seconds":round(seconds,4),"rows_per_second":round(count/seconds,1) if seconds else None}
+
+
+@asynccontextmanager
+async def database():
+    db=Database(dsn=os.environ.get("DATABASE_URL"),replica_dsns=())
+    await db.connect()
+    try:
+        await migrate(db.pool)
+        yield db
+    finally:
+        await db.disconnect()
+
+
+async def bench_user(pool,name:str)->int:
+    # created directly so benchmarks do not pay for argon2
+    await pool.execute("DELETE FROM users WHERE name=$1;",name)
+    return await pool.fetchval("INSERT INTO users (name,password) VALUES($1,'') RETURNING id;",name)
+
+
+def percentiles(samples:list[float])->dict:
+    # latencies in milliseconds, nearest-rank
+    ordered=sorted(samples)
+    def pick(p:float)->float:
+        return round(ordered[min(len(ordered)-1,int(p*len(ordered)))]*1000,3)
+    return {"n":len(ordered),"p50_ms":pick(0.50),"p95_ms":pick(0.95),"p99_ms":pick(0.99),"max_ms":round(ordered[-1]*1000,3)}
+
+
+async def asgi_request(app,method:str,path:str,headers:Optional[dict]=None,body:bytes=b"")->tuple[int,bytes]:
+    # drives an ASGI app in-process, without sockets or an HTTP client, so
+    # the numbers are the app's own cost
+    path,_,query=path.partition("?")
+    scope={
+        "type":"http","asgi":{"version":"3.0"},"http_version":"1.1","method":method,"scheme":"http",
+        "path":path,"raw_path":path.encode(),"root_path":"","query_string":query.encode(),
+        "headers":[(k.lower().encode(),v.encode()) for k,v in (headers or {}).items()],
+        "client":("127.0.0.1",0),"server":("testserver",80),
+    }
+    sent=False
+    status,chunks=0,[]
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            return {"type":"http.disconnect"}
+        sent=True
+        return {"type":"http.request","body":body,"more_body":False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"]=="http.response.start":
+            status=message["status"]
+        elif message["type"]=="http.response.body":
+            chunks.append(message.get("body",b""))
+
+    await app(scope,receive,send)
+    return status,b"".join(chunks)
@@ -0,0 +1,119 @@
+"""An in-memory stand-in for the asyncpg pool, serving a seeded Dataset.
+
+It answers the hot read statements by their exact text, the way asyncpg's
+statement cache keys them, and raises for anything else, so a benchmark
+never silently measures a query it does not implement. Wrapped in
+InstrumentedPool it exercises everything above the wire: routing, auth,
+caches, instrumentation and serialization. Rows are dicts, which the
+services and RowsResponse treat like Records.
+"""
+from bisect import bisect_right
+from collections import defaultdict
+from typing import Callable
+
+from benchmarks.seed import Dataset
+from blog_crud.db import statement_name
+from blog_crud.service import BlogService, CommentService, UserService
+
+
+class FakeConnection:
+    def __init__(self,handlers:dict[str,Callable]):
+        self.handlers=handlers
+
+    def _run(self,query:str,args:tuple):
+        handler=self.handlers.get(query)
+        if handler is None:
+            raise NotImplementedError(f"FakePool does not implement {statement_name(query)!r}")
+        return handler(*args)
+
+    async def fetch(self,query:str,*args,timeout=None,record_class=None)->list[dict]:
+        return self._run(query,args)
+
+    async def fetchrow(self,query:str,*args,timeout=None,record_class=None):
+        rows=self._run(query,args)
+        return rows[0] if rows else None
+
+    async def fetchval(self,query:str,*args,column:int=0,timeout=None):
+        rows=self._run(query,args)
+        return list(rows[0].values())[column] if rows else None
+
+    async def execute(self,query:str,*args,timeout=None)->str:
+        return f"SELECT {len(self._run(query,args))}"
+
+
+class FakePool:
+    def __init__(self,data:Dataset):
+        self.users={u[0]:{"id":u[0],"name":u[1],"password":u[2]} for u in data.users}
+        self.by_name={u["name"]:u for u in self.users.values()}
+        self.blogs={b[0]:{"id":b[0],"user_id":b[1],"title":b[2],"content":b[3],"likes":0,
+                          "revision":1} for b in data.blogs}
+        self.blog_ids=sorted(self.blogs)
+        self.comments_by_blog=defaultdict(list)
+        self.comments_by_user=defaultdict(list)
+        for c in data.comments:
+            row={"id":c[0],"blog_id":c[1],"user_id":c[2],"content":c[3]}
+            self.comments_by_blog[c[1]].append(row)
+            self.comments_by_user[c[2]].append(row)
+        self.connection=FakeConnection({
+            UserService.READ_PRINCIPAL:self.read_principal,
+            UserService.READ_BY_NAME:self.read_by_name,
+            BlogService.READ:self.read_blog,
+            BlogService.READ_VERSION:lambda blog_id:self.blog_columns(blog_id,"revision"),
+            BlogService.READ_OWNER:lambda blog_id:self.blog_columns(blog_id,"user_id"),
+            BlogService.READ_PAGE:lambda after,limit:self.page(after,limit,"id","user_id","title","content","revision"),
+            BlogService.READ_PAGE_SUMMARY:lambda after,limit:self.page(after,limit,"id","user_id","title","revision"),
+            BlogService.READ_PAGE_VERSIONS:lambda after,limit:self.page(after,limit,"id","revision"),
+            BlogService.READ_PAGE_COUNTS:self.page_counts,
+            CommentService.READ_VERSION:self.comments_version,
+            CommentService.READ_ALL_FROM_BLOG:lambda blog_id:self.comments_by_blog.get(blog_id,[]),
+            CommentService.READ_ALL_FROM_USER:lambda user_id:self.comments_by_user.get(user_id,[]),
+        })
+
+    async def acquire(self,timeout=None)->FakeConnection:
+        return self.connection
+
+    async def release(self,conn:FakeConnection):
+        pass
+
+    def get_size(self)->int:
+        return 1
+
+    def get_idle_size(self)->int:
+        return 1
+
+    async def close(self):
+        pass
+
+    def read_principal(self,user_id:int)->list[dict]:
+        user=self.users.get(user_id)
+        return [{"id":user["id"],"name":user["name"]}] if user else []
+
+    def read_by_name(self,name:str)->list[dict]:
+        user=self.by_name.get(name)
+        return [user] if user else []
+
+    def read_blog(self,blog_id:int)->list[dict]:
+        blog=self.blogs.get(blog_id)
+        return [{k:blog[k] for k in ("id","user_id","title","content","likes","revision")}] if blog else []
+
+    def blog_columns(self,blog_id:int,*columns:str)->list[dict]:
+        blog=self.blogs.get(blog_id)
+        return [{k:blog[k] for k in columns}] if blog else []
+
+    def comments_version(self,blog_id:int)->list[dict]:
+        if blog_id not in self.blogs:
+            return []
+        comments=self.comments_by_blog.get(blog_id,[])
+        return [{"version":f"{len(comments)}.{max((c['id'] for c in comments),default=0)}.0"}]
+
+    def page(self,after:int,limit:int,*columns:str)->list[dict]:
+        start=bisect_right(self.blog_ids,after)
+        return [{k:self.blogs[i][k] for k in columns} for i in self.blog_ids[start:start+limit]]
+
+    def page_counts(self,after:int,limit:int)->list[dict]:
+        rows=self.page(after,limit,"id","user_id","title","content","likes")
+        for row in rows:
+            author=self.users.get(row["user_id"])
+            row["author"]=author["name"] if author else None
+            row["comment_count"]=len(self.comments_by_blog.get(row["id"],()))
+        return rows
@@ -0,0 +1,98 @@
+"""Seeded, reproducible data for the API and service benchmarks.
+
+generate() builds the same users, blogs and comments for the same arguments.
+Authors are uniform; comments follow a Zipf-like skew over blogs, so a few
+posts carry most of the discussion. load() writes a dataset to Postgres over
+COPY. The fake pool serves it from memory.
+
+    python -m benchmarks.seed --users 1000 --blogs 10000 --comments 100000
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import time
+
+from benchmarks.common import database, emit, rate
+from blog_crud.service import PasswordService, reserve_ids
+
+PREFIX="bench_seed"
+# the one seeded user with a real argon2 hash, for /login
+LOGIN_PASSWORD="bench-password"
+WORDS=[f"word{i}" for i in range(2000)]
+
+
+class Dataset:
+    # rows are tuples with 1-based local ids; load() maps them to real ids
+    def __init__(self,users:list[tuple],blogs:list[tuple],comments:list[tuple],seed:int):
+        self.users=users  # (id,name,password)
+        self.blogs=blogs  # (id,user_id,title,content)
+        self.comments=comments  # (id,blog_id,user_id,content)
+        self.seed=seed
+
+    def describe(self)->dict:
+        return {"users":len(self.users),"blogs":len(self.blogs),"comments":len(self.comments),"seed":self.seed}
+
+
+def text(rng:random.Random,words:int)->str:
+    return " ".join(rng.choices(WORDS,k=words))
+
+
+def generate(users:int,blogs:int,comments:int,seed:int=7,password:str="")->Dataset:
+    rng=random.Random(seed)
+    user_rows=[(i,f"{PREFIX}_{i}","") for i in range(1,users+1)]
+    if password:
+        user_rows[0]=(1,user_rows[0][1],password)
+    blog_rows=[(i,rng.randint(1,users),text(rng,6),text(rng,rng.randint(40,200))) for i in range(1,blogs+1)]
+    cum_weights=list(itertools.accumulate(1/r for r in range(1,blogs+1)))
+    # the hot blogs are spread over the id range rather than all first
+    order=list(range(1,blogs+1))
+    rng.shuffle(order)
+    targets=rng.choices(order,cum_weights=cum_weights,k=comments)
+    comment_rows=[(i,targets[i-1],rng.randint(1,users),text(rng,rng.randint(5,40))) for i in range(1,comments+1)]
+    return Dataset(user_rows,blog_rows,comment_rows,seed)
+
+
+async def load(pool,data:Dataset)->Dataset:
+    # replaces any earlier seed (the cascade takes blogs and comments with it)
+    # and returns the dataset renumbered with the ids Postgres assigned
+    await pool.execute("DELETE FROM users WHERE name LIKE $1;",PREFIX+"\\_%")
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            user_ids=dict(zip((u[0] for u in data.users),await reserve_ids("users",len(data.users),conn)))
+            blog_ids=dict(zip((b[0] for b in data.blogs),await reserve_ids("blogs",len(data.blogs),conn)))
+            comment_ids=await reserve_ids("comments",len(data.comments),conn)
+            users=[(user_ids[i],name,password) for i,name,password in data.users]
+            blogs=[(blog_ids[i],user_ids[u],title,content) for i,u,title,content in data.blogs]
+            comments=[(c_id,blog_ids[b],user_ids[u],content) for c_id,(_,b,u,content) in zip(comment_ids,data.comments)]
+            await conn.copy_records_to_table("users",records=users,columns=("id","name","password"))
+            await conn.copy_records_to_table("blogs",records=blogs,columns=("id","user_id","title","content"))
+            await conn.copy_records_to_table("comments",records=comments,columns=("id","blog_id","user_id","content"))
+    await pool.execute("ANALYZE users;")
+    await pool.execute("ANALYZE blogs;")
+    await pool.execute("ANALYZE comments;")
+    return Dataset(users,blogs,comments,data.seed)
+
+
+async def login_password()->str:
+    return await PasswordService.hash(LOGIN_PASSWORD)
+
+
+async def run(users:int,blogs:int,comments:int,seed:int)->dict:
+    data=generate(users,blogs,comments,seed,password=await login_password())
+    async with database() as db:
+        start=time.perf_counter()
+        await load(db.pool,data)
+        elapsed=time.perf_counter()-start
+    return {**data.describe(),"load":rate(users+blogs+comments,elapsed)}
+
+
+if __name__=="__main__":
+    parser=argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users",type=int,default=1000)
+    parser.add_argument("--blogs",type=int,default=10_000)
+    parser.add_argument("--comments",type=int,default=100_000)
+    parser.add_argument("--seed",type=int,default=7)
+    parser.add_argument("--output",help="also write the JSON report to this file")
+    args=parser.parse_args()
+    emit("seed",asyncio.run(run(args.users,args.blogs,args.comments,args.seed)),args.output)
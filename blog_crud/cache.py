@@ -0,0 +1,217 @@
+from collections import OrderedDict
+from blog_crud.config import load_config
+from typing import Any, Callable, Hashable, Optional
+import abc
+import json
+import time
+import os
+
+from blog_crud.metrics import registry
+
+load_config()
+
+AUTH_CACHE_SIZE=int(os.environ.get("AUTH_CACHE_SIZE","10000"))
+AUTH_CACHE_TTL_SECONDS=float(os.environ.get("AUTH_CACHE_TTL_SECONDS","60"))
+AUTH_TRUST_CLAIMS_SECONDS=float(os.environ.get("AUTH_TRUST_CLAIMS_SECONDS","0"))
+READ_CACHE_BACKEND=os.environ.get("READ_CACHE_BACKEND","local")
+READ_CACHE_SIZE=int(os.environ.get("READ_CACHE_SIZE","50000"))
+READ_CACHE_TTL_SECONDS=float(os.environ.get("READ_CACHE_TTL_SECONDS","30"))
+READ_CACHE_REDIS_URL=os.environ.get("READ_CACHE_REDIS_URL","redis://localhost:6379/0")
+
+MISSING=object()
+
+_caches:dict[str,"LRUCache"]={}
+
+hits=registry.counter("cache_hits_total","Cache lookups that found a live entry",["cache"])
+misses=registry.counter("cache_misses_total","Cache lookups that found nothing or an expired entry",["cache"])
+evictions=registry.counter("cache_evictions_total","Entries dropped from a cache",["cache","reason"])
+registry.gauge("cache_entries","Entries currently held by a cache",["cache"],
+               fn=lambda:{name:len(cache) for name,cache in _caches.items()})
+
+def _hit_ratios()->dict:
+    ratios={}
+    for (name,),hit in hits._values.items():
+        total=hit+misses.value(cache=name)
+        ratios[name]=hit/total if total else 0
+    return ratios
+
+registry.gauge("cache_hit_ratio","Hits over all lookups since start",["cache"],fn=_hit_ratios)
+
+
+class LRUCache:
+    def __init__(self,name:str,maxsize:int,ttl:float,clock:Callable[[],float]=time.monotonic):
+        self.name=name
+        self.maxsize=maxsize
+        self.ttl=ttl
+        self.clock=clock
+        self._data:OrderedDict[Hashable,tuple[float,Any]]=OrderedDict()
+        _caches[name]=self
+
+    def __len__(self)->int:
+        return len(self._data)
+
+    def get(self,key:Hashable,default:Any=MISSING)->Any:
+        entry=self._data.get(key)
+        if entry is None:
+            misses.inc(cache=self.name)
+            return default
+        expires,value=entry
+        if expires<=self.clock():
+            del self._data[key]
+            evictions.inc(cache=self.name,reason="expired")
+            misses.inc(cache=self.name)
+            return default
+        self._data.move_to_end(key)
+        hits.inc(cache=self.name)
+        return value
+
+    def set(self,key:Hashable,value:Any,ttl:Optional[float]=None):
+        now=self.clock()
+        self._data[key]=(now+(self.ttl if ttl is None else ttl),value)
+        self._data.move_to_end(key)
+        while len(self._data)>self.maxsize:
+            self._data.popitem(last=False)
+            evictions.inc(cache=self.name,reason="size")
+        # idle entries sit at the LRU end; drop the expired ones there too,
+        # so keys that are never read again do not wait for size pressure
+        for _ in range(2):
+            oldest=next(iter(self._data),None)
+            if oldest is None or self._data[oldest][0]>now:
+                break
+            del self._data[oldest]
+            evictions.inc(cache=self.name,reason="expired")
+
+    def invalidate(self,key:Hashable):
+        if self._data.pop(key,None) is not None:
+            evictions.inc(cache=self.name,reason="invalidated")
+
+    def clear(self):
+        self._data.clear()
+
+
+class PrincipalCache(LRUCache):
+    def revoke(self,user_id:int):
+        # a None entry is a tombstone: it outlives the claims trust window so a
+        # deleted user's still-valid token cannot skip the lookup
+        self.set(user_id,None,ttl=max(self.ttl,AUTH_TRUST_CLAIMS_SECONDS))
+
+
+principal_cache=PrincipalCache("principals",maxsize=AUTH_CACHE_SIZE,ttl=AUTH_CACHE_TTL_SECONDS)
+
+
+class CacheBackend(abc.ABC):
+    # Read-through caches talk to this async interface so a shared store can
+    # replace the per-worker LRU without touching the services.
+    @abc.abstractmethod
+    async def get(self,key:str)->Any:
+        ...
+
+    @abc.abstractmethod
+    async def set(self,key:str,value:Any):
+        ...
+
+    @abc.abstractmethod
+    async def delete(self,*keys:str):
+        ...
+
+    @abc.abstractmethod
+    async def clear(self):
+        ...
+
+
+class LocalBackend(CacheBackend):
+    def __init__(self,name:str,maxsize:int,ttl:float):
+        self.lru=LRUCache(name,maxsize=maxsize,ttl=ttl)
+
+    async def get(self,key:str)->Any:
+        return self.lru.get(key)
+
+    async def set(self,key:str,value:Any):
+        self.lru.set(key,value)
+
+    async def delete(self,*keys:str):
+        for key in keys:
+            self.lru.invalidate(key)
+
+    async def clear(self):
+        self.lru.clear()
+
+
+class RedisBackend(CacheBackend):
+    # values must be JSON-serialisable; eviction is left to Redis itself
+    def __init__(self,name:str,url:str,ttl:float):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("READ_CACHE_BACKEND=redis requires the redis package")
+        self.name=name
+        self.prefix=f"blog_crud:{name}:"
+        self.ttl=ttl
+        self.client=redis.from_url(url)
+
+    async def get(self,key:str)->Any:
+        raw=await self.client.get(self.prefix+key)
+        if raw is None:
+            misses.inc(cache=self.name)
+            return MISSING
+        hits.inc(cache=self.name)
+        return json.loads(raw)
+
+    async def set(self,key:str,value:Any):
+        await self.client.set(self.prefix+key,json.dumps(value),px=int(self.ttl*1000))
+
+    async def delete(self,*keys:str):
+        if keys:
+            removed=await self.client.delete(*(self.prefix+k for k in keys))
+            evictions.inc(removed,cache=self.name,reason="invalidated")
+
+    async def clear(self):
+        async for key in self.client.scan_iter(match=self.prefix+"*"):
+            await self.client.delete(key)
+
+
+def make_read_cache()->CacheBackend:
+    if READ_CACHE_BACKEND=="redis":
+        return RedisBackend("reads",READ_CACHE_REDIS_URL,READ_CACHE_TTL_SECONDS)
+    if READ_CACHE_BACKEND!="local":
+        raise ValueError(f"Unknown READ_CACHE_BACKEND {READ_CACHE_BACKEND!r}")
+    return LocalBackend("reads",READ_CACHE_SIZE,READ_CACHE_TTL_SECONDS)
+
+
+class Invalidations:
+    # Closes the race between a read-through fill and a change event: a read
+    # that started before an event for its key does not cache what it read,
+    # and a cached row older than the newest version an event announced is
+    # not served. Kept per worker; every worker sees every event.
+    def __init__(self,maxsize:int=READ_CACHE_SIZE,ttl:float=READ_CACHE_TTL_SECONDS):
+        # key -> (generation of the last event, newest version announced)
+        self.seen=LRUCache("invalidations",maxsize=maxsize,ttl=ttl)
+        self.generation=0
+        self.cleared=0
+
+    def invalidated(self,key:str,version:Optional[int]=None):
+        self.generation+=1
+        _,newest=self.seen.get(key,(0,None))
+        if version is not None and (newest is None or version>newest):
+            newest=version
+        self.seen.set(key,(self.generation,newest))
+
+    def cleared_all(self):
+        self.generation+=1
+        self.cleared=self.generation
+
+    def started(self)->int:
+        # taken before a read; pass it to may_cache with what was read
+        return self.generation
+
+    def stale(self,key:str,version:Optional[int])->bool:
+        _,newest=self.seen.get(key,(0,None))
+        return version is not None and newest is not None and version<newest
+
+    def may_cache(self,key:str,started:int,version:Optional[int]=None)->bool:
+        generation,_=self.seen.get(key,(0,None))
+        return generation<=started and self.cleared<=started and not self.stale(key,version)
+
+
+read_cache=make_read_cache()
+invalidations=Invalidations()
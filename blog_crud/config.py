@@ -0,0 +1,38 @@
+from dotenv import load_dotenv
+import os
+
+_loaded=False
+
+
+def load_config():
+    # every module that reads the environment calls this at import; only the
+    # first call in a process looks for and parses .env
+    global _loaded
+    if not _loaded:
+        load_dotenv()
+        _loaded=True
+
+
+load_config()
+
+# set by blog_crud.serve for its workers once it has migrated the schema
+SKIP_MIGRATIONS=os.environ.get("SKIP_MIGRATIONS","false").lower() in ("1","true","yes")
+
+
+def cpu_count()->int:
+    # the CPUs this process may run on, which in a container can be fewer
+    # than the host has
+    if hasattr(os,"sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def worker_count()->int:
+    # processes sharing this host's CPUs and the database's connections;
+    # blog_crud.serve sets SERVE_WORKERS for the workers it starts
+    return int(os.environ.get("SERVE_WORKERS") or 1)
+
+
+def per_worker(total:int)->int:
+    # one worker's share of a host-wide default
+    return max(1,total//worker_count())
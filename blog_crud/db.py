@@ -1,24 +1,413 @@
-import asyncpg 
-from typing import Optional
-from dotenv import load_dotenv
+import asyncpg
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Iterable, Optional
+from blog_crud.config import load_config, per_worker
+import itertools
+import asyncio
+import random
+import logging
+import time
+import re
 import os
-load_dotenv()
+load_config()
+
+from blog_crud.metrics import registry
+from blog_crud.cache import LRUCache
+from blog_crud.slowlog import SlowQueryLog, slow_queries
+from blog_crud.profiling import add_span, current_spans
+
+logger=logging.getLogger(__name__)
 
 PG_URL=os.environ.get("DATABASE_URL")
+DB_REPLICA_URLS=[u.strip() for u in os.environ.get("DATABASE_REPLICA_URLS","").split(",") if u.strip()]
+DB_REPLICA_HEALTH_INTERVAL=float(os.environ.get("DB_REPLICA_HEALTH_INTERVAL","5"))
+DB_REPLICA_HEALTH_TIMEOUT=float(os.environ.get("DB_REPLICA_HEALTH_TIMEOUT","1"))
+DB_READ_YOUR_WRITES_SECONDS=float(os.environ.get("DB_READ_YOUR_WRITES_SECONDS","5"))
+DB_LISTEN_PING_INTERVAL=float(os.environ.get("DB_LISTEN_PING_INTERVAL","10"))
+DB_LISTEN_BACKOFF_MIN=float(os.environ.get("DB_LISTEN_BACKOFF_MIN","0.5"))
+DB_LISTEN_BACKOFF_MAX=float(os.environ.get("DB_LISTEN_BACKOFF_MAX","30"))
+# connections all workers' pools together may open to each server; with
+# the one LISTEN connection per worker it has to fit under max_connections.
+# Unset pool sizes are this worker's share of it, capped at 20 and 5.
+DB_POOL_BUDGET=int(os.environ.get("DB_POOL_BUDGET","64"))
+DB_POOL_MAX_SIZE=int(os.environ.get("DB_POOL_MAX_SIZE") or min(20,per_worker(DB_POOL_BUDGET)))
+DB_POOL_MIN_SIZE=int(os.environ.get("DB_POOL_MIN_SIZE") or min(5,max(1,DB_POOL_MAX_SIZE//4)))
+DB_POOL_MAX_QUERIES=int(os.environ.get("DB_POOL_MAX_QUERIES","50000"))
+DB_POOL_MAX_INACTIVE_LIFETIME=float(os.environ.get("DB_POOL_MAX_INACTIVE_LIFETIME","300"))
+DB_POOL_WARMUP=int(os.environ.get("DB_POOL_WARMUP") or DB_POOL_MIN_SIZE)
+DB_COMMAND_TIMEOUT=float(os.environ.get("DB_COMMAND_TIMEOUT","30")) or None
+DB_STATEMENT_CACHE_SIZE=int(os.environ.get("DB_STATEMENT_CACHE_SIZE","1024"))
+
+_PARAM=re.compile(r"\$(\d+)")
+# errors that mean the server or the connection is gone, not the query
+CONNECTION_ERRORS=(OSError,asyncpg.PostgresConnectionError,asyncpg.CannotConnectNowError)
+
+# statement names for query metrics; class constants are registered by
+# named_statements, anything else gets "<verb> <table>" from its text
+STATEMENT_NAMES:dict[str,str]={}
+_DERIVED_NAMES_MAX=1024
+_STATEMENT_TARGETS=(
+    ("insert",re.compile(r"\binsert\s+into\s+(\w+)",re.I)),
+    ("update",re.compile(r"\bupdate\s+(\w+)",re.I)),
+    ("delete",re.compile(r"\bdelete\s+from\s+(\w+)",re.I)),
+    ("select",re.compile(r"\bfrom\s+(\w+)",re.I)),
+)
+
+reads_routed=registry.counter("db_reads_routed_total","Read pool selections by target",["target"])
+acquire_latency=registry.histogram("db_pool_acquire_seconds","Time spent waiting for a pooled connection",
+                                   buckets=(.0005,.001,.0025,.005,.01,.025,.05,.1,.25,.5,1.0,2.5))
+query_latency=registry.histogram("db_query_seconds","Query execution time, excluding the pool wait",["statement"],
+                                 buckets=(.0005,.001,.0025,.005,.01,.025,.05,.1,.25,.5,1.0,2.5,5.0))
+query_rows=registry.counter("db_query_rows_total","Rows returned by fetch, fetchrow and fetchval",["statement"])
+query_errors=registry.counter("db_query_errors_total","Queries that raised",["statement"])
+
+
+def named_statements(cls):
+    # class decorator: SQL held in UPPER_CASE string attributes is reported
+    # under "Class.ATTR" in the query metrics
+    for attr,value in vars(cls).items():
+        if attr.isupper() and isinstance(value,str):
+            STATEMENT_NAMES[value]=f"{cls.__name__}.{attr}"
+    return cls
+
+
+def statement_name(query:str)->str:
+    name=STATEMENT_NAMES.get(query)
+    if name is not None:
+        return name
+    name="other"
+    for verb,pattern in _STATEMENT_TARGETS:
+        match=pattern.search(query)
+        if match:
+            name=f"{verb} {match.group(1).lower()}"
+            break
+    if len(STATEMENT_NAMES)<_DERIVED_NAMES_MAX:
+        STATEMENT_NAMES[query]=name
+    return name
+
+
+class InstrumentedPool:
+    # Wraps asyncpg's Pool so every query goes through an acquire we can time
+    # and count waiters on, and is itself timed by statement name; anything
+    # not overridden falls through to the pool. Queries made on a connection
+    # taken with acquire() are not timed.
+    #
+    # A replica pool is given the primary as fallback: a query that fails
+    # with a connection error reports it through on_failure and is retried
+    # there once.
+    def __init__(self,pool:asyncpg.pool.Pool,slow_log:SlowQueryLog=slow_queries,replica:bool=False,
+                 fallback:Optional["InstrumentedPool"]=None,
+                 on_failure:Optional[Callable[["InstrumentedPool",Exception],None]]=None):
+        self._pool=pool
+        self.slow_log=slow_log
+        self.replica=replica
+        self.fallback=fallback
+        self.on_failure=on_failure
+        self.waiting=0
+
+    def __getattr__(self,name):
+        return getattr(self._pool,name)
+
+    @asynccontextmanager
+    async def acquire(self,timeout:Optional[float]=None):
+        self.waiting+=1
+        start=time.perf_counter()
+        try:
+            conn=await self._pool.acquire(timeout=timeout)
+        finally:
+            self.waiting-=1
+            acquire_latency.observe(time.perf_counter()-start)
+        try:
+            yield conn
+        finally:
+            await self._pool.release(conn)
+
+    async def _timed(self,method:str,query:str,*args,**kwargs):
+        if self.fallback is None:
+            return await self._query(method,query,*args,**kwargs)
+        try:
+            return await self._query(method,query,*args,**kwargs)
+        except CONNECTION_ERRORS as e:
+            if self.on_failure:
+                self.on_failure(self,e)
+            reads_routed.inc(target="fallback")
+            return await self.fallback._timed(method,query,*args,**kwargs)
+
+    async def _query(self,method:str,query:str,*args,**kwargs):
+        name=statement_name(query)
+        async with self.acquire() as conn:
+            start=time.perf_counter()
+            try:
+                return await getattr(conn,method)(query,*args,**kwargs)
+            except Exception:
+                query_errors.inc(statement=name)
+                raise
+            finally:
+                elapsed=time.perf_counter()-start
+                query_latency.observe(elapsed,statement=name)
+                spans=current_spans.get()
+                if spans is not None:
+                    add_span(spans,"db",elapsed)
+                if elapsed>=self.slow_log.threshold:
+                    # executemany's argument list cannot be replayed under EXPLAIN
+                    self.slow_log.record(name,query,args,elapsed,pool=self if method!="executemany" else None)
+
+    async def execute(self,query:str,*args,timeout:Optional[float]=None):
+        return await self._timed("execute",query,*args,timeout=timeout)
+
+    async def executemany(self,query:str,args,*,timeout:Optional[float]=None):
+        return await self._timed("executemany",query,args,timeout=timeout)
+
+    async def fetch(self,query:str,*args,timeout:Optional[float]=None,record_class=None):
+        rows=await self._timed("fetch",query,*args,timeout=timeout,record_class=record_class)
+        query_rows.inc(len(rows),statement=statement_name(query))
+        return rows
+
+    async def fetchrow(self,query:str,*args,timeout:Optional[float]=None,record_class=None):
+        row=await self._timed("fetchrow",query,*args,timeout=timeout,record_class=record_class)
+        if row is not None:
+            query_rows.inc(statement=statement_name(query))
+        return row
+
+    async def fetchval(self,query:str,*args,column:int=0,timeout:Optional[float]=None):
+        value=await self._timed("fetchval",query,*args,column=column,timeout=timeout)
+        if value is not None:
+            query_rows.inc(statement=statement_name(query))
+        return value
+
+
+async def prepare_statements(conn:asyncpg.Connection,statements:Iterable[str]):
+    # asyncpg only caches statements prepared through the query methods, so
+    # each one is run with NULL arguments inside a read-only transaction:
+    # parsing fills the cache, and writes fail harmlessly before touching data
+    async with conn.transaction(readonly=True):
+        for query in statements:
+            nargs=max((int(n) for n in _PARAM.findall(query)),default=0)
+            try:
+                async with conn.transaction():
+                    await conn.fetch(query,*([None]*nargs))
+            except asyncpg.PostgresError:
+                pass
+
+
+class Listener:
+    # Keeps one dedicated connection LISTENing on a channel. Pooled connections
+    # cannot do this: the pool's reset on release runs UNLISTEN *.
+    def __init__(self,dsn:Optional[str],channel:str,callback:Callable,
+                 on_reconnect:Optional[Callable[[],Awaitable[None]]]=None,connect:Callable=asyncpg.connect):
+        self.dsn=dsn
+        self.channel=channel
+        self.callback=callback
+        self.on_reconnect=on_reconnect
+        self._connect=connect
+        self.connected=False
+        self._task:Optional[asyncio.Task]=None
+
+    def start(self):
+        self._task=asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task=None
+
+    async def _run(self):
+        delay=DB_LISTEN_BACKOFF_MIN
+        missed=False
+        while True:
+            conn=None
+            try:
+                conn=await self._connect(self.dsn)
+                lost=asyncio.Event()
+                conn.add_termination_listener(lambda _:lost.set())
+                await conn.add_listener(self.channel,self.callback)
+                self.connected=True
+                delay=DB_LISTEN_BACKOFF_MIN
+                logger.info(f"Listening on {self.channel}")
+                if missed and self.on_reconnect:
+                    # notifications sent while we were away are gone for good
+                    await self.on_reconnect()
+                while not lost.is_set():
+                    try:
+                        await asyncio.wait_for(lost.wait(),timeout=DB_LISTEN_PING_INTERVAL)
+                    except asyncio.TimeoutError:
+                        # a half-open TCP connection only shows up when we use it
+                        await conn.execute("SELECT 1;",timeout=DB_LISTEN_PING_INTERVAL)
+                logger.warning(f"LISTEN connection on {self.channel} closed")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"LISTEN connection on {self.channel} failed: {e}")
+            finally:
+                self.connected=False
+                if conn is not None and not conn.is_closed():
+                    conn.terminate()
+            await asyncio.sleep(delay*random.uniform(0.5,1.0))
+            delay=min(delay*2,DB_LISTEN_BACKOFF_MAX)
+            missed=True
+
 
 class Database:
-    def __init__(self):
-        self.pool:Optional[asyncpg.pool.Pool]=None
-        
+    def __init__(self,dsn:Optional[str]=PG_URL,replica_dsns:Iterable[str]=DB_REPLICA_URLS,
+                 pool_factory:Optional[Callable[[str],Awaitable[asyncpg.pool.Pool]]]=None):
+        self.dsn=dsn
+        self.replica_dsns=list(replica_dsns)
+        self.pool_factory=pool_factory or self._create_pool
+        self.pool:Optional[InstrumentedPool]=None
+        self.replicas:list[InstrumentedPool]=[]
+        self.healthy:list[bool]=[]
+        self.hot_statements:list[str]=[]
+        self.ready=False
+        self._next_replica=itertools.count()
+        self._health_task:Optional[asyncio.Task]=None
+        self.listener:Optional[Listener]=None
+        # users who wrote recently read from the primary until replicas catch up
+        self.recent_writers=LRUCache("read_your_writes",maxsize=100_000,ttl=DB_READ_YOUR_WRITES_SECONDS)
+
+        registry.gauge("db_pool_size","Open connections in the pool",fn=lambda:self.pool.get_size() if self.pool else 0)
+        registry.gauge("db_pool_idle","Idle connections in the pool",fn=lambda:self.pool.get_idle_size() if self.pool else 0)
+        registry.gauge("db_pool_in_use","Connections currently checked out",
+                       fn=lambda:self.pool.get_size()-self.pool.get_idle_size() if self.pool else 0)
+        registry.gauge("db_pool_waiters","Callers waiting for a connection",fn=lambda:self.pool.waiting if self.pool else 0)
+        registry.gauge("db_pool_max_size","Configured pool ceiling",fn=lambda:DB_POOL_MAX_SIZE)
+        registry.gauge("db_listener_connected","1 while the LISTEN connection is up",
+                       fn=lambda:int(bool(self.listener and self.listener.connected)))
+        registry.gauge("db_replica_healthy","1 if the replica passed its last health check",["replica"],
+                       fn=lambda:{str(i):int(h) for i,h in enumerate(self.healthy)})
+
+    async def _init_connection(self,conn:asyncpg.Connection):
+        if self.hot_statements:
+            await prepare_statements(conn,self.hot_statements)
+
+    async def _create_pool(self,dsn:str)->asyncpg.pool.Pool:
+        return await asyncpg.create_pool(
+            dsn=dsn,
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=DB_POOL_MAX_SIZE,
+            max_queries=DB_POOL_MAX_QUERIES,
+            max_inactive_connection_lifetime=DB_POOL_MAX_INACTIVE_LIFETIME,
+            command_timeout=DB_COMMAND_TIMEOUT,
+            statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+            init=self._init_connection,
+        )
+
     async def connect(self):
-        self.pool=await asyncpg.create_pool(
-            dsn=PG_URL
-        ) 
+        self.pool=InstrumentedPool(await self.pool_factory(self.dsn))
+        for dsn in self.replica_dsns:
+            try:
+                self.replicas.append(InstrumentedPool(await self.pool_factory(dsn),replica=True,
+                                                      fallback=self.pool,on_failure=self._replica_failed))
+                self.healthy.append(True)
+            except (OSError,asyncpg.PostgresError) as e:
+                logger.warning(f"Replica unavailable at startup, reads stay on the primary: {e}")
+        if self.replicas:
+            self._health_task=asyncio.create_task(self._health_loop())
+
+    def listen(self,channel:str,callback:Callable,on_reconnect:Optional[Callable[[],Awaitable[None]]]=None):
+        # always the primary: replicas never see NOTIFY
+        self.listener=Listener(self.dsn,channel,callback,on_reconnect)
+        self.listener.start()
+
+    def reader(self,user_id:Optional[int]=None):
+        if user_id is not None and self.recent_writers.get(user_id,None):
+            reads_routed.inc(target="sticky")
+            return self.pool
+        for _ in range(len(self.replicas)):
+            i=next(self._next_replica)%len(self.replicas)
+            if self.healthy[i]:
+                reads_routed.inc(target="replica")
+                return self.replicas[i]
+        reads_routed.inc(target="primary")
+        return self.pool
+
+    def note_write(self,user_id:int):
+        self.recent_writers.set(user_id,True)
+
+    def _set_healthy(self,i:int,healthy:bool):
+        if healthy!=self.healthy[i]:
+            logger.warning(f"Replica {i} is now {'healthy' if healthy else 'unhealthy'}")
+        self.healthy[i]=healthy
+
+    def _replica_failed(self,replica:InstrumentedPool,error:Exception):
+        # a routed read lost its connection: stop sending reads there until
+        # the health check sees it answer again
+        for i,pool in enumerate(self.replicas):
+            if pool is replica:
+                logger.warning(f"Read on replica {i} failed, falling back to the primary: {error}")
+                self._set_healthy(i,False)
+
+    async def _probe(self,replica:InstrumentedPool):
+        # the timeout covers the acquire too: a hung replica or an exhausted
+        # pool must not stall the check, and it bypasses the primary fallback
+        async def probe():
+            async with replica.acquire() as conn:
+                await conn.fetchval("SELECT 1;")
+        await asyncio.wait_for(probe(),DB_REPLICA_HEALTH_TIMEOUT)
+
+    async def check_replicas(self):
+        for i,replica in enumerate(self.replicas):
+            try:
+                await self._probe(replica)
+                healthy=True
+            except (OSError,asyncio.TimeoutError,asyncpg.PostgresError,asyncpg.InterfaceError):
+                healthy=False
+            self._set_healthy(i,healthy)
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(DB_REPLICA_HEALTH_INTERVAL)
+            await self.check_replicas()
+
+    async def warmup(self,hot_statements:Iterable[str]=()):
+        # runs after migrations so the statements can be prepared; holding
+        # DB_POOL_WARMUP connections at once opens them all now rather than
+        # under the first burst of traffic, and new ones prepare via init
+        self.hot_statements=list(hot_statements)
+        await asyncio.gather(*(self._warm(pool._pool) for pool in [self.pool,*self.replicas]))
+        self.ready=True
+
+    async def _warm(self,pool:asyncpg.pool.Pool):
+        count=min(DB_POOL_WARMUP,DB_POOL_MAX_SIZE)
+        results=await asyncio.gather(*(pool.acquire() for _ in range(count)),return_exceptions=True)
+        conns=[r for r in results if not isinstance(r,BaseException)]
+        try:
+            for r in results:
+                if isinstance(r,BaseException):
+                    raise r
+            await asyncio.gather(*(prepare_statements(conn,self.hot_statements) for conn in conns))
+        finally:
+            for conn in conns:
+                await pool.release(conn)
+        logger.info(f"Database pool warmed with {count} connections")
+
     async def disconnect(self):
+        self.ready=False
+        if self.listener:
+            await self.listener.stop()
+            self.listener=None
+        if self._health_task:
+            self._health_task.cancel()
+            self._health_task=None
+        for replica in self.replicas:
+            await replica.close()
+        self.replicas,self.healthy=[],[]
         if self.pool:
             await self.pool.close()
-db=Database()            
+def is_replica(pool)->bool:
+    return getattr(pool,"replica",False)
+
+
+db=Database()
 def get_db()->asyncpg.pool.Pool:
     if not db.pool:
         raise ValueError("DB is not connected")
     return db.pool
+
+def get_read_db(user_id:Optional[int]=None)->asyncpg.pool.Pool:
+    if not db.pool:
+        raise ValueError("DB is not connected")
+    return db.reader(user_id)
@@ -0,0 +1,51 @@
+from fastapi import Request, Response
+from typing import Iterable, Optional
+import hashlib
+
+from blog_crud.responses import VARY, negotiate, variant_etag
+
+
+def make_etag(*parts)->str:
+    # strong validator: the same parts always name the same representation
+    digest=hashlib.blake2b(repr(parts).encode(),digest_size=12).hexdigest()
+    return f'"{digest}"'
+
+
+def page_etag(versions:Iterable[tuple[int,int]],*parts)->str:
+    return make_etag(*parts,tuple(versions))
+
+
+def matches(if_none_match:Optional[str],etag:str)->bool:
+    # If-None-Match uses the weak comparison (RFC 9110 13.1.2), so a W/
+    # prefix added by an intermediary still revalidates
+    if not if_none_match:
+        return False
+    if if_none_match.strip()=="*":
+        return True
+    return _base(etag) in (_base(tag) for tag in _tags(if_none_match))
+
+
+def _tags(if_none_match:str)->list[str]:
+    tags=(tag.strip() for tag in if_none_match.split(","))
+    return [tag[2:] if tag.startswith("W/") else tag for tag in tags]
+
+
+def _base(etag:str)->str:
+    # RowsResponse suffixes the tag per representation ("-msgpack", "-gzip");
+    # every representation of the same version revalidates
+    return etag.strip('"').split("-",1)[0]
+
+
+def not_modified(etag:str,request:Optional[Request]=None)->Response:
+    # Routes answering with RowsResponse pass the request, so the 304 carries
+    # the same variant validator the 200 would have. Whether that body is
+    # compressed depends on its size, which is unchanged while the version
+    # is, so the client's own copy tells us: prefer the tag it sent.
+    if request is None:
+        return Response(status_code=304,headers={"ETag":etag})
+    variant,encoding=negotiate(request)
+    compressed=variant_etag(etag,variant+[encoding]) if encoding else None
+    plain=variant_etag(etag,variant)
+    sent=_tags(request.headers.get("if-none-match",""))
+    chosen=plain if plain in sent and compressed not in sent else compressed or plain
+    return Response(status_code=304,headers={"ETag":chosen,"Vary":VARY})
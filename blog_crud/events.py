@@ -0,0 +1,100 @@
+from asyncpg.pool import Pool
+from collections import defaultdict
+from blog_crud.config import load_config
+from typing import Any, Awaitable, Callable, Iterable, Optional, Union
+import inspect
+import asyncio
+import json
+import uuid
+import os
+import logging
+
+from blog_crud.metrics import registry
+
+logger=logging.getLogger(__name__)
+load_config()
+
+EVENTS_CHANNEL=os.environ.get("EVENTS_CHANNEL","blog_crud_events")
+
+Handler=Callable[[dict],Union[None,Awaitable[None]]]
+
+received=registry.counter("events_received_total","Change notifications received from other workers",["entity"])
+published=registry.counter("events_published_total","Change notifications published by this worker",["entity"])
+resyncs=registry.counter("events_resyncs_total","Times local state was dropped after missing notifications")
+
+
+class Dispatcher:
+    # Fans change events (entity, id, version) out to local handlers. Writes
+    # call emit(), which runs the handlers in-process and publishes a NOTIFY
+    # so every other worker runs the same handlers from its LISTEN connection.
+    # version is the changed row's revision when the write returned one, the
+    # same number ETags carry, and None otherwise.
+    def __init__(self,channel:str=EVENTS_CHANNEL,origin:Optional[str]=None):
+        self.channel=channel
+        self.origin=origin or uuid.uuid4().hex
+        self._handlers:dict[str,list[Handler]]=defaultdict(list)
+        self._resync_handlers:list[Callable[[],Any]]=[]
+        self._tasks:set[asyncio.Task]=set()
+
+    def subscribe(self,entity:str,handler:Handler):
+        self._handlers[entity].append(handler)
+
+    def on_resync(self,handler:Callable[[],Any]):
+        self._resync_handlers.append(handler)
+
+    async def dispatch(self,event:dict):
+        for handler in self._handlers.get(event["entity"],()):
+            try:
+                result=handler(event)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception:
+                logger.exception(f"Event handler failed for {event}")
+
+    async def emit(self,db:Pool,changes:Iterable[Union[tuple[str,int],tuple[str,int,Optional[int]]]]):
+        # changes are (entity, id) or (entity, id, version)
+        changes=[(change[0],change[1],change[2] if len(change)>2 else None) for change in changes]
+        if not changes:
+            return
+        for entity,id,version in changes:
+            await self.dispatch({"entity":entity,"id":id,"version":version})
+        entities=[entity for entity,_,_ in changes]
+        try:
+            await db.execute('''
+                SELECT pg_notify($1,json_build_object(
+                    'origin',$2::text,'entity',t.entity,'id',t.id,'version',t.version
+                )::text)
+                FROM unnest($3::text[],$4::bigint[],$5::bigint[]) AS t(entity,id,version);
+                ''',self.channel,self.origin,entities,[id for _,id,_ in changes],[v for _,_,v in changes])
+        except Exception as e:
+            # the write itself succeeded; other workers fall back to cache TTLs
+            logger.warning(f"Failed to publish change events {changes}: {e}")
+            return
+        for entity in entities:
+            published.inc(entity=entity)
+
+    def on_notification(self,conn,pid:int,channel:str,payload:str):
+        try:
+            event=json.loads(payload)
+        except ValueError:
+            logger.warning(f"Ignoring malformed notification {payload!r}")
+            return
+        if event.get("origin")==self.origin:
+            return
+        received.inc(entity=event.get("entity",""))
+        task=asyncio.get_running_loop().create_task(self.dispatch(event))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def resync(self):
+        resyncs.inc()
+        for handler in self._resync_handlers:
+            try:
+                result=handler()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception:
+                logger.exception("Resync handler failed")
+
+
+events=Dispatcher()
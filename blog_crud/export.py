@@ -0,0 +1,55 @@
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, Mapping, Sequence
+from blog_crud.config import load_config
+import json
+import csv
+import io
+import os
+
+load_config()
+
+EXPORT_PREFETCH=int(os.environ.get("EXPORT_PREFETCH","1000"))
+# rows are buffered into writes of roughly this many bytes
+EXPORT_FLUSH_BYTES=int(os.environ.get("EXPORT_FLUSH_BYTES","65536"))
+
+FORMATS={
+    "ndjson":"application/x-ndjson",
+    "csv":"text/csv",
+}
+
+
+async def ndjson_stream(rows:AsyncIterator[Mapping])->AsyncIterator[bytes]:
+    buffer=[]
+    size=0
+    async for row in rows:
+        line=json.dumps(dict(row),default=str)+"\n"
+        buffer.append(line)
+        size+=len(line)
+        if size>=EXPORT_FLUSH_BYTES:
+            yield "".join(buffer).encode()
+            buffer,size=[],0
+    if buffer:
+        yield "".join(buffer).encode()
+
+
+async def csv_stream(rows:AsyncIterator[Mapping],columns:Sequence[str])->AsyncIterator[bytes]:
+    out=io.StringIO()
+    writer=csv.writer(out)
+    writer.writerow(columns)
+    async for row in rows:
+        writer.writerow([row[c] for c in columns])
+        if out.tell()>=EXPORT_FLUSH_BYTES:
+            yield out.getvalue().encode()
+            out.seek(0)
+            out.truncate()
+    if out.tell():
+        yield out.getvalue().encode()
+
+
+def export_response(rows:AsyncIterator[Mapping],format:str,columns:Sequence[str],name:str)->StreamingResponse:
+    body=csv_stream(rows,columns) if format=="csv" else ndjson_stream(rows)
+    return StreamingResponse(
+        body,
+        media_type=FORMATS[format],
+        headers={"Content-Disposition":f'attachment; filename="{name}.{format}"'},
+    )
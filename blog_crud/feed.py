@@ -0,0 +1,287 @@
+from asyncpg.pool import Pool
+from fastapi import WebSocket, WebSocketDisconnect
+from blog_crud.config import load_config
+from typing import AsyncIterator, Callable, Iterable, NamedTuple, Optional
+import asyncio
+import os
+import time
+import logging
+
+from blog_crud.metrics import registry
+from blog_crud.responses import dumps
+
+logger=logging.getLogger(__name__)
+load_config()
+
+# messages buffered per subscriber before it counts as a slow consumer
+FEED_QUEUE_SIZE=int(os.environ.get("FEED_QUEUE_SIZE","100"))
+FEED_MAX_SUBSCRIBERS=int(os.environ.get("FEED_MAX_SUBSCRIBERS","20000"))
+FEED_HEARTBEAT_SECONDS=float(os.environ.get("FEED_HEARTBEAT_SECONDS","15"))
+# how far back each refresh looks for comments that committed after a higher id
+FEED_LATE_SECONDS=float(os.environ.get("FEED_LATE_SECONDS","10"))
+
+delivered=registry.counter("feed_messages_total","Comments pushed to feed subscribers")
+dropped=registry.counter("feed_slow_consumers_total","Subscribers disconnected for falling FEED_QUEUE_SIZE behind")
+
+
+class FeedFull(Exception):
+    pass
+
+
+class Message(NamedTuple):
+    id:int
+    text:str
+    sse:bytes
+
+
+def message(comment:dict,late:bool=False)->Message:
+    # encoded once per comment, however many subscribers receive it. A late
+    # comment carries no SSE id, so Last-Event-ID stays at the highest one
+    text=dumps(comment).decode()
+    sse=f"event: comment\ndata: {text}\n\n" if late else f"id: {comment['id']}\nevent: comment\ndata: {text}\n\n"
+    return Message(comment["id"],text,sse.encode())
+
+
+class Subscriber:
+    def __init__(self,blog_id:int,last_id:int=0,size:int=FEED_QUEUE_SIZE):
+        self.blog_id=blog_id
+        self.last_id=last_id
+        self.queue:asyncio.Queue[Optional[Message]]=asyncio.Queue(maxsize=size)
+        self.closed=False
+
+    def offer(self,msg:Message,late:bool=False):
+        # late messages sit below last_id by definition; the topic dedupes them
+        if self.closed or (msg.id<=self.last_id and not late):
+            return
+        try:
+            self.queue.put_nowait(msg)
+        except asyncio.QueueFull:
+            dropped.inc()
+            self.close()
+            return
+        self.last_id=max(self.last_id,msg.id)
+        delivered.inc()
+
+    def close(self):
+        # the backlog is dropped: clients resume from their last id
+        if self.closed:
+            return
+        self.closed=True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+
+class Topic:
+    # All subscribers of one blog. A "comments" event only says the blog's
+    # comments changed, so the topic reads everything after the newest id it
+    # has seen, once per event for all of its subscribers. Refreshes never
+    # overlap; events arriving during one trigger exactly one more.
+    #
+    # Ids are handed out at INSERT but become visible at COMMIT, so a comment
+    # can show up after a higher id was already delivered. Each refresh also
+    # re-reads the last FEED_LATE_SECONDS below last_id and delivers whatever
+    # is not in `seen`, the ids the topic knows about from that window.
+    NEWER='''
+        SELECT id,blog_id,user_id,content FROM comments
+        WHERE blog_id=$1 AND id>$2
+        ORDER BY id
+        LIMIT $3;
+        '''
+    LATE='''
+        SELECT id,blog_id,user_id,content FROM comments
+        WHERE blog_id=$1 AND id<=$2 AND created_at>now()-make_interval(secs=>$3)
+        ORDER BY id;
+        '''
+    LATEST='''
+        SELECT coalesce(max(id),0) FROM comments
+        WHERE blog_id=$1;
+        '''
+
+    def __init__(self,blog_id:int,last_id:int,seen:Iterable[int]=()):
+        self.blog_id=blog_id
+        self.last_id=last_id
+        # id -> monotonic time it was seen, pruned once past the window
+        self.seen:dict[int,float]=dict.fromkeys(seen,time.monotonic())
+        self.subscribers:set[Subscriber]=set()
+        self.running=False
+        self._dirty=False
+
+    async def refresh(self,db:Pool):
+        if self.running:
+            self._dirty=True
+            return
+        self.running=True
+        try:
+            while True:
+                self._dirty=False
+                rows=await db.fetch(Topic.NEWER,self.blog_id,self.last_id,FEED_QUEUE_SIZE+1)
+                for row in rows:
+                    self._publish(message(dict(row)))
+                    self.last_id=row["id"]
+                if not self._dirty and len(rows)<=FEED_QUEUE_SIZE:
+                    break
+            for row in await db.fetch(Topic.LATE,self.blog_id,self.last_id,FEED_LATE_SECONDS):
+                if row["id"] not in self.seen:
+                    self._publish(message(dict(row),late=True),late=True)
+            self._prune()
+        finally:
+            self.running=False
+
+    def _publish(self,msg:Message,late:bool=False):
+        self.seen[msg.id]=time.monotonic()
+        for sub in list(self.subscribers):
+            sub.offer(msg,late=late)
+
+    def _prune(self):
+        # twice the window, so an id never drops out while the query can see it
+        horizon=time.monotonic()-2*FEED_LATE_SECONDS
+        for key,at in list(self.seen.items()):
+            if at<horizon:
+                del self.seen[key]
+
+
+class CommentFeed:
+    # Per-worker fan-out of new comments. It hangs off the events dispatcher,
+    # so the one LISTEN connection the worker already holds drives every
+    # subscriber; reads go to the primary, which a notification never
+    # runs ahead of.
+    def __init__(self,max_subscribers:int=FEED_MAX_SUBSCRIBERS):
+        self.max_subscribers=max_subscribers
+        self.topics:dict[int,Topic]={}
+        self.count=0
+        self._db:Optional[Callable[[],Pool]]=None
+        self._tasks:set[asyncio.Task]=set()
+        registry.gauge("feed_subscribers","Open comment feed subscriptions",fn=lambda:self.count)
+        registry.gauge("feed_topics","Blogs with at least one feed subscriber",fn=lambda:len(self.topics))
+
+    def bind(self,get_db:Callable[[],Pool]):
+        self._db=get_db
+
+    @property
+    def full(self)->bool:
+        return self.count>=self.max_subscribers
+
+    async def subscribe(self,blog_id:int,after:Optional[int]=None)->Subscriber:
+        if self.full:
+            raise FeedFull("Too many feed subscribers")
+        db=self._db()
+        topic=self.topics.get(blog_id)
+        if topic is None:
+            last_id=await db.fetchval(Topic.LATEST,blog_id)
+            # what is already visible is history, not a late arrival
+            seen=[row["id"] for row in await db.fetch(Topic.LATE,blog_id,last_id,FEED_LATE_SECONDS)]
+            # another subscriber may have created it while we waited
+            topic=self.topics.get(blog_id)
+            if topic is None:
+                topic=self.topics[blog_id]=Topic(blog_id,last_id,seen)
+                # an event that fired before the topic existed went nowhere
+                self._schedule(topic)
+        sub=Subscriber(blog_id,last_id=topic.last_id)
+        if after is not None and after<topic.last_id:
+            # resuming (Last-Event-ID): replay what was missed, then go live;
+            # offer() skips anything the topic delivers twice
+            sub.last_id=after
+            for row in await db.fetch(Topic.NEWER,blog_id,after,FEED_QUEUE_SIZE+1):
+                sub.offer(message(dict(row)))
+        topic.subscribers.add(sub)
+        self.count+=1
+        return sub
+
+    def unsubscribe(self,sub:Subscriber):
+        topic=self.topics.get(sub.blog_id)
+        if topic is None or sub not in topic.subscribers:
+            return
+        topic.subscribers.discard(sub)
+        self.count-=1
+        if not topic.subscribers and not topic.running:
+            del self.topics[sub.blog_id]
+
+    def _schedule(self,topic:Topic):
+        task=asyncio.get_running_loop().create_task(self._refresh(topic))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _refresh(self,topic:Topic):
+        try:
+            await topic.refresh(self._db())
+        except Exception:
+            logger.exception(f"Comment feed refresh failed for blog {topic.blog_id}")
+        if not topic.subscribers and self.topics.get(topic.blog_id) is topic:
+            del self.topics[topic.blog_id]
+
+    def on_event(self,event:dict):
+        # must not hold up the write that emitted it
+        topic=self.topics.get(event["id"])
+        if topic is not None and self._db is not None:
+            self._schedule(topic)
+
+    def on_resync(self):
+        # notifications were lost; every topic catches up from its last id
+        if self._db is not None:
+            for topic in list(self.topics.values()):
+                self._schedule(topic)
+
+    def close_all(self):
+        for topic in self.topics.values():
+            for sub in topic.subscribers:
+                sub.close()
+
+
+async def sse_stream(feed:CommentFeed,blog_id:int,after:Optional[int]=None,heartbeat:float=FEED_HEARTBEAT_SECONDS)->AsyncIterator[bytes]:
+    # Subscribes only once the response body is being sent, so a client that
+    # is gone before then never leaves a subscriber behind.
+    try:
+        sub=await feed.subscribe(blog_id,after=after)
+    except FeedFull:
+        yield b"retry: 5000\nevent: overflow\ndata: {}\n\n"
+        return
+    try:
+        yield b"retry: 3000\n\n"
+        while True:
+            try:
+                msg=await asyncio.wait_for(sub.queue.get(),heartbeat)
+            except asyncio.TimeoutError:
+                yield b": keepalive\n\n"
+                continue
+            if msg is None:
+                yield b"event: overflow\ndata: {}\n\n"
+                return
+            yield msg.sse
+    finally:
+        feed.unsubscribe(sub)
+
+
+async def ws_pump(feed:CommentFeed,sub:Subscriber,websocket:WebSocket,heartbeat:float=FEED_HEARTBEAT_SECONDS):
+    async def watch_disconnect():
+        try:
+            while True:
+                if (await websocket.receive())["type"]=="websocket.disconnect":
+                    break
+        finally:
+            sub.close()
+
+    watcher=asyncio.create_task(watch_disconnect())
+    try:
+        while True:
+            try:
+                msg=await asyncio.wait_for(sub.queue.get(),heartbeat)
+            except asyncio.TimeoutError:
+                await websocket.send_text('{"type":"keepalive"}')
+                continue
+            if msg is None:
+                break
+            await websocket.send_text(msg.text)
+    except (WebSocketDisconnect,RuntimeError):
+        pass
+    finally:
+        watcher.cancel()
+        feed.unsubscribe(sub)
+    try:
+        # 1013 "try again later" when we dropped a slow consumer
+        await websocket.close(code=1013)
+    except RuntimeError:
+        pass
+
+
+comment_feed=CommentFeed()
@@ -0,0 +1,99 @@
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from passlib.context import CryptContext
+from blog_crud.config import load_config, cpu_count, per_worker
+from typing import Optional
+import multiprocessing
+import asyncio
+import time
+import os
+import logging
+
+from blog_crud.metrics import registry
+
+logger=logging.getLogger(__name__)
+load_config()
+
+HASH_POOL_KIND=os.environ.get("HASH_POOL_KIND","process")
+# unset means the CPUs shared out between the server's workers, so that
+# one process each does not become workers x CPUs hashing processes
+HASH_POOL_WORKERS=int(os.environ.get("HASH_POOL_WORKERS") or per_worker(cpu_count()))
+HASH_POOL_MAX_PENDING=int(os.environ.get("HASH_POOL_MAX_PENDING","64"))
+
+pwd_context=CryptContext(schemes=["argon2"],deprecated="auto")
+
+
+def hash_password(password:str)->str:
+    return pwd_context.hash(password)
+
+
+def verify_password(hashed_pass:str,password:str)->bool:
+    return pwd_context.verify(password,hashed_pass)
+
+
+def _warmup()->bool:
+    # loads the argon2 backend in the worker so the first login does not pay for it
+    pwd_context.handler()
+    return True
+
+
+class HashPoolSaturated(Exception):
+    pass
+
+
+class HashPool:
+    def __init__(self,kind:str=HASH_POOL_KIND,workers:int=HASH_POOL_WORKERS,max_pending:int=HASH_POOL_MAX_PENDING):
+        if kind not in ("process","thread"):
+            raise ValueError(f"Unknown hash pool kind {kind!r}")
+        self.kind=kind
+        self.workers=workers
+        self.max_pending=max_pending
+        self.pending=0
+        self.executor:Optional[Executor]=None
+
+        registry.gauge("hash_pool_in_flight","Password hash jobs queued or running",fn=lambda:self.pending)
+        registry.gauge("hash_pool_max_pending","Queue depth at which hash jobs are rejected",fn=lambda:self.max_pending)
+        registry.gauge("hash_pool_saturation","In-flight hash jobs as a fraction of max_pending",
+                       fn=lambda:self.pending/self.max_pending if self.max_pending else 0)
+        self.rejected=registry.counter("hash_pool_rejected_total","Hash jobs rejected because the pool was saturated",["op"])
+        self.duration=registry.histogram("hash_pool_duration_seconds","Time from submit to result for hash jobs",["op"])
+
+    async def start(self):
+        if self.kind=="process":
+            # spawn, not fork: the parent already runs an event loop and threads
+            self.executor=ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        else:
+            self.executor=ThreadPoolExecutor(max_workers=self.workers,thread_name_prefix="hash")
+        loop=asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.executor,_warmup) for _ in range(self.workers)))
+        logger.info(f"Started {self.kind} hash pool with {self.workers} workers")
+
+    async def stop(self):
+        if self.executor:
+            executor,self.executor=self.executor,None
+            await asyncio.get_running_loop().run_in_executor(None,executor.shutdown)
+
+    async def run(self,op:str,fn,*args):
+        if self.pending>=self.max_pending:
+            self.rejected.inc(op=op)
+            raise HashPoolSaturated("Too many password operations in flight, retry shortly")
+        self.pending+=1
+        start=time.perf_counter()
+        try:
+            # without a started pool this falls back to the loop's default
+            # thread pool, which still keeps argon2 off the event loop
+            return await asyncio.get_running_loop().run_in_executor(self.executor,fn,*args)
+        finally:
+            self.pending-=1
+            self.duration.observe(time.perf_counter()-start,op=op)
+
+    async def hash(self,password:str)->str:
+        return await self.run("hash",hash_password,password)
+
+    async def verify(self,hashed_pass:str,password:str)->bool:
+        return await self.run("verify",verify_password,hashed_pass,password)
+
+
+hash_pool=HashPool()
@@ -0,0 +1,80 @@
+from fastapi import Request
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from blog_crud.config import load_config
+from typing import AsyncIterator
+import json
+import os
+
+load_config()
+
+BULK_CHUNK_SIZE=int(os.environ.get("BULK_CHUNK_SIZE","1000"))
+BULK_MAX_ROWS=int(os.environ.get("BULK_MAX_ROWS","100000"))
+# longest NDJSON row; a body without newlines would otherwise be buffered whole
+BULK_MAX_LINE_BYTES=int(os.environ.get("BULK_MAX_LINE_BYTES","1048576"))
+
+NDJSON_TYPES=("application/x-ndjson","application/jsonl","application/ndjson")
+
+
+class BatchError(ValueError):
+    def __init__(self,index:int,message:str):
+        super().__init__(f"Row {index}: {message}")
+        self.index=index
+
+
+class BatchTooLarge(ValueError):
+    pass
+
+
+def _is_ndjson(request:Request)->bool:
+    return request.headers.get("content-type","").split(";")[0].strip() in NDJSON_TYPES
+
+
+async def _ndjson_lines(request:Request,max_line:int)->AsyncIterator[bytes]:
+    buffer=b""
+    async for piece in request.stream():
+        buffer+=piece
+        *lines,buffer=buffer.split(b"\n")
+        for line in lines:
+            if len(line)>max_line:
+                raise BatchTooLarge(f"Rows are limited to {max_line} bytes")
+            if line.strip():
+                yield line
+        if len(buffer)>max_line:
+            raise BatchTooLarge(f"Rows are limited to {max_line} bytes")
+    if buffer.strip():
+        yield buffer
+
+
+async def _json_items(request:Request)->AsyncIterator[object]:
+    try:
+        items=json.loads(await request.body())
+    except ValueError as e:
+        raise BatchError(0,f"invalid JSON: {e}")
+    if not isinstance(items,list):
+        raise BatchError(0,"expected a JSON array")
+    for item in items:
+        yield item
+
+
+async def read_chunks(request:Request,model:type[BaseModel],chunk_size:int=BULK_CHUNK_SIZE,
+                      max_rows:int=BULK_MAX_ROWS,max_line:int=BULK_MAX_LINE_BYTES)->AsyncIterator[list[BaseModel]]:
+    # NDJSON bodies are validated as they stream in, so at most one chunk of
+    # parsed rows is held at a time; JSON arrays have to be read whole first
+    adapter=TypeAdapter(model)
+    ndjson=_is_ndjson(request)
+    source=_ndjson_lines(request,max_line) if ndjson else _json_items(request)
+    chunk=[]
+    index=0
+    async for raw in source:
+        if index>=max_rows:
+            raise BatchTooLarge(f"Batches are limited to {max_rows} rows")
+        try:
+            chunk.append(adapter.validate_json(raw) if ndjson else adapter.validate_python(raw))
+        except ValidationError as e:
+            raise BatchError(index,"; ".join(err["msg"] for err in e.errors()))
+        index+=1
+        if len(chunk)>=chunk_size:
+            yield chunk
+            chunk=[]
+    if chunk:
+        yield chunk
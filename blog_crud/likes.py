@@ -0,0 +1,124 @@
+from asyncpg.pool import Pool
+from collections import defaultdict
+from blog_crud.config import load_config
+from typing import Optional
+import asyncio
+import time
+import os
+import logging
+
+from blog_crud.metrics import registry
+from blog_crud.db import named_statements
+
+logger=logging.getLogger(__name__)
+load_config()
+
+LIKES_FLUSH_INTERVAL=float(os.environ.get("LIKES_FLUSH_INTERVAL","1"))
+# a flush starts early once this many blogs have unflushed deltas
+LIKES_MAX_PENDING=int(os.environ.get("LIKES_MAX_PENDING","10000"))
+
+flushed=registry.counter("likes_flushed_total","Like deltas written to blogs.likes",["outcome"])
+flush_duration=registry.histogram("likes_flush_seconds","Time spent writing one batch of like deltas")
+
+
+@named_statements
+class LikeBuffer:
+    # Accumulates per-blog like deltas in memory and writes them as one
+    # UPDATE per flush, so a viral post costs one row lock per interval per
+    # worker instead of one per click. blog_likes keeps the per-user state
+    # exact; only blogs.likes trails by up to one interval.
+    FLUSH='''
+        UPDATE blogs SET likes=blogs.likes+d.delta
+        FROM unnest($1::bigint[],$2::bigint[]) AS d(id,delta)
+        WHERE blogs.id=d.id;
+        '''
+
+    def __init__(self,interval:float=LIKES_FLUSH_INTERVAL,max_pending:int=LIKES_MAX_PENDING):
+        self.interval=interval
+        self.max_pending=max_pending
+        self.deltas:defaultdict[int,int]=defaultdict(int)
+        self._db:Optional[Pool]=None
+        self._task:Optional[asyncio.Task]=None
+        self._wake=asyncio.Event()
+        self._stopping=False
+        registry.gauge("likes_pending_blogs","Blogs with like deltas waiting to be flushed",fn=lambda:len(self.deltas))
+
+    def add(self,blog_id:int,delta:int):
+        self.deltas[blog_id]+=delta
+        if len(self.deltas)>=self.max_pending:
+            self._wake.set()
+
+    def pending(self,blog_id:int)->int:
+        return self.deltas.get(blog_id,0)
+
+    async def flush(self,db:Pool)->int:
+        deltas,self.deltas=self.deltas,defaultdict(int)
+        # ids in a fixed order so concurrent flushes from other workers
+        # take the row locks in the same order and cannot deadlock
+        ids=sorted(blog_id for blog_id,delta in deltas.items() if delta)
+        if not ids:
+            return 0
+        start=time.perf_counter()
+        # Cancelling the caller must not cancel the write: by the time the
+        # cancel lands the UPDATE may already have committed, and re-adding
+        # its deltas would apply those likes twice. The write is shielded and
+        # awaited to the end; the cancel is re-raised once its outcome is known.
+        write=asyncio.ensure_future(db.execute(LikeBuffer.FLUSH,ids,[deltas[i] for i in ids]))
+        cancelled=False
+        try:
+            while True:
+                try:
+                    await asyncio.shield(write)
+                    break
+                except asyncio.CancelledError:
+                    if write.done():
+                        raise
+                    cancelled=True
+        except BaseException:
+            # the write itself failed: keep the deltas for the next attempt,
+            # merged with any new ones
+            for blog_id in ids:
+                self.deltas[blog_id]+=deltas[blog_id]
+            flushed.inc(len(ids),outcome="retried")
+            raise
+        finally:
+            flush_duration.observe(time.perf_counter()-start)
+        flushed.inc(len(ids),outcome="written")
+        if cancelled:
+            raise asyncio.CancelledError
+        return len(ids)
+
+    def start(self,db:Pool):
+        self._db=db
+        self._wake=asyncio.Event()
+        self._stopping=False
+        self._task=asyncio.create_task(self._run())
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(),timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush(self._db)
+            except Exception as e:
+                logger.warning(f"Like flush failed, retrying next interval: {e}")
+
+    async def stop(self):
+        if self._task:
+            # wake the loop for one last pass rather than cancelling it, so a
+            # flush already in flight finishes instead of being cut off
+            self._stopping=True
+            self._wake.set()
+            await self._task
+            self._task=None
+        if self._db is not None:
+            try:
+                await self.flush(self._db)
+            except Exception:
+                logger.exception(f"Dropping unflushed like deltas {dict(self.deltas)}")
+
+
+like_buffer=LikeBuffer()
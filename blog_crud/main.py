@@ -1,23 +1,48 @@
-from fastapi import FastAPI,Depends,HTTPException,status,Response
+from fastapi import FastAPI,Depends,Header,HTTPException,Query,Request,WebSocket,status,Response
 from fastapi.security import OAuth2PasswordRequestForm
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from contextlib import asynccontextmanager
+from collections import Counter
+from asyncpg.exceptions import ForeignKeyViolationError
 
 
 
-from blog_crud.db import db,get_db
+from blog_crud import config
+from blog_crud.db import db,get_db,get_read_db
+from blog_crud.hashing import hash_pool, HashPoolSaturated
+from blog_crud.events import events
+from blog_crud.likes import like_buffer
+from blog_crud.trending import trending, TRENDING_SIZE
+from blog_crud.feed import comment_feed, FeedFull, sse_stream, ws_pump
+from blog_crud.metrics import registry
+from blog_crud.middleware import MetricsMiddleware, ServerTimingMiddleware
+from blog_crud.migrate import migrate
 from blog_crud.service import (
-    CreateTables,
+    HOT_STATEMENTS,
     UserService,
     BlogService,
-    CommentService
+    CommentService,
+    LikeService
     )
-from blog_crud.schema import BlogRequest, CommentRequest, Comments, User,Token,Blogs,Blog
-from blog_crud.auth import create_access_token,get_current_user
-from typing import Annotated
+from blog_crud.schema import BlogRequest, CommentRequest, Comments, User,Token,Blogs,Blog,BlogSummaries,BatchCreated,BlogHits,CommentHits,BlogDetail,BlogsWithCounts,BlogPatch,CommentPatch,TrendingBlogs
+from blog_crud.pagination import DEFAULT_LIMIT, MAX_LIMIT, InvalidCursor
+from blog_crud.ingest import read_chunks, BatchError, BatchTooLarge
+from blog_crud.export import export_response
+from blog_crud.etag import make_etag, page_etag, matches, not_modified
+from blog_crud.responses import RowsResponse
+from blog_crud.auth import create_access_token,get_current_user,get_admin_user
+from blog_crud.slowlog import slow_queries
+from blog_crud.serve import drain
+from blog_crud.profiling import PROFILE_MAX_SECONDS, Sampler, TimedRoute, sampler, timing
+from blog_crud.ratelimit import RateLimited, Overloaded, admit, limit_by_ip, limit_by_user
+from typing import Annotated, Literal, Optional, Union
 import logging 
+import asyncio
+import math
+import os
 
 logging.basicConfig(
-    level=logging.WARNING,                     # Log everything at INFO or higher
+    level=os.environ.get("LOG_LEVEL","WARNING").upper(),
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 )
 
@@ -25,24 +50,102 @@ logger=logging.getLogger(__name__)
 @asynccontextmanager
 async def lifespan(app:FastAPI):
     await db.connect()
-    await CreateTables.run(get_db())
+    if not config.SKIP_MIGRATIONS:
+        await migrate(get_db())
+    await db.warmup(HOT_STATEMENTS)
+    db.listen(events.channel,events.on_notification,on_reconnect=events.resync)
+    await hash_pool.start()
+    like_buffer.start(get_db())
+    trending.start(get_db())
+    comment_feed.bind(get_db)
+    drain.install(comment_feed.close_all)
     yield
+    comment_feed.close_all()
+    await trending.stop()
+    await like_buffer.stop()
+    await hash_pool.stop()
     await db.disconnect()
     
 app=FastAPI(lifespan=lifespan)
+# before any route is declared, so every route gets the "validate" span
+app.router.route_class=TimedRoute
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(ServerTimingMiddleware)
 
-@app.post("/signup")
+@app.exception_handler(HashPoolSaturated)
+async def hash_pool_saturated(request,exc:HashPoolSaturated):
+    return JSONResponse(status_code=503,content={"detail":str(exc)},headers={"Retry-After":"1"})
+
+@app.exception_handler(RateLimited)
+async def rate_limited(request,exc:RateLimited):
+    return JSONResponse(status_code=429,content={"detail":str(exc)},headers={"Retry-After":str(math.ceil(exc.retry_after))})
+
+@app.exception_handler(Overloaded)
+async def overloaded(request,exc:Overloaded):
+    return JSONResponse(status_code=503,content={"detail":str(exc)},headers={"Retry-After":str(math.ceil(exc.retry_after))})
+
+# per-route limits; the DB-heavy ones also go through admission control
+READ_LIMITS=[Depends(limit_by_user("read")),Depends(admit)]
+SEARCH_LIMITS=[Depends(limit_by_user("search")),Depends(admit)]
+EXPORT_LIMITS=[Depends(limit_by_user("export")),Depends(admit)]
+WRITE_LIMITS=[Depends(limit_by_user("write"))]
+BATCH_LIMITS=[Depends(limit_by_user("write")),Depends(admit)]
+
+@app.get("/metrics",include_in_schema=False)
+async def metrics():
+    return Response(content=registry.render(),media_type="text/plain; version=0.0.4")
+
+@app.get("/ready",include_in_schema=False)
+async def ready():
+    # for load balancers: 200 once the pool is warm, 503 again while draining
+    if db.ready and not drain.draining:
+        return {"status":"ready"}
+    return JSONResponse(status_code=503,content={"status":"draining" if drain.draining else "starting"})
+
+@app.get("/admin/slow-queries")
+async def recent_slow_queries(
+    admin: Annotated[dict, Depends(get_admin_user)],
+    limit:Annotated[int,Query(ge=1,le=MAX_LIMIT)]=DEFAULT_LIMIT,
+    ):
+    return {"threshold_ms":slow_queries.threshold_ms,"queries":slow_queries.recent(limit)}
+
+@app.get("/admin/profile",response_class=PlainTextResponse)
+async def profile(
+    admin: Annotated[dict, Depends(get_admin_user)],
+    seconds:Annotated[float,Query(gt=0,le=PROFILE_MAX_SECONDS)]=10,
+    ):
+    # samples this worker only; the body is collapsed stacks for flamegraph.pl
+    if sampler.busy():
+        return Response(status_code=409,content="A profile is already running")
+    try:
+        stacks,ticks=await asyncio.get_running_loop().run_in_executor(None,sampler.sample,seconds)
+    except RuntimeError as e:
+        return Response(status_code=409,content=str(e))
+    return PlainTextResponse(Sampler.collapsed(stacks),headers={"X-Profile-Samples":str(ticks)})
+
+@app.put("/admin/server-timing")
+async def set_server_timing(
+    admin: Annotated[dict, Depends(get_admin_user)],
+    rate:Annotated[float,Query(ge=0,le=1)],
+    ):
+    # per worker, like the profile
+    timing.set_rate(rate)
+    return {"rate":timing.rate}
+
+@app.post("/signup",dependencies=[Depends(limit_by_ip("signup"))])
 async def signup(user:User):
     if await UserService.exists(user.name,get_db()):
         return Response(status_code=403,content=f"User with name={user.name} already exists")
     try:
         await UserService.create(user.name,user.password,get_db())
         return Response(status_code=200,content="User created!!")
+    except HashPoolSaturated:
+        raise
     except Exception as e:
         return Response(status_code=400,content=str(e))
     
 
-@app.post("/login")
+@app.post("/login",dependencies=[Depends(limit_by_ip("login"))])
 async def login(form_data:Annotated[OAuth2PasswordRequestForm,Depends()])->Token:
     user=await UserService.validate( form_data.username, form_data.password,get_db())
     if not user:
@@ -52,79 +155,315 @@ async def login(form_data:Annotated[OAuth2PasswordRequestForm,Depends()])->Token
             headers={"WWW-Authenticate": "Bearer"},
         )
     access_token=create_access_token(
-            user_id=(user["id"])
+            user_id=(user["id"]),name=user["name"]
         )
     return Token(access_token=access_token,token_type="bearer")
     
-@app.get("/blogs",status_code=200)
-async def blogs(current_user: Annotated[User, Depends(get_current_user)]):
+def etag_headers(etag:str)->dict:
+    # authenticated content: clients may keep it but must revalidate
+    return {"ETag":etag,"Cache-Control":"private, no-cache"}
+
+def set_etag(response:Response,etag:str):
+    response.headers.update(etag_headers(etag))
+
+@app.get("/blogs",status_code=200,response_model=Union[Blogs,BlogSummaries,BlogsWithCounts],dependencies=READ_LIMITS)
+async def blogs(
+    request:Request,
+    current_user: Annotated[User, Depends(get_current_user)],
+    limit:Annotated[int,Query(ge=1,le=MAX_LIMIT)]=DEFAULT_LIMIT,
+    after:Optional[str]=None,
+    summary:bool=False,
+    counts:bool=False,
+    if_none_match:Annotated[Optional[str],Header()]=None,
+    ):
     try:
-        blogs=await BlogService.read_all(get_db())
-        return Blogs(blogs=blogs)
+        read_db=get_read_db(current_user["id"])
+        if counts:
+            # likes and comment counts are not versioned, so no ETag here
+            blogs,cursor=await BlogService.read_page_with_counts(read_db,limit=limit,after=after)
+            return RowsResponse({"blogs":blogs,"next_cursor":cursor},request)
+        if if_none_match:
+            versions=await BlogService.page_versions(read_db,limit=limit,after=after)
+            etag=page_etag(versions,"blogs",limit,after,summary)
+            if matches(if_none_match,etag):
+                return not_modified(etag,request)
+        blogs,cursor,versions=await BlogService.read_page(read_db,limit=limit,after=after,summary=summary)
+        etag=page_etag(versions,"blogs",limit,after,summary)
+        return RowsResponse({"blogs":blogs,"next_cursor":cursor},request,headers=etag_headers(etag))
+    except InvalidCursor as e:
+        return Response(status_code=400,content=str(e))
     except Exception as e:
         return Response(status_code=400,content=f"Something went wrong error:{e}")
 
+@app.get("/blogs/trending",response_model=TrendingBlogs,dependencies=[Depends(limit_by_user("read"))])
+async def trending_blogs(
+    request:Request,
+    current_user: Annotated[dict, Depends(get_current_user)],
+    limit:Annotated[int,Query(ge=1,le=MAX_LIMIT)]=DEFAULT_LIMIT,
+    offset:Annotated[int,Query(ge=0,lt=TRENDING_SIZE)]=0,
+    ):
+    # ranked in memory over the last 24h; never scans blogs
+    blogs=await BlogService.trending(get_read_db(current_user["id"]),limit=limit,offset=offset)
+    return RowsResponse({"blogs":blogs},request)
+
+@app.post("/blogs:batch",dependencies=BATCH_LIMITS)
+async def create_blogs_batch(request:Request,current_user: Annotated[dict, Depends(get_current_user)]):
+    try:
+        ids=[]
+        # the body is read and validated before a connection is taken, so a
+        # slow upload does not pin one; the batch still commits as a whole
+        chunks=[chunk async for chunk in read_chunks(request,BlogRequest)]
+        async with get_db().acquire() as conn:
+            async with conn.transaction():
+                for chunk in chunks:
+                    ids+=await BlogService.create_many([(b.title,b.content) for b in chunk],user_id=current_user["id"],db=conn)
+        db.note_write(current_user["id"])
+        return BatchCreated(ids=ids)
+    except BatchTooLarge as e:
+        return Response(status_code=413,content=str(e))
+    except BatchError as e:
+        return Response(status_code=422,content=str(e))
+    except Exception as e:
+        return Response(status_code=400,content=str(e))
+
 @app.get("/blog/{blog_id}")
-async def get_blog(blog_id:int,current_user: Annotated[User, Depends(get_current_user)]):
+async def get_blog(
+    blog_id:int,
+    response:Response,
+    current_user: Annotated[User, Depends(get_current_user)],
+    if_none_match:Annotated[Optional[str],Header()]=None,
+    ):
     try:
-        blog=await BlogService.read(blog_id,get_db())
+        read_db=get_read_db(current_user["id"])
+        if if_none_match:
+            revision=await BlogService.version(blog_id,read_db)
+            if revision is not None and matches(if_none_match,make_etag("blog",blog_id,revision)):
+                return not_modified(make_etag("blog",blog_id,revision))
+        blog=await BlogService.read(blog_id,read_db)
         if not blog:
             raise ValueError("No blog for given blog_id")
+        if blog.get("revision") is not None:
+            set_etag(response,make_etag("blog",blog_id,blog["revision"]))
         return Blog(**blog)
     except Exception as e:
         return Response(status_code=400,content=str(e))
     
-@app.post("/blog")
+@app.get("/blog/{blog_id}/full",dependencies=READ_LIMITS)
+async def get_blog_full(
+    blog_id:int,
+    current_user: Annotated[User, Depends(get_current_user)],
+    comments:Annotated[int,Query(ge=0,le=MAX_LIMIT)]=DEFAULT_LIMIT,
+    ):
+    try:
+        blog=await BlogService.read_full(blog_id,get_read_db(current_user["id"]),comment_limit=comments)
+        if not blog:
+            raise ValueError("No blog for given blog_id")
+        return BlogDetail(**blog)
+    except Exception as e:
+        return Response(status_code=400,content=str(e))
+
+@app.post("/blog",dependencies=WRITE_LIMITS)
 async def set_blog(blog:BlogRequest,current_user: Annotated[dict, Depends(get_current_user)]):
     try:
         blog=await BlogService.create(user_id=current_user["id"],title=blog.title,content=blog.content,db=get_db())
+        db.note_write(current_user["id"])
         return Response(status_code=200,content="Successfully created")
     except Exception as e:
         return Response(status_code=400,content=str(e))
     
-@app.delete("/blog/{blog_id}")
+def not_owned(owner:Optional[int],kind:str,action:str)->Response:
+    # an owned mutation matched no row: either it does not exist or it is someone else's
+    if owner is None:
+        return Response(status_code=404,content=f"No {kind} for given {kind}_id")
+    return Response(status_code=403,content=f"cant {action} a {kind} you dont own")
+
+@app.patch("/blog/{blog_id}",dependencies=WRITE_LIMITS)
+async def update_blog(blog_id:int,blog:BlogPatch,current_user: Annotated[dict, Depends(get_current_user)]):
+    try:
+        if not await BlogService.update(blog_id,blog.title,blog.content,db=get_db(),user_id=current_user["id"]):
+            return not_owned(await BlogService.owner(blog_id,get_db()),"blog","update")
+        db.note_write(current_user["id"])
+        return Response(status_code=200,content="Successfully updated")
+    except Exception as e:
+        return Response(status_code=400,content=str(e))
+
+@app.delete("/blog/{blog_id}",dependencies=WRITE_LIMITS)
 async def delete_blog(blog_id:int,current_user: Annotated[dict, Depends(get_current_user)]):
     try:
-        blog=await BlogService.read(blog_id=blog_id,db=get_db())
-        if blog["user_id"]!=current_user["id"]:
-            raise ValueError("cant delete a blog you dont own")
-        blog=await BlogService.delete(blog_id,db=get_db())
+        if not await BlogService.delete(blog_id,db=get_db(),user_id=current_user["id"]):
+            return not_owned(await BlogService.owner(blog_id,get_db()),"blog","delete")
+        db.note_write(current_user["id"])
         return Response(status_code=200,content="Successfully deleted")
     except Exception as e:
         return Response(status_code=400,content=str(e))
     
 
-@app.get("/blog/comments/{blog_id}")
-async def comments(blog_id:int,current_user: Annotated[dict, Depends(get_current_user)]):
+@app.post("/blog/{blog_id}/like",dependencies=WRITE_LIMITS)
+async def like_blog(blog_id:int,current_user: Annotated[dict, Depends(get_current_user)]):
     try:
-        comments=await CommentService.read_all_from_blog(blog_id,get_db())
-        return Comments(comments=comments)
+        if not await LikeService.like(blog_id,current_user["id"],get_db()):
+            return Response(status_code=200,content="Already liked")
+        return Response(status_code=200,content="Successfully liked")
+    except ForeignKeyViolationError:
+        return Response(status_code=400,content="No blog for given blog_id")
+    except Exception as e:
+        return Response(status_code=400,content=str(e))
+
+@app.delete("/blog/{blog_id}/like",dependencies=WRITE_LIMITS)
+async def unlike_blog(blog_id:int,current_user: Annotated[dict, Depends(get_current_user)]):
+    try:
+        if not await LikeService.unlike(blog_id,current_user["id"],get_db()):
+            return Response(status_code=200,content="Not liked")
+        return Response(status_code=200,content="Successfully unliked")
+    except Exception as e:
+        return Response(status_code=400,content=str(e))
+
+@app.get("/blog/comments/{blog_id}",response_model=Comments,dependencies=READ_LIMITS)
+async def comments(
+    blog_id:int,
+    request:Request,
+    current_user: Annotated[dict, Depends(get_current_user)],
+    if_none_match:Annotated[Optional[str],Header()]=None,
+    ):
+    try:
+        read_db=get_read_db(current_user["id"])
+        if if_none_match:
+            version=await CommentService.version(blog_id,read_db)
+            if version is not None and matches(if_none_match,make_etag("comments",blog_id,version)):
+                return not_modified(make_etag("comments",blog_id,version),request)
+        listing=await CommentService.read_listing(blog_id,read_db)
+        headers=etag_headers(make_etag("comments",blog_id,listing["version"])) if listing["version"] is not None else None
+        return RowsResponse({"comments":listing["comments"]},request,headers=headers)
     except Exception as e:
         return Response(status_code=400,content=f"Something went wrong error:{e}")
 
-@app.get("/user/comments")
-async def my_comments(current_user: Annotated[dict, Depends(get_current_user)]):
+@app.get("/blog/{blog_id}/comments/stream")
+async def stream_comments(
+    blog_id:int,
+    current_user: Annotated[dict, Depends(get_current_user)],
+    last_event_id:Annotated[Optional[int],Header()]=None,
+    ):
+    if comment_feed.full:
+        return Response(status_code=503,content="Too many feed subscribers",headers={"Retry-After":"5"})
+    return StreamingResponse(
+        sse_stream(comment_feed,blog_id,after=last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control":"no-cache","X-Accel-Buffering":"no"},
+    )
+
+@app.websocket("/blog/{blog_id}/comments/ws")
+async def stream_comments_ws(websocket:WebSocket,blog_id:int,token:Optional[str]=None,after:Optional[int]=None):
+    # browsers cannot set headers on a WebSocket, so the token may come as ?token=
+    scheme,_,credentials=websocket.headers.get("authorization","").partition(" ")
+    try:
+        await get_current_user(token or (credentials if scheme.lower()=="bearer" else ""))
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
     try:
-        comments=await CommentService.read_all_from_user(current_user["id"],get_db())
-        return Comments(comments=comments)
+        sub=await comment_feed.subscribe(blog_id,after=after)
+    except FeedFull:
+        await websocket.close(code=1013)
+        return
+    await websocket.accept()
+    await ws_pump(comment_feed,sub,websocket)
+
+@app.get("/user/comments",response_model=Comments,dependencies=READ_LIMITS)
+async def my_comments(request:Request,current_user: Annotated[dict, Depends(get_current_user)]):
+    try:
+        comments=await CommentService.read_all_from_user(current_user["id"],get_read_db(current_user["id"]))
+        return RowsResponse({"comments":comments},request)
     except Exception as e:
         return Response(status_code=400,content=f"Something went wrong error:{e}")
     
-@app.post("/comment")
+@app.post("/comment",dependencies=WRITE_LIMITS)
 async def add_comment(comment:CommentRequest,current_user: Annotated[dict, Depends(get_current_user)]):
     try:
         comment=await CommentService.create(blog_id=comment.blog_id,user_id=current_user["id"],content=comment.content,db=get_db())
+        db.note_write(current_user["id"])
         return Response(status_code=200,content="Successfully created")
     except Exception as e:
         return Response(status_code=400,content=str(e))
     
-@app.delete("/comment/{comment_id}")
+@app.post("/comments:batch",dependencies=BATCH_LIMITS)
+async def add_comments_batch(request:Request,current_user: Annotated[dict, Depends(get_current_user)]):
+    try:
+        ids,per_blog=[],Counter()
+        chunks=[chunk async for chunk in read_chunks(request,CommentRequest)]
+        async with get_db().acquire() as conn:
+            async with conn.transaction():
+                for chunk in chunks:
+                    ids+=await CommentService.create_many([(c.blog_id,c.content) for c in chunk],user_id=current_user["id"],db=conn)
+                    per_blog.update(c.blog_id for c in chunk)
+        await CommentService.committed(per_blog,get_db())
+        db.note_write(current_user["id"])
+        return BatchCreated(ids=ids)
+    except BatchTooLarge as e:
+        return Response(status_code=413,content=str(e))
+    except BatchError as e:
+        return Response(status_code=422,content=str(e))
+    except Exception as e:
+        return Response(status_code=400,content=str(e))
+    
+@app.patch("/comment/{comment_id}",dependencies=WRITE_LIMITS)
+async def update_comment(comment_id:int,comment:CommentPatch,current_user: Annotated[dict, Depends(get_current_user)]):
+    try:
+        if not await CommentService.update(comment_id,comment.content,db=get_db(),user_id=current_user["id"]):
+            return not_owned(await CommentService.owner(comment_id,get_db()),"comment","update")
+        db.note_write(current_user["id"])
+        return Response(status_code=200,content="Successfully updated")
+    except Exception as e:
+        return Response(status_code=400,content=str(e))
+
+@app.delete("/comment/{comment_id}",dependencies=WRITE_LIMITS)
 async def delete_comment(comment_id:int,current_user: Annotated[dict, Depends(get_current_user)]):
     try:
-        comment=await CommentService.read(comment_id=comment_id,db=get_db())
-        if comment["user_id"]!=current_user["id"]:
-            raise ValueError("cant delete a blog you dont own")
-        await BlogService.delete(comment_id,db=get_db())
+        if not await CommentService.delete(comment_id,db=get_db(),user_id=current_user["id"]):
+            return not_owned(await CommentService.owner(comment_id,get_db()),"comment","delete")
+        db.note_write(current_user["id"])
         return Response(status_code=200,content="Successfully deleted")
     except Exception as e:
         return Response(status_code=400,content=str(e))
+
+@app.get("/search",response_model=Union[BlogHits,CommentHits],dependencies=SEARCH_LIMITS)
+async def search(
+    request:Request,
+    current_user: Annotated[dict, Depends(get_current_user)],
+    q:Annotated[str,Query(min_length=1,max_length=256)],
+    scope:Literal["blogs","comments"]="blogs",
+    limit:Annotated[int,Query(ge=1,le=MAX_LIMIT)]=DEFAULT_LIMIT,
+    after:Optional[str]=None,
+    ):
+    try:
+        read_db=get_read_db(current_user["id"])
+        if scope=="comments":
+            hits,cursor=await CommentService.search(q,read_db,limit=limit,after=after)
+            return RowsResponse({"comments":hits,"next_cursor":cursor},request)
+        hits,cursor=await BlogService.search(q,read_db,limit=limit,after=after)
+        return RowsResponse({"blogs":hits,"next_cursor":cursor},request)
+    except InvalidCursor as e:
+        return Response(status_code=400,content=str(e))
+    except Exception as e:
+        return Response(status_code=400,content=f"Something went wrong error:{e}")
+
+@app.get("/export/blogs",dependencies=EXPORT_LIMITS)
+async def export_blogs(
+    current_user: Annotated[dict, Depends(get_current_user)],
+    format:Literal["ndjson","csv"]="ndjson",
+    user_id:Optional[int]=None,
+    min_id:Optional[int]=None,
+    max_id:Optional[int]=None,
+    ):
+    rows=BlogService.export(get_read_db(current_user["id"]),user_id=user_id,min_id=min_id,max_id=max_id)
+    return export_response(rows,format,BlogService.EXPORT_COLUMNS,"blogs")
+
+@app.get("/export/comments",dependencies=EXPORT_LIMITS)
+async def export_comments(
+    current_user: Annotated[dict, Depends(get_current_user)],
+    format:Literal["ndjson","csv"]="ndjson",
+    user_id:Optional[int]=None,
+    min_id:Optional[int]=None,
+    max_id:Optional[int]=None,
+    ):
+    rows=CommentService.export(get_read_db(current_user["id"]),user_id=user_id,min_id=min_id,max_id=max_id)
+    return export_response(rows,format,CommentService.EXPORT_COLUMNS,"comments")
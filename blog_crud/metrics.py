@@ -0,0 +1,153 @@
+from typing import Callable, Iterable, Optional
+from bisect import bisect_left
+import math
+
+DEFAULT_BUCKETS=(.005,.01,.025,.05,.1,.25,.5,1.0,2.5,5.0,10.0)
+
+
+def _format_labels(names:tuple,values:tuple,extra:str="")->str:
+    pairs=[f'{n}="{_escape(str(v))}"' for n,v in zip(names,values)]
+    if extra:
+        pairs.append(extra)
+    return "{"+",".join(pairs)+"}" if pairs else ""
+
+
+def _escape(value:str)->str:
+    return value.replace("\\","\\\\").replace("\n","\\n").replace('"','\\"')
+
+
+def _format_value(value:float)->str:
+    if value==math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    kind="untyped"
+
+    def __init__(self,name:str,help:str,labels:Iterable[str]=()):
+        self.name=name
+        self.help=help
+        self.labelnames=tuple(labels)
+        self._values:dict={}
+
+    def _key(self,labels:dict)->tuple:
+        return tuple(labels.get(n,"") for n in self.labelnames)
+
+    def samples(self):
+        for key,value in self._values.items():
+            yield self.name,_format_labels(self.labelnames,key),value
+
+    def render(self)->str:
+        lines=[f"# HELP {self.name} {self.help}",f"# TYPE {self.name} {self.kind}"]
+        for name,labels,value in self.samples():
+            lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind="counter"
+
+    def inc(self,amount:float=1,**labels):
+        key=self._key(labels)
+        self._values[key]=self._values.get(key,0)+amount
+
+    def value(self,**labels)->float:
+        return self._values.get(self._key(labels),0)
+
+
+class Gauge(Metric):
+    kind="gauge"
+
+    def __init__(self,name:str,help:str,labels:Iterable[str]=(),fn:Optional[Callable[[],object]]=None):
+        super().__init__(name,help,labels)
+        # fn is read at scrape time; it returns a number, or a mapping of
+        # label tuples to numbers for labelled gauges
+        self.fn=fn
+
+    def set(self,value:float,**labels):
+        self._values[self._key(labels)]=value
+
+    def inc(self,amount:float=1,**labels):
+        key=self._key(labels)
+        self._values[key]=self._values.get(key,0)+amount
+
+    def dec(self,amount:float=1,**labels):
+        self.inc(-amount,**labels)
+
+    def value(self,**labels)->float:
+        return self._values.get(self._key(labels),0)
+
+    def samples(self):
+        if self.fn is None:
+            yield from super().samples()
+            return
+        current=self.fn()
+        if isinstance(current,dict):
+            for key,value in current.items():
+                key=key if isinstance(key,tuple) else (key,)
+                yield self.name,_format_labels(self.labelnames,key),value
+        else:
+            yield self.name,"",current
+
+
+class Histogram(Metric):
+    kind="histogram"
+
+    def __init__(self,name:str,help:str,labels:Iterable[str]=(),buckets:Iterable[float]=DEFAULT_BUCKETS):
+        super().__init__(name,help,labels)
+        self.buckets=tuple(sorted(buckets))
+
+    def observe(self,value:float,**labels):
+        key=self._key(labels)
+        series=self._values.get(key)
+        if series is None:
+            # per-bucket counts (last slot is +Inf), then sum and count
+            series=self._values[key]=[[0]*(len(self.buckets)+1),0.0,0]
+        series[0][bisect_left(self.buckets,value)]+=1
+        series[1]+=value
+        series[2]+=1
+
+    def count(self,**labels)->int:
+        series=self._values.get(self._key(labels))
+        return series[2] if series else 0
+
+    def samples(self):
+        bounds=self.buckets+(math.inf,)
+        for key,(counts,total,count) in self._values.items():
+            cumulative=0
+            for bound,n in zip(bounds,counts):
+                cumulative+=n
+                le=f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket",_format_labels(self.labelnames,key,le),cumulative
+            yield f"{self.name}_sum",_format_labels(self.labelnames,key),total
+            yield f"{self.name}_count",_format_labels(self.labelnames,key),count
+
+
+class Registry:
+    def __init__(self):
+        self._metrics:dict[str,Metric]={}
+
+    def register(self,metric:Metric)->Metric:
+        existing=self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name]=metric
+        return metric
+
+    def counter(self,name:str,help:str,labels:Iterable[str]=())->Counter:
+        return self.register(Counter(name,help,labels))
+
+    def gauge(self,name:str,help:str,labels:Iterable[str]=(),fn:Optional[Callable[[],object]]=None)->Gauge:
+        return self.register(Gauge(name,help,labels,fn))
+
+    def histogram(self,name:str,help:str,labels:Iterable[str]=(),buckets:Iterable[float]=DEFAULT_BUCKETS)->Histogram:
+        return self.register(Histogram(name,help,labels,buckets))
+
+    def render(self)->str:
+        return "\n".join(m.render() for m in self._metrics.values())+"\n"
+
+
+registry=Registry()
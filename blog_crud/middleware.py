@@ -0,0 +1,75 @@
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+import random
+import time
+
+from blog_crud.metrics import registry
+from blog_crud.profiling import ServerTiming, add_span, current_spans, server_timing, timing
+
+in_flight=registry.gauge("http_requests_in_flight","Requests currently being handled")
+request_latency=registry.histogram("http_request_duration_seconds","Time from request start to the last body byte",
+                                   ["method","route"])
+responses=registry.counter("http_responses_total","Responses sent",["method","route","status"])
+
+
+class MetricsMiddleware:
+    # Plain ASGI rather than BaseHTTPMiddleware, which would buffer streamed
+    # responses and add a task per request. Routes are labelled by their
+    # template ("/blog/{blog_id}") read from the scope after routing, so the
+    # label set stays bounded.
+    def __init__(self,app:ASGIApp):
+        self.app=app
+
+    async def __call__(self,scope:Scope,receive:Receive,send:Send):
+        if scope["type"]!="http":
+            await self.app(scope,receive,send)
+            return
+        status=500
+
+        async def send_with_status(message:Message):
+            nonlocal status
+            if message["type"]=="http.response.start":
+                status=message["status"]
+            await send(message)
+
+        in_flight.inc()
+        start=time.perf_counter()
+        try:
+            await self.app(scope,receive,send_with_status)
+        finally:
+            in_flight.dec()
+            route=getattr(scope.get("route"),"path","unmatched")
+            method=scope["method"]
+            request_latency.observe(time.perf_counter()-start,method=method,route=route)
+            responses.inc(method=method,route=route,status=str(status))
+
+
+class ServerTimingMiddleware:
+    # Adds a Server-Timing header (auth, db, validate, serialize, app) to a
+    # sampled fraction of responses. The spans are collected through
+    # current_spans, which is only set for sampled requests; the rest pay
+    # for reading the rate. "app" runs until the response headers are sent,
+    # so it covers everything but streaming the body.
+    def __init__(self,app:ASGIApp,timing:ServerTiming=timing):
+        self.app=app
+        self.timing=timing
+
+    async def __call__(self,scope:Scope,receive:Receive,send:Send):
+        rate=self.timing.rate
+        if not rate or scope["type"]!="http" or random.random()>=rate:
+            await self.app(scope,receive,send)
+            return
+        spans:dict={}
+        token=current_spans.set(spans)
+        start=time.perf_counter()
+
+        async def send_with_timing(message:Message):
+            if message["type"]=="http.response.start":
+                add_span(spans,"app",time.perf_counter()-start)
+                MutableHeaders(scope=message).append("Server-Timing",server_timing(spans))
+            await send(message)
+
+        try:
+            await self.app(scope,receive,send_with_timing)
+        finally:
+            current_spans.reset(token)
@@ -0,0 +1,116 @@
+from asyncpg.pool import Pool
+from asyncpg.exceptions import UndefinedTableError
+from blog_crud.config import load_config
+from pathlib import Path
+from typing import NamedTuple, Optional
+import argparse
+import asyncio
+import re
+import os
+import logging
+
+logger=logging.getLogger(__name__)
+load_config()
+
+MIGRATIONS_DIR=Path(__file__).parent/"migrations"
+# arbitrary constant shared by every worker so only one of them applies DDL
+MIGRATION_LOCK_ID=0x626c6f67
+# Waiting for the lock and running DDL can take far longer than
+# DB_COMMAND_TIMEOUT. asyncpg falls back to the pool's command_timeout when
+# a call passes None, so the limit is given explicitly
+MIGRATION_TIMEOUT=float(os.environ.get("MIGRATION_TIMEOUT","3600"))
+
+_FILENAME=re.compile(r"^(\d+)_([\w-]+)\.sql$")
+
+
+class Migration(NamedTuple):
+    version:int
+    name:str
+    sql:str
+
+
+def load_migrations(path:Path=MIGRATIONS_DIR)->list[Migration]:
+    migrations=[]
+    for file in path.iterdir():
+        match=_FILENAME.match(file.name)
+        if not match:
+            continue
+        migrations.append(Migration(int(match.group(1)),match.group(2),file.read_text()))
+    migrations.sort()
+    versions=[m.version for m in migrations]
+    if len(versions)!=len(set(versions)):
+        raise ValueError(f"Duplicate migration versions in {path}")
+    return migrations
+
+
+async def current_version(db:Pool)->int:
+    try:
+        return await db.fetchval('''
+            SELECT coalesce(max(version),0) FROM schema_version;
+            ''')
+    except UndefinedTableError:
+        return 0
+
+
+async def pending(db:Pool,migrations:Optional[list[Migration]]=None)->list[Migration]:
+    migrations=load_migrations() if migrations is None else migrations
+    current=await current_version(db)
+    return [m for m in migrations if m.version>current]
+
+
+async def migrate(db:Pool,dry_run:bool=False)->list[Migration]:
+    todo=await pending(db)
+    if not todo:
+        logger.info("Schema is current, skipping migrations")
+        return []
+    if dry_run:
+        return todo
+
+    applied=[]
+    async with db.acquire() as conn:
+        await conn.execute("SELECT pg_advisory_lock($1);",MIGRATION_LOCK_ID,timeout=MIGRATION_TIMEOUT)
+        try:
+            await conn.execute('''
+                CREATE TABLE IF NOT EXISTS schema_version(
+                    version int PRIMARY KEY,
+                    name text NOT NULL,
+                    applied_at timestamptz NOT NULL DEFAULT now()
+                );
+                ''')
+            # another worker may have applied some of these while we waited on the lock
+            done={r["version"] for r in await conn.fetch("SELECT version FROM schema_version;")}
+            for migration in todo:
+                if migration.version in done:
+                    continue
+                async with conn.transaction():
+                    await conn.execute(migration.sql,timeout=MIGRATION_TIMEOUT)
+                    await conn.execute('''
+                        INSERT INTO schema_version (version,name)
+                        VALUES($1,$2);
+                        ''',migration.version,migration.name)
+                logger.info(f"Applied migration {migration.version:04d}_{migration.name}")
+                applied.append(migration)
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock($1);",MIGRATION_LOCK_ID)
+    return applied
+
+
+async def _main(dry_run:bool):
+    from blog_crud.db import db
+    await db.connect()
+    try:
+        migrations=await migrate(db.pool,dry_run=dry_run)
+    finally:
+        await db.disconnect()
+    verb="Pending" if dry_run else "Applied"
+    if not migrations:
+        print("Schema is current")
+    for m in migrations:
+        print(f"{verb}: {m.version:04d}_{m.name}")
+
+
+if __name__=="__main__":
+    parser=argparse.ArgumentParser(description="Apply pending schema migrations")
+    parser.add_argument("--dry-run",action="store_true",help="list pending migrations without applying them")
+    args=parser.parse_args()
+    asyncio.run(_main(args.dry_run))
@@ -0,0 +1,22 @@
+-- Tables as originally created by CreateTables; IF NOT EXISTS keeps this a
+-- no-op on databases that predate the migration runner.
+CREATE TABLE IF NOT EXISTS users(
+    id SERIAL PRIMARY KEY,
+    name text,
+    password text
+);
+
+CREATE TABLE IF NOT EXISTS blogs(
+    id SERIAL PRIMARY KEY,
+    user_id BIGINT REFERENCES users(id) ON DELETE CASCADE,
+    title text NOT NULL,
+    content text,
+    likes bigint DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS comments(
+    id SERIAL PRIMARY KEY,
+    content text,
+    blog_id BIGINT REFERENCES blogs(id) ON DELETE CASCADE,
+    user_id BIGINT REFERENCES users(id) ON DELETE CASCADE
+);
@@ -0,0 +1,11 @@
+-- UserService.exists/validate look users up by name; signup already refuses
+-- duplicates, the unique index makes that hold under concurrent signups too.
+-- Remove any existing duplicate names before applying.
+CREATE UNIQUE INDEX IF NOT EXISTS users_name_key ON users(name);
+
+-- BlogService.read_all_for_user
+CREATE INDEX IF NOT EXISTS blogs_user_id_idx ON blogs(user_id);
+
+-- CommentService.read_all_from_blog / read_all_from_user
+CREATE INDEX IF NOT EXISTS comments_blog_id_idx ON comments(blog_id);
+CREATE INDEX IF NOT EXISTS comments_user_id_idx ON comments(user_id);
@@ -0,0 +1,6 @@
+-- Versions behind the ETags on /blog/{id}, /blogs and /blog/comments/{id}.
+-- revision is bumped by BlogService.update; comments_revision by every
+-- comment write against the blog, so a list can be revalidated from the
+-- blog row alone.
+ALTER TABLE blogs ADD COLUMN IF NOT EXISTS revision bigint NOT NULL DEFAULT 1;
+ALTER TABLE blogs ADD COLUMN IF NOT EXISTS comments_revision bigint NOT NULL DEFAULT 1;
@@ -0,0 +1,13 @@
+-- Full-text search behind GET /search. Stored generated columns keep the
+-- vectors in step with every write path, COPY included; titles outrank
+-- bodies through the A/B weights that ts_rank applies.
+ALTER TABLE blogs ADD COLUMN IF NOT EXISTS search tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english',coalesce(title,'')),'A') ||
+        setweight(to_tsvector('english',coalesce(content,'')),'B')
+    ) STORED;
+CREATE INDEX IF NOT EXISTS blogs_search_idx ON blogs USING GIN(search);
+
+ALTER TABLE comments ADD COLUMN IF NOT EXISTS search tsvector
+    GENERATED ALWAYS AS (to_tsvector('english',coalesce(content,''))) STORED;
+CREATE INDEX IF NOT EXISTS comments_search_idx ON comments USING GIN(search);
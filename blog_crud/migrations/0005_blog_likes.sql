@@ -0,0 +1,10 @@
+-- One row per (blog, user) like. The primary key makes liking idempotent;
+-- blogs.likes is the aggregate, written behind by blog_crud.likes.
+CREATE TABLE IF NOT EXISTS blog_likes(
+    blog_id BIGINT REFERENCES blogs(id) ON DELETE CASCADE,
+    user_id BIGINT REFERENCES users(id) ON DELETE CASCADE,
+    PRIMARY KEY (blog_id,user_id)
+);
+
+-- UserService.delete and the user cascade look likes up by user
+CREATE INDEX IF NOT EXISTS blog_likes_user_id_idx ON blog_likes(user_id);
@@ -0,0 +1,23 @@
+-- Activity timestamps and the hourly rollup behind GET /blogs/trending.
+-- Existing rows get the time of the migration, which only affects the
+-- first day of trending scores.
+ALTER TABLE comments ADD COLUMN IF NOT EXISTS created_at timestamptz NOT NULL DEFAULT now();
+ALTER TABLE blog_likes ADD COLUMN IF NOT EXISTS created_at timestamptz NOT NULL DEFAULT now();
+CREATE INDEX IF NOT EXISTS comments_created_at_idx ON comments(created_at);
+CREATE INDEX IF NOT EXISTS blog_likes_created_at_idx ON blog_likes(created_at);
+
+-- Likes and comments per blog per hour over the last 24 hours. Refreshed
+-- CONCURRENTLY by blog_crud.trending, which needs the unique index; the
+-- decay is applied when it is read, so the half-life stays configurable.
+CREATE MATERIALIZED VIEW IF NOT EXISTS blog_activity AS
+    SELECT blog_id,date_trunc('hour',created_at) AS hour,
+        sum(likes)::bigint AS likes,sum(comments)::bigint AS comments
+    FROM (
+        SELECT blog_id,created_at,1 AS likes,0 AS comments FROM blog_likes
+        WHERE created_at>now()-interval '24 hours'
+        UNION ALL
+        SELECT blog_id,created_at,0,1 FROM comments
+        WHERE created_at>now()-interval '24 hours' AND blog_id IS NOT NULL
+    ) activity
+    GROUP BY 1,2;
+CREATE UNIQUE INDEX IF NOT EXISTS blog_activity_blog_hour_idx ON blog_activity(blog_id,hour);
@@ -0,0 +1,17 @@
+-- The comments version behind /blog/comments/{id} no longer lives on the
+-- blog row: bumping blogs.comments_revision on every comment write made
+-- concurrent comments on a busy post queue on that row's lock. A listing's
+-- version is now count(*) and max(id) of its comments, which inserts change
+-- without any shared row, plus a per-blog edit counter that only updates
+-- and deletes bump. No foreign key: the user cascade deletes blogs in the
+-- same statement that counts their edits, and ids are never reused.
+CREATE TABLE IF NOT EXISTS comment_edits(
+    blog_id BIGINT PRIMARY KEY,
+    edits BIGINT NOT NULL
+);
+
+-- count and max per blog from the index alone
+CREATE INDEX IF NOT EXISTS comments_blog_id_id_idx ON comments(blog_id,id);
+DROP INDEX IF EXISTS comments_blog_id_idx;
+
+ALTER TABLE blogs DROP COLUMN IF EXISTS comments_revision;
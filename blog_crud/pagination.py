@@ -0,0 +1,59 @@
+import base64
+import json
+from typing import Optional
+
+DEFAULT_LIMIT=50
+MAX_LIMIT=200
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(**position)->str:
+    raw=json.dumps(position,separators=(",",":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor:Optional[str])->dict:
+    if not cursor:
+        return {}
+    try:
+        padded=cursor+"="*(-len(cursor)%4)
+        position=json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError,TypeError):
+        raise InvalidCursor("Invalid cursor")
+    if not isinstance(position,dict):
+        raise InvalidCursor("Invalid cursor")
+    return position
+
+
+def after_id(cursor:Optional[str])->int:
+    position=decode_cursor(cursor)
+    if not position:
+        return 0
+    last_id=position.get("id")
+    if not isinstance(last_id,int):
+        raise InvalidCursor("Invalid cursor")
+    return last_id
+
+
+def after_rank(cursor:Optional[str])->tuple[Optional[float],Optional[int]]:
+    # (rank, id) keyset for relevance-ordered results; (None, None) starts
+    # from the top
+    position=decode_cursor(cursor)
+    if not position:
+        return None,None
+    rank,last_id=position.get("rank"),position.get("id")
+    if not isinstance(rank,(int,float)) or isinstance(rank,bool) or not isinstance(last_id,int):
+        raise InvalidCursor("Invalid cursor")
+    return float(rank),last_id
+
+
+def next_cursor(rows:list,limit:int,*keys:str)->Optional[str]:
+    # rows are fetched with limit+1 so a full page only yields a cursor
+    # when there really is something after it
+    if len(rows)<=limit:
+        return None
+    last=rows[limit-1]
+    return encode_cursor(**{key:last[key] for key in keys or ("id",)})
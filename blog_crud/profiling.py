@@ -0,0 +1,165 @@
+from fastapi.routing import APIRoute
+from blog_crud.config import load_config
+from collections import Counter
+from contextvars import ContextVar
+from types import FrameType
+from typing import Callable, Optional
+import functools
+import threading
+import inspect
+import time
+import sys
+import os
+
+load_config()
+
+# fraction of requests that get a Server-Timing header; 0 turns it off
+SERVER_TIMING_SAMPLE_RATE=float(os.environ.get("SERVER_TIMING_SAMPLE_RATE","0"))
+PROFILE_MAX_SECONDS=float(os.environ.get("PROFILE_MAX_SECONDS","60"))
+PROFILE_INTERVAL_MS=float(os.environ.get("PROFILE_INTERVAL_MS","5"))
+
+# span name -> [seconds, count] for the sampled request being handled, None
+# otherwise; instrumented code checks it before reading any clock
+current_spans:ContextVar[Optional[dict]]=ContextVar("current_spans",default=None)
+
+
+def add_span(spans:dict,name:str,seconds:float):
+    entry=spans.get(name)
+    if entry is None:
+        spans[name]=[seconds,1]
+    else:
+        entry[0]+=seconds
+        entry[1]+=1
+
+
+def server_timing(spans:dict)->str:
+    parts=[]
+    for name,(seconds,count) in spans.items():
+        part=f"{name};dur={seconds*1000:.2f}"
+        if count>1:
+            part+=f';desc="{count} calls"'
+        parts.append(part)
+    return ", ".join(parts)
+
+
+# [perf_counter() when the endpoint returned] for the sampled request; a
+# list so a sync endpoint's threadpool copy of the context can fill it in
+_endpoint_returned:ContextVar[Optional[list]]=ContextVar("endpoint_returned",default=None)
+
+
+def _mark_returned():
+    returned=_endpoint_returned.get()
+    if returned is not None:
+        returned[0]=time.perf_counter()
+
+
+def _marking(endpoint:Callable)->Callable:
+    # functools.wraps keeps the signature FastAPI reads dependencies from
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def marked(*args,**kwargs):
+            try:
+                return await endpoint(*args,**kwargs)
+            finally:
+                _mark_returned()
+    else:
+        @functools.wraps(endpoint)
+        def marked(*args,**kwargs):
+            try:
+                return endpoint(*args,**kwargs)
+            finally:
+                _mark_returned()
+    return marked
+
+
+class TimedRoute(APIRoute):
+    # Route class that adds the "validate" span: FastAPI's work from the
+    # endpoint returning to the response being built, i.e. response_model
+    # validation, the dump and rendering. Unsampled requests pay one context
+    # variable lookup in the handler and one in the endpoint wrapper.
+    def __init__(self,path:str,endpoint:Callable,**kwargs):
+        super().__init__(path,_marking(endpoint),**kwargs)
+
+    def get_route_handler(self)->Callable:
+        handler=super().get_route_handler()
+
+        async def timed_handler(request):
+            spans=current_spans.get()
+            if spans is None:
+                return await handler(request)
+            returned=[None]
+            token=_endpoint_returned.set(returned)
+            try:
+                return await handler(request)
+            finally:
+                _endpoint_returned.reset(token)
+                if returned[0] is not None:
+                    add_span(spans,"validate",time.perf_counter()-returned[0])
+        return timed_handler
+
+
+class ServerTiming:
+    # Holds the sample rate read by ServerTimingMiddleware; 0 turns it off.
+    def __init__(self,rate:float=SERVER_TIMING_SAMPLE_RATE):
+        self.rate=0.0
+        self.set_rate(rate)
+
+    def set_rate(self,rate:float):
+        if not 0<=rate<=1:
+            raise ValueError("rate must be between 0 and 1")
+        self.rate=rate
+
+
+timing=ServerTiming()
+
+
+def _frame_name(frame:FrameType)->str:
+    code=frame.f_code
+    # ";" separates frames in the collapsed format
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";",":")
+
+
+class Sampler:
+    # Statistical profiler for the whole worker: a thread wakes every
+    # interval and records the stack of every other thread, so the cost is
+    # one stack walk per thread per tick and nothing on the request path.
+    # The output is the collapsed format that flamegraph.pl and speedscope
+    # read: one "thread;outer;...;inner count" line per distinct stack.
+    def __init__(self,interval:float=PROFILE_INTERVAL_MS/1000):
+        self.interval=interval
+        self.lock=threading.Lock()
+
+    def busy(self)->bool:
+        return self.lock.locked()
+
+    def sample(self,seconds:float)->tuple[Counter,int]:
+        if not self.lock.acquire(blocking=False):
+            raise RuntimeError("A profile is already running")
+        try:
+            stacks:Counter=Counter()
+            me=threading.get_ident()
+            names={t.ident:t.name for t in threading.enumerate()}
+            ticks=0
+            deadline=time.perf_counter()+seconds
+            while time.perf_counter()<deadline:
+                for ident,frame in sys._current_frames().items():
+                    if ident==me:
+                        continue
+                    stack=[]
+                    while frame is not None:
+                        stack.append(_frame_name(frame))
+                        frame=frame.f_back
+                    stack.append(names.get(ident,str(ident)))
+                    stacks[";".join(reversed(stack))]+=1
+                ticks+=1
+                time.sleep(self.interval)
+            return stacks,ticks
+        finally:
+            self.lock.release()
+
+    @staticmethod
+    def collapsed(stacks:Counter)->str:
+        return "".join(f"{stack} {count}\n" for stack,count in stacks.most_common())
+
+
+sampler=Sampler()
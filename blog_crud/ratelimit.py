@@ -0,0 +1,182 @@
+from fastapi import Depends, Request
+from blog_crud.config import load_config
+from typing import Annotated, Callable, Hashable, Optional
+import asyncio
+import math
+import time
+import os
+
+from blog_crud.auth import get_current_user
+from blog_crud.cache import LRUCache, MISSING
+from blog_crud.db import DB_POOL_MAX_SIZE
+from blog_crud.metrics import registry
+
+load_config()
+
+RATE_LIMITS_ENABLED=os.environ.get("RATE_LIMITS_ENABLED","true").lower() in ("1","true","yes")
+# clients tracked per limit; the least recently seen go first
+RATE_LIMIT_KEYS=int(os.environ.get("RATE_LIMIT_KEYS","100000"))
+# "count/seconds": a bucket holds count tokens and refills over seconds
+DEFAULT_LIMITS={
+    "login":"10/60",
+    "signup":"5/600",
+    "read":"50/10",
+    "search":"20/10",
+    "export":"5/60",
+    "write":"30/10",
+}
+# DB-heavy routes admitted at once; keep it at or under the pool size so an
+# admitted request does not queue again inside pool.acquire()
+DB_ADMISSION_LIMIT=int(os.environ.get("DB_ADMISSION_LIMIT") or DB_POOL_MAX_SIZE)
+DB_ADMISSION_QUEUE=int(os.environ.get("DB_ADMISSION_QUEUE","100"))
+DB_ADMISSION_WAIT=float(os.environ.get("DB_ADMISSION_WAIT","2"))
+
+rejected=registry.counter("ratelimit_rejected_total","Requests refused with 429 by a rate limit",["limit"])
+admission_rejected=registry.counter("db_admission_rejected_total","DB-heavy requests shed with 503",["reason"])
+
+
+class RateLimited(Exception):
+    def __init__(self,limit:str,retry_after:float):
+        super().__init__(f"Rate limit {limit!r} exceeded, retry in {math.ceil(retry_after)}s")
+        self.retry_after=retry_after
+
+
+class Overloaded(Exception):
+    def __init__(self,message:str,retry_after:float):
+        super().__init__(message)
+        self.retry_after=retry_after
+
+
+def parse_rate(spec:str)->Optional[tuple[int,float]]:
+    # "0" or "off" disables a limit
+    if spec.strip().lower() in ("0","off",""):
+        return None
+    count,_,seconds=spec.partition("/")
+    count,seconds=int(count),float(seconds or 1)
+    if count<=0 or seconds<=0:
+        raise ValueError(f"Invalid rate limit {spec!r}")
+    return count,seconds
+
+
+class RateLimiter:
+    # Token bucket per key. A bucket is stored as (tokens, last refill) and
+    # expires once it would have refilled completely, since a full bucket and
+    # no bucket behave the same; idle clients therefore cost nothing after
+    # one refill period, and the LRU bound caps memory under key churn.
+    def __init__(self,name:str,count:int,seconds:float,maxsize:int=RATE_LIMIT_KEYS,clock:Callable[[],float]=time.monotonic):
+        self.name=name
+        self.burst=count
+        self.rate=count/seconds
+        self.clock=clock
+        self.buckets=LRUCache(f"ratelimit_{name}",maxsize=maxsize,ttl=seconds,clock=clock)
+
+    def hit(self,key:Hashable,cost:float=1)->float:
+        # takes cost tokens; returns 0 when allowed, else seconds until it would be
+        now=self.clock()
+        state=self.buckets.get(key)
+        if state is MISSING:
+            tokens=self.burst
+        else:
+            tokens,last=state
+            tokens=min(self.burst,tokens+(now-last)*self.rate)
+        if tokens<cost:
+            retry_after=(cost-tokens)/self.rate
+        else:
+            tokens-=cost
+            retry_after=0
+        self.buckets.set(key,(tokens,now),ttl=(self.burst-tokens)/self.rate)
+        return retry_after
+
+
+_limiters:dict[str,Optional[RateLimiter]]={}
+
+
+def limiter(name:str)->Optional[RateLimiter]:
+    if name not in _limiters:
+        spec=os.environ.get(f"RATE_LIMIT_{name.upper()}",DEFAULT_LIMITS.get(name,"0"))
+        rate=parse_rate(spec)
+        _limiters[name]=RateLimiter(name,*rate) if rate else None
+    return _limiters[name]
+
+
+def _check(name:str,bucket:Optional[RateLimiter],key:Hashable):
+    if bucket is None or not RATE_LIMITS_ENABLED:
+        return
+    retry_after=bucket.hit(key)
+    if retry_after:
+        rejected.inc(limit=name)
+        raise RateLimited(name,retry_after)
+
+
+def client_ip(request:Request)->str:
+    # behind a proxy run uvicorn with --proxy-headers so this is the client
+    return request.client.host if request.client else "unknown"
+
+
+def limit_by_ip(name:str):
+    # for routes without a user (login, signup)
+    bucket=limiter(name)
+
+    async def dependency(request:Request):
+        _check(name,bucket,client_ip(request))
+    return dependency
+
+
+def limit_by_user(name:str):
+    # get_current_user is cached per request, so the route's own copy of it
+    # does not decode the token a second time
+    bucket=limiter(name)
+
+    async def dependency(user:Annotated[dict,Depends(get_current_user)]):
+        _check(name,bucket,user["id"])
+    return dependency
+
+
+class AdmissionControl:
+    # Caps how many DB-heavy requests run at once. Up to max_waiting more wait
+    # at most `wait` seconds for a slot; past that they are shed with 503 and
+    # Retry-After instead of piling up in pool.acquire() until the client or
+    # the command timeout gives up.
+    def __init__(self,limit:int=DB_ADMISSION_LIMIT,max_waiting:int=DB_ADMISSION_QUEUE,wait:float=DB_ADMISSION_WAIT):
+        self.limit=limit
+        self.max_waiting=max_waiting
+        self.wait=wait
+        self.in_use=0
+        self.waiting=0
+        self._slots=asyncio.Semaphore(limit)
+        registry.gauge("db_admission_in_use","DB-heavy requests currently admitted",fn=lambda:self.in_use)
+        registry.gauge("db_admission_waiting","DB-heavy requests waiting for a slot",fn=lambda:self.waiting)
+
+    async def acquire(self):
+        if self._slots.locked():
+            if self.waiting>=self.max_waiting:
+                admission_rejected.inc(reason="queue_full")
+                raise Overloaded("Server busy, retry shortly",self.wait)
+            self.waiting+=1
+            try:
+                await asyncio.wait_for(self._slots.acquire(),self.wait)
+            except asyncio.TimeoutError:
+                admission_rejected.inc(reason="timeout")
+                raise Overloaded("Server busy, retry shortly",self.wait) from None
+            finally:
+                self.waiting-=1
+        else:
+            await self._slots.acquire()
+        self.in_use+=1
+
+    def release(self):
+        self.in_use-=1
+        self._slots.release()
+
+
+admission=AdmissionControl()
+
+
+async def admit():
+    # a yield dependency: the slot is held until the response is sent, which
+    # covers streamed exports too
+    await admission.acquire()
+    try:
+        yield
+    finally:
+        admission.release()
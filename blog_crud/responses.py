@@ -0,0 +1,133 @@
+from asyncpg import Record
+from fastapi import Request, Response
+from blog_crud.config import load_config
+from typing import Any, Mapping, Optional
+import datetime
+import time
+import json
+import gzip
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson=None
+try:
+    import msgpack
+except ImportError:
+    msgpack=None
+try:
+    import brotli
+except ImportError:
+    brotli=None
+
+from blog_crud.profiling import add_span, current_spans
+
+load_config()
+
+# bodies smaller than this are sent uncompressed
+RESPONSE_COMPRESS_MIN_BYTES=int(os.environ.get("RESPONSE_COMPRESS_MIN_BYTES","1024"))
+RESPONSE_GZIP_LEVEL=int(os.environ.get("RESPONSE_GZIP_LEVEL","5"))
+RESPONSE_BROTLI_QUALITY=int(os.environ.get("RESPONSE_BROTLI_QUALITY","4"))
+
+MSGPACK_TYPES=("application/msgpack","application/x-msgpack")
+VARY="Accept, Accept-Encoding"
+
+
+def _default(obj:Any)->Any:
+    if isinstance(obj,Record):
+        return dict(obj)
+    if isinstance(obj,(datetime.date,datetime.datetime)):
+        return obj.isoformat()
+    raise TypeError(f"Cannot serialize {type(obj).__name__}")
+
+
+def dumps(payload:Any)->bytes:
+    if orjson is not None:
+        # orjson hands each Record to _default, which only builds its dict
+        return orjson.dumps(payload,default=_default)
+    return json.dumps(payload,default=_default,separators=(",",":")).encode()
+
+
+def _weights(header:str)->dict[str,float]:
+    weights={}
+    for part in header.split(","):
+        name,_,params=part.strip().partition(";")
+        if not name:
+            continue
+        q=1.0
+        for param in params.split(";"):
+            key,_,value=param.strip().partition("=")
+            if key=="q":
+                try:
+                    q=float(value)
+                except ValueError:
+                    q=0.0
+        weights[name.strip().lower()]=q
+    return weights
+
+
+def wants_msgpack(accept:str)->bool:
+    if msgpack is None or not accept:
+        return False
+    weights=_weights(accept)
+    best=max((weights.get(t,0) for t in MSGPACK_TYPES),default=0)
+    return best>0 and best>=weights.get("application/json",0)
+
+
+def pick_encoding(accept_encoding:str)->Optional[str]:
+    weights=_weights(accept_encoding or "")
+    for encoding in ("br","gzip"):
+        if encoding=="br" and brotli is None:
+            continue
+        if weights.get(encoding,weights.get("*",0))>0:
+            return encoding
+    return None
+
+
+def negotiate(request:Optional[Request])->tuple[list[str],Optional[str]]:
+    # (content variant, encoding) RowsResponse picks for this request; the
+    # encoding only applies to bodies over RESPONSE_COMPRESS_MIN_BYTES
+    if request is None:
+        return [],None
+    variant=["msgpack"] if wants_msgpack(request.headers.get("accept","")) else []
+    return variant,pick_encoding(request.headers.get("accept-encoding",""))
+
+
+def variant_etag(etag:str,variant:list[str])->str:
+    # each representation needs its own strong validator
+    return etag[:-1]+"-"+"-".join(variant)+'"' if variant else etag
+
+
+class RowsResponse(Response):
+    # Opt-in fast path for list routes: the payload may hold asyncpg Records
+    # straight from the service layer and is serialized once, without the
+    # response_model validation pass. Routes returning it must only put
+    # DB-typed rows in the payload. Negotiates msgpack through Accept and
+    # br/gzip through Accept-Encoding for bodies over the size threshold.
+    media_type="application/json"
+
+    def __init__(self,content:Any,request:Optional[Request]=None,status_code:int=200,headers:Optional[Mapping[str,str]]=None):
+        spans=current_spans.get()
+        start=time.perf_counter() if spans is not None else 0
+        headers=dict(headers or {})
+        media_type=self.media_type
+        variant,encoding=negotiate(request)
+        if variant:
+            body=msgpack.packb(content,default=_default)
+            media_type=MSGPACK_TYPES[0]
+        else:
+            body=dumps(content)
+        if encoding and len(body)>=RESPONSE_COMPRESS_MIN_BYTES:
+            if encoding=="br":
+                body=brotli.compress(body,quality=RESPONSE_BROTLI_QUALITY)
+            else:
+                body=gzip.compress(body,compresslevel=RESPONSE_GZIP_LEVEL)
+            headers["Content-Encoding"]=encoding
+            variant=variant+[encoding]
+        headers["Vary"]=VARY
+        if "ETag" in headers:
+            headers["ETag"]=variant_etag(headers["ETag"],variant)
+        if spans is not None:
+            add_span(spans,"serialize",time.perf_counter()-start)
+        super().__init__(content=body,status_code=status_code,headers=headers,media_type=media_type)
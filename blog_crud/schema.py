@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 
 ##USER SCHEMA
 class User(BaseModel):
@@ -13,15 +13,33 @@ class BlogRequest(BaseModel):
     content:str
     
 
+class BlogPatch(BaseModel):
+    title:Optional[str]=None
+    content:Optional[str]=None
+
 class Blog(BlogRequest):
     user_id:int 
     
 class BlogResponse(Blog):
     id:int
+    revision:Optional[int]=None
     
     
 class Blogs(BaseModel):
     blogs:List[BlogResponse]
+    next_cursor:Optional[str]=None
+
+
+class BlogSummary(BaseModel):
+    id:int
+    user_id:int
+    title:str
+    revision:Optional[int]=None
+
+
+class BlogSummaries(BaseModel):
+    blogs:List[BlogSummary]
+    next_cursor:Optional[str]=None
 
 
 ##COMMENT SCHEMA
@@ -29,6 +47,9 @@ class CommentRequest(BaseModel):
     blog_id:int
     content:str
     
+class CommentPatch(BaseModel):
+    content:str
+
 class Comment(CommentRequest):
     user_id:int
 
@@ -38,11 +59,60 @@ class CommentResponse(Comment):
 class Comments(BaseModel):
     comments:List[CommentResponse]
 
+##DETAIL SCHEMA
+class BlogWithCounts(BlogResponse):
+    author:Optional[str]=None
+    likes:int
+    comment_count:int
+
+class BlogsWithCounts(BaseModel):
+    blogs:List[BlogWithCounts]
+    next_cursor:Optional[str]=None
+
+class TrendingBlog(BaseModel):
+    id:int
+    user_id:int
+    title:str
+    likes:int
+    score:float
+
+class TrendingBlogs(BaseModel):
+    blogs:List[TrendingBlog]
+
+class CommentWithAuthor(CommentResponse):
+    author:Optional[str]=None
+
+class BlogDetail(BlogWithCounts):
+    comments:List[CommentWithAuthor]
+
+##SEARCH SCHEMA
+class BlogHit(BlogSummary):
+    rank:float
+    snippet:str
+
+class BlogHits(BaseModel):
+    blogs:List[BlogHit]
+    next_cursor:Optional[str]=None
+
+class CommentHit(BaseModel):
+    id:int
+    blog_id:int
+    user_id:int
+    rank:float
+    snippet:str
+
+class CommentHits(BaseModel):
+    comments:List[CommentHit]
+    next_cursor:Optional[str]=None
+
 ##CUSTOM SCHEMA
 class CustomResponse(BaseModel):
     status:int
     payload:str
     
+class BatchCreated(BaseModel):
+    ids:List[int]
+
 class Token(BaseModel):
     access_token:str
     token_type:str 
@@ -0,0 +1,111 @@
+# Production entry point: python -m blog_crud.serve
+#
+# Migrates the schema once in the supervisor, then starts WEB_CONCURRENCY
+# uvicorn workers (one per CPU by default) on uvloop and httptools with
+# SKIP_MIGRATIONS set, so worker startup is only the pool warmup. SIGTERM
+# turns /ready to 503 and ends the comment feeds, then uvicorn lets in-flight
+# requests finish for up to SERVE_GRACEFUL_TIMEOUT seconds before the
+# lifespan shutdown disconnects the database.
+from typing import Callable
+import threading
+import argparse
+import asyncio
+import signal
+import time
+import os
+import logging
+
+from blog_crud import config
+from blog_crud.config import load_config, cpu_count, SKIP_MIGRATIONS
+
+logger=logging.getLogger(__name__)
+load_config()
+
+# empty or unset means one worker per CPU
+WEB_CONCURRENCY=int(os.environ.get("WEB_CONCURRENCY") or cpu_count())
+SERVE_HOST=os.environ.get("SERVE_HOST","0.0.0.0")
+SERVE_PORT=int(os.environ.get("SERVE_PORT","8000"))
+SERVE_GRACEFUL_TIMEOUT=float(os.environ.get("SERVE_GRACEFUL_TIMEOUT","30"))
+
+
+class Drain:
+    # Per-worker shutdown state. uvicorn owns SIGTERM while it serves; install()
+    # chains in front of its handler so the worker stops reporting ready and
+    # closes its long-lived streams, which would otherwise hold the drain
+    # open until the graceful timeout.
+    def __init__(self):
+        self.draining=False
+
+    def install(self,on_drain:Callable[[],None]):
+        # signal handlers can only be set from the main thread, which is not
+        # where TestClient runs the lifespan
+        if threading.current_thread() is not threading.main_thread():
+            return
+        previous=signal.getsignal(signal.SIGTERM)
+        loop=asyncio.get_running_loop()
+
+        def handler(sig,frame):
+            if not self.draining:
+                self.draining=True
+                loop.call_soon_threadsafe(on_drain)
+            if callable(previous):
+                previous(sig,frame)
+
+        signal.signal(signal.SIGTERM,handler)
+
+
+drain=Drain()
+
+
+def _available(module:str)->bool:
+    try:
+        __import__(module)
+    except ImportError:
+        return False
+    return True
+
+
+async def _migrate()->list:
+    import asyncpg
+    from blog_crud.db import PG_URL
+    from blog_crud.migrate import migrate
+    pool=await asyncpg.create_pool(dsn=PG_URL,min_size=1,max_size=1)
+    try:
+        return await migrate(pool)
+    finally:
+        await pool.close()
+
+
+def serve(workers:int=WEB_CONCURRENCY,host:str=SERVE_HOST,port:int=SERVE_PORT,migrate:bool=not SKIP_MIGRATIONS):
+    import uvicorn
+    # read by config.per_worker before the pool and hash pool defaults are
+    # computed, here and in every spawned worker
+    os.environ["SERVE_WORKERS"]=str(workers)
+    if migrate:
+        start=time.perf_counter()
+        applied=asyncio.run(_migrate())
+        logger.warning(f"Applied {len(applied)} migrations in {time.perf_counter()-start:.2f}s")
+    # spawned workers inherit the environment; a single worker runs here
+    os.environ["SKIP_MIGRATIONS"]="true"
+    config.SKIP_MIGRATIONS=True
+    uvicorn.run(
+        "blog_crud.main:app",
+        host=host,
+        port=port,
+        workers=workers,
+        loop="uvloop" if _available("uvloop") else "asyncio",
+        http="httptools" if _available("httptools") else "h11",
+        timeout_graceful_shutdown=SERVE_GRACEFUL_TIMEOUT,
+        proxy_headers=True,
+        access_log=False,
+    )
+
+
+if __name__=="__main__":
+    parser=argparse.ArgumentParser(description="Run the API with pre-forked workers")
+    parser.add_argument("--workers",type=int,default=WEB_CONCURRENCY)
+    parser.add_argument("--host",default=SERVE_HOST)
+    parser.add_argument("--port",type=int,default=SERVE_PORT)
+    parser.add_argument("--skip-migrations",action="store_true",help="assume the schema is current")
+    args=parser.parse_args()
+    serve(args.workers,args.host,args.port,migrate=not (args.skip_migrations or SKIP_MIGRATIONS))
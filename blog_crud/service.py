@@ -1,80 +1,115 @@
 from asyncpg.pool import Pool
-from passlib.context import CryptContext
-from typing import Optional, Union
+from asyncpg import Connection, Record
+from collections import Counter
+from typing import AsyncIterator, Optional, Union
 
-pwd_context=CryptContext(schemes=["argon2"],deprecated="auto")
+from blog_crud.hashing import hash_pool
+from blog_crud.cache import invalidations, principal_cache, read_cache, MISSING
+from blog_crud.pagination import DEFAULT_LIMIT, after_id, after_rank, next_cursor
+from blog_crud.export import EXPORT_PREFETCH
+from blog_crud.events import events
+from blog_crud.likes import like_buffer
+from blog_crud.trending import trending
+from blog_crud.feed import comment_feed
+from blog_crud.db import is_replica, named_statements
+import json
 import logging 
 
 logger=logging.getLogger(__name__)
 
-class CreateTables:
-    @staticmethod
-    async def run(db:Pool):
-        await CreateTables.user_table(db)
-        await CreateTables.blog_table(db)
-        await CreateTables.comment_table(db)
+HOT_STATEMENTS:list[str]=[]
 
-        
-    @staticmethod
-    async def user_table(db:Pool):
-        await db.execute(''' 
-                CREATE TABLE IF NOT EXISTS users(
-                    id SERIAL PRIMARY KEY,
-                    name text,
-                    password text
-                );            
-                ''')
-        logger.info("Created USERS table")
-        
-    @staticmethod
-    async def blog_table(db:Pool):
-        await db.execute(''' 
-                CREATE TABLE IF NOT EXISTS blogs(
-                    id SERIAL PRIMARY KEY,
-                    user_id BIGINT REFERENCES users(id) ON DELETE CASCADE,
-                    title text NOT NULL,
-                    content text,
-                    likes bigint DEFAULT 0
-                );         
-                ''')
-        logger.info("Created BLOGs table")
-    @staticmethod
-    async def comment_table(db:Pool):
-        await db.execute(''' 
-                CREATE TABLE IF NOT EXISTS comments(
-                    id SERIAL PRIMARY KEY,
-                    content text,
-                    blog_id BIGINT REFERENCES blogs(id) ON DELETE CASCADE,
-                    user_id BIGINT REFERENCES users(id) ON DELETE CASCADE
-                );            
-                ''')
-        logger.info("Created COMMENTS table")
+HEADLINE_OPTIONS="StartSel=<mark>,StopSel=</mark>,MaxFragments=2,MinWords=5,MaxWords=20"
+
+def hot(query:str)->str:
+    # registers a statement that Database prepares on every new connection;
+    # asyncpg caches by exact text, so callers must use the returned string
+    HOT_STATEMENTS.append(query)
+    return query
+
+def blog_key(blog_id:int)->str:
+    return f"blog:{blog_id}"
+
+def comments_key(blog_id:int)->str:
+    return f"comments:{blog_id}"
+
+def _invalidate(key:str,version:Optional[int]=None):
+    # recorded before the delete, so a read already in flight cannot put
+    # the old row back after it
+    invalidations.invalidated(key,version)
+    return read_cache.delete(key)
+
+def _clear_reads():
+    invalidations.cleared_all()
+    return read_cache.clear()
+
+def _user_deleted(event:dict):
+    principal_cache.revoke(event["id"])
+    # the cascade removes this user's blogs and comments from any cached read
+    return _clear_reads()
+
+# every worker, including the writer, invalidates through these handlers
+events.subscribe("blog",lambda event:_invalidate(blog_key(event["id"]),event.get("version")))
+events.subscribe("comments",lambda event:_invalidate(comments_key(event["id"])))
+events.subscribe("user",lambda event:principal_cache.invalidate(event["id"]))
+events.subscribe("user_deleted",_user_deleted)
+events.subscribe("comments",comment_feed.on_event)
+events.on_resync(principal_cache.clear)
+events.on_resync(_clear_reads)
+events.on_resync(comment_feed.on_resync)
+
+async def reserve_ids(table:str,count:int,db:Union[Pool,Connection])->list[int]:
+    # COPY cannot return generated keys, so bulk writers draw ids up front
+    rows=await db.fetch('''
+        SELECT nextval(pg_get_serial_sequence($1,'id')) AS id
+        FROM generate_series(1,$2);
+        ''',table,count)
+    return [r["id"] for r in rows]
+
+async def stream(query:str,*args,db:Pool)->AsyncIterator[Record]:
+    # a server-side cursor needs a transaction; repeatable read gives the
+    # whole export one consistent snapshot however long it streams for
+    async with db.acquire() as conn:
+        async with conn.transaction(isolation="repeatable_read",readonly=True):
+            async for row in conn.cursor(query,*args,prefetch=EXPORT_PREFETCH):
+                yield row
 
 class PasswordService:
     @staticmethod
-    def hash(password:str)->str:
-        return pwd_context.hash(password)
+    async def hash(password:str)->str:
+        return await hash_pool.hash(password)
     @staticmethod
-    def verify(hashed_pass:str,password:str)->bool:
-        return pwd_context.verify(password,hashed_pass)
+    async def verify(hashed_pass:str,password:str)->bool:
+        return await hash_pool.verify(hashed_pass,password)
 
 
 
+@named_statements
 class UserService:
+    CREATE=hot('''
+        INSERT INTO users (name,password)
+        VALUES($1,$2)
+        RETURNING id;
+        ''')
+    READ_PRINCIPAL=hot('''
+        SELECT id,name FROM users
+        WHERE id=$1;
+        ''')
+    READ_BY_NAME=hot('''
+        SELECT * FROM users
+        WHERE name=$1;
+        ''')
+
     @staticmethod
     async def create(name:str,password:str,db:Pool):
-        hashed=PasswordService.hash(password)
-        row=await db.fetchrow(
-            '''INSERT INTO users (name,password)
-            Values($1,$2)
-            RETURNING id;''',name,hashed
-        )
+        hashed=await PasswordService.hash(password)
+        row=await db.fetchrow(UserService.CREATE,name,hashed)
         logger.info(f"Created user with name={name}")
         return row["id"]
     
     @staticmethod
     async def update(user_id:int,name:str,password:str,db:Pool):
-        hashed=PasswordService.hash(password)
+        hashed=await PasswordService.hash(password)
         result=await db.execute(
             '''UPDATE users 
             SET name=$1 , password=$2
@@ -84,6 +119,7 @@ class UserService:
         if result != "UPDATE 1":
             logger.info(f"User(id={user_id})Failed to Update")
             return False
+        await events.emit(db,[("user",user_id)])
         
         logger.info(f"User(id={user_id}) Updated successfully")
         return True
@@ -91,7 +127,27 @@ class UserService:
     
     @staticmethod
     async def delete(user_id:int,db:Pool):
+        # the cascade drops this user's comments and likes from other people's
+        # blogs, so those blogs are versioned and un-liked in the same statement
         result=await db.execute('''
+            WITH touched AS (
+                SELECT blog_id,sum(liked) AS liked,bool_or(commented) AS commented FROM (
+                    SELECT blog_id,0 AS liked,true AS commented FROM comments WHERE user_id=$1
+                    UNION ALL
+                    SELECT blog_id,1,false FROM blog_likes WHERE user_id=$1
+                ) t
+                GROUP BY blog_id
+            ),
+            unliked AS (
+                UPDATE blogs SET likes=likes-touched.liked
+                FROM touched
+                WHERE blogs.id=touched.blog_id AND touched.liked>0
+            ),
+            edited AS (
+                INSERT INTO comment_edits (blog_id,edits)
+                SELECT blog_id,1 FROM touched WHERE commented AND blog_id IS NOT NULL
+                ON CONFLICT (blog_id) DO UPDATE SET edits=comment_edits.edits+1
+            )
             DELETE FROM users
             WHERE id=$1;
             ''',user_id)
@@ -99,6 +155,7 @@ class UserService:
         if result != "DELETE 1":
             logger.info(f"User(id={user_id})Failed to delete")
             return False
+        await events.emit(db,[("user_deleted",user_id)])
         
         logger.info(f"User(id={user_id}) deleted successfully")
         return True
@@ -111,159 +168,491 @@ class UserService:
             WHERE id=$1;
             ''',user_id)
         return dict(result) if result else False
-    
+
+    @staticmethod
+    async def read_principal(user_id:int,db:Pool):
+        result=await db.fetchrow(UserService.READ_PRINCIPAL,user_id)
+        return dict(result) if result else False
+
     @staticmethod
     async def exists(user_name:str,db:Pool):
-        result=await db.fetchrow('''
-            SELECT * FROM users
-            WHERE name=$1;
-            ''',user_name)
+        result=await db.fetchrow(UserService.READ_BY_NAME,user_name)
         return dict(result) if result else False
     
     @staticmethod
     async def validate(user_name:str,password:str,db:Pool)->Union[dict,bool]:
 
-        res=await db.fetchrow(''' 
-                    SELECT * FROM users
-                    WHERE name=$1;
-                           ''',
-                           user_name)
+        res=await db.fetchrow(UserService.READ_BY_NAME,user_name)
         if not res:
             return False            
-        if PasswordService.verify(res["password"],password):
+        if await PasswordService.verify(res["password"],password):
             return dict(res)
         return False
 
 
+@named_statements
 class BlogService:
+    CREATE=hot('''
+        INSERT INTO blogs (title,content,user_id)
+        VALUES($1,$2,$3)
+        RETURNING id;
+        ''')
+    READ=hot('''
+        SELECT id,user_id,title,content,likes,revision FROM blogs
+        WHERE id=$1;
+        ''')
+    READ_VERSION=hot('''
+        SELECT revision FROM blogs
+        WHERE id=$1;
+        ''')
+    READ_PAGE_VERSIONS=hot('''
+        SELECT id,revision FROM blogs
+        WHERE id>$1
+        ORDER BY id
+        LIMIT $2;
+        ''')
+    READ_PAGE=hot('''
+        SELECT id,user_id,title,content,revision FROM blogs
+        WHERE id>$1
+        ORDER BY id
+        LIMIT $2;
+        ''')
+    READ_PAGE_SUMMARY=hot('''
+        SELECT id,user_id,title,revision FROM blogs
+        WHERE id>$1
+        ORDER BY id
+        LIMIT $2;
+        ''')
+    UPDATE=hot('''
+        UPDATE blogs
+        SET title=coalesce($1,title), content=coalesce($2,content), revision=revision+1
+        WHERE id=$3 AND ($4::bigint IS NULL OR user_id=$4)
+        RETURNING revision;
+        ''')
+    DELETE=hot('''
+        DELETE FROM blogs
+        WHERE id=$1 AND ($2::bigint IS NULL OR user_id=$2);
+        ''')
+    READ_OWNER=hot('''
+        SELECT user_id FROM blogs
+        WHERE id=$1;
+        ''')
+    READ_PAGE_COUNTS=hot('''
+        SELECT b.id,b.user_id,b.title,b.content,u.name AS author,
+            coalesce(b.likes,0) AS likes,
+            (SELECT count(*) FROM comments c WHERE c.blog_id=b.id) AS comment_count
+        FROM blogs b
+        LEFT JOIN users u ON u.id=b.user_id
+        WHERE b.id>$1
+        ORDER BY b.id
+        LIMIT $2;
+        ''')
+    # the whole post page in one round trip; comments are limited before
+    # they are joined to their authors and aggregated
+    READ_FULL=hot('''
+        SELECT json_build_object(
+            'id',b.id,'user_id',b.user_id,'title',b.title,'content',b.content,
+            'author',u.name,
+            'likes',coalesce(b.likes,0),
+            'comment_count',(SELECT count(*) FROM comments c WHERE c.blog_id=b.id),
+            'comments',coalesce((
+                SELECT json_agg(json_build_object(
+                    'id',c.id,'blog_id',c.blog_id,'user_id',c.user_id,'content',c.content,'author',cu.name
+                ) ORDER BY c.id)
+                FROM (
+                    SELECT id,blog_id,user_id,content FROM comments
+                    WHERE blog_id=b.id
+                    ORDER BY id
+                    LIMIT $2
+                ) c
+                LEFT JOIN users cu ON cu.id=c.user_id
+            ),'[]'::json)
+        )::text
+        FROM blogs b
+        LEFT JOIN users u ON u.id=b.user_id
+        WHERE b.id=$1;
+        ''')
+    # headlines are built only for the page that survives the LIMIT
+    SEARCH=hot('''
+        WITH q AS (SELECT websearch_to_tsquery('english',$1) AS query),
+        page AS (
+            SELECT id,user_id,title,content,rank FROM (
+                SELECT b.id,b.user_id,b.title,b.content,ts_rank(b.search,q.query) AS rank
+                FROM blogs b,q
+                WHERE b.search @@ q.query
+            ) hits
+            WHERE $2::real IS NULL OR (rank,id)<($2::real,$3::bigint)
+            ORDER BY rank DESC,id DESC
+            LIMIT $4
+        )
+        SELECT page.id,page.user_id,page.title,page.rank,
+            ts_headline('english',coalesce(page.content,''),q.query,$5) AS snippet
+        FROM page,q
+        ORDER BY page.rank DESC,page.id DESC;
+        ''')
+    # primary key lookups for pages ranked elsewhere (trending)
+    READ_MANY=hot('''
+        SELECT id,user_id,title,coalesce(likes,0) AS likes FROM blogs
+        WHERE id=ANY($1::bigint[]);
+        ''')
+    EXPORT_COLUMNS=("id","user_id","title","content","likes")
+    EXPORT='''
+        SELECT id,user_id,title,content,likes FROM blogs
+        WHERE ($1::bigint IS NULL OR user_id=$1)
+        AND id>=coalesce($2::bigint,0)
+        AND ($3::bigint IS NULL OR id<=$3)
+        ORDER BY id;
+        '''
+
     @staticmethod
     async def create(title:str,content:str,user_id:int,db:Pool):
-        row=await db.fetchrow(
-            '''INSERT INTO blogs (title,content,user_id)
-            Values($1,$2,$3)
-            RETURNING id;''',title,content,user_id
-        )
+        row=await db.fetchrow(BlogService.CREATE,title,content,user_id)
         logger.info(f"Created blog with {title=}")
         return row["id"]
     
     @staticmethod
-    async def update(blog_id:int,title:str,content:str,db:Pool):
-        result=await db.execute(
-            '''UPDATE blogs 
-            SET title=$1 , content=$2
-            WHERE id=$3;
-            ''',
-            title,content,blog_id
-        )
-        if result != "UPDATE 1":
+    async def update(blog_id:int,title:Optional[str],content:Optional[str],db:Pool,user_id:Optional[int]=None):
+        # None leaves a field as it is; with user_id only the owner's row matches
+        revision=await db.fetchval(BlogService.UPDATE,title,content,blog_id,user_id)
+        if revision is None:
             logger.info(f"Blog(id={blog_id})Failed to Update")
             return False
+        await events.emit(db,[("blog",blog_id,revision)])
         
         logger.info(f"Blog(id={blog_id}) Updated successfully")
         return True
         
     
     @staticmethod
-    async def delete(blog_id:int,db:Pool):
-        result=await db.execute('''
-            DELETE FROM blogs
-            WHERE id=$1;
-            ''',blog_id)
+    async def delete(blog_id:int,db:Pool,user_id:Optional[int]=None):
+        result=await db.execute(BlogService.DELETE,blog_id,user_id)
         if result != "DELETE 1":
             logger.info(f"Blog(id={blog_id})Failed to Delete")
             return False
+        await events.emit(db,[("blog",blog_id),("comments",blog_id)])
         
         logger.info(f"Blog(id={blog_id}) Deleted successfully")
         return True
     
+    @staticmethod
+    async def owner(blog_id:int,db:Pool)->Optional[int]:
+        # only needed to explain a failed owned mutation: None means no such blog
+        return await db.fetchval(BlogService.READ_OWNER,blog_id)
+
     @staticmethod
     async def read(blog_id:int,db:Pool):
-        result=await db.fetchrow('''
-            SELECT * FROM blogs
-            WHERE id=$1;
-            ''',blog_id)
-        return dict(result) if result else False
+        key=blog_key(blog_id)
+        cached=await read_cache.get(key)
+        if cached is not MISSING and not invalidations.stale(key,cached.get("revision")):
+            return cached
+        started=invalidations.started()
+        result=await db.fetchrow(BlogService.READ,blog_id)
+        if not result:
+            return False
+        blog=dict(result)
+        # a lagging replica can return the row as it was before a write whose
+        # invalidation already ran; cached, every worker would serve it
+        if not is_replica(db) and invalidations.may_cache(key,started,blog.get("revision")):
+            await read_cache.set(key,blog)
+        return blog
+
+    @staticmethod
+    async def version(blog_id:int,db:Pool)->Optional[int]:
+        # answered from the cached row when there is one, so a revalidation
+        # never sees a newer version than the body read() would serve
+        key=blog_key(blog_id)
+        cached=await read_cache.get(key)
+        if cached is not MISSING and not invalidations.stale(key,cached.get("revision")):
+            return cached.get("revision")
+        return await db.fetchval(BlogService.READ_VERSION,blog_id)
     
     @staticmethod
     async def read_all(db:Pool):
         result=await db.fetch('''
-            SELECT * FROM blogs
+            SELECT id,user_id,title,content,likes,revision FROM blogs
             ''')
         parsed=[dict(i) for i in result]
         return parsed
     
+    @staticmethod
+    async def read_page(db:Pool,limit:int=DEFAULT_LIMIT,after:Optional[str]=None,summary:bool=False):
+        # list reads return Records as fetched; the routes serialize them
+        # directly through RowsResponse. The versions are page_versions()
+        # for the rows actually read, so the page's ETag needs no second query.
+        query=BlogService.READ_PAGE_SUMMARY if summary else BlogService.READ_PAGE
+        result=await db.fetch(query,after_id(after),limit+1)
+        return result[:limit],next_cursor(result,limit),[(r["id"],r["revision"]) for r in result]
+
+    @staticmethod
+    async def read_page_with_counts(db:Pool,limit:int=DEFAULT_LIMIT,after:Optional[str]=None):
+        result=await db.fetch(BlogService.READ_PAGE_COUNTS,after_id(after),limit+1)
+        return result[:limit],next_cursor(result,limit)
+
+    @staticmethod
+    async def read_full(blog_id:int,db:Pool,comment_limit:int=DEFAULT_LIMIT)->Optional[dict]:
+        result=await db.fetchval(BlogService.READ_FULL,blog_id,comment_limit)
+        return json.loads(result) if result else None
+
+    @staticmethod
+    async def page_versions(db:Pool,limit:int=DEFAULT_LIMIT,after:Optional[str]=None)->list[tuple[int,int]]:
+        # the extra row stands in for next_cursor, which changes with it
+        result=await db.fetch(BlogService.READ_PAGE_VERSIONS,after_id(after),limit+1)
+        return [(r["id"],r["revision"]) for r in result]
+    
+    @staticmethod
+    async def search(q:str,db:Pool,limit:int=DEFAULT_LIMIT,after:Optional[str]=None):
+        rank,last_id=after_rank(after)
+        result=await db.fetch(BlogService.SEARCH,q,rank,last_id,limit+1,HEADLINE_OPTIONS)
+        return result[:limit],next_cursor(result,limit,"rank","id")
+
+    @staticmethod
+    async def trending(db:Pool,limit:int=DEFAULT_LIMIT,offset:int=0)->list[dict]:
+        # the ranking comes from the in-memory board; only the page's rows
+        # are read, and blogs deleted since the last reload drop out
+        ranked=trending.top(limit,offset)
+        rows={r["id"]:r for r in await db.fetch(BlogService.READ_MANY,[blog_id for blog_id,_ in ranked])}
+        return [{**rows[blog_id],"score":round(score,3)} for blog_id,score in ranked if blog_id in rows]
+
     @staticmethod
     async def read_all_for_user(user_id:int,db:Pool):
         result=await db.fetch('''
-            SELECT * FROM blogs
+            SELECT id,user_id,title,content,likes,revision FROM blogs
             WHERE user_id=$1;
             ''',user_id)
         parsed=[dict(i) for i in result]
         return parsed
+
+    @staticmethod
+    def export(db:Pool,user_id:Optional[int]=None,min_id:Optional[int]=None,max_id:Optional[int]=None)->AsyncIterator[Record]:
+        return stream(BlogService.EXPORT,user_id,min_id,max_id,db=db)
+
+    @staticmethod
+    async def create_many(blogs:list[tuple[str,str]],user_id:int,db:Connection)->list[int]:
+        ids=await reserve_ids("blogs",len(blogs),db)
+        await db.copy_records_to_table(
+            "blogs",
+            records=[(blog_id,user_id,title,content) for blog_id,(title,content) in zip(ids,blogs)],
+            columns=["id","user_id","title","content"],
+        )
+        logger.info(f"Created {len(ids)} blogs for user_id={user_id}")
+        return ids
         
 
+@named_statements
 class CommentService:
+    # an insert moves count(*) and max(id) in READ_VERSION on its own; only
+    # updates and deletes, which may not, bump the blog's comment_edits row
+    CREATE=hot('''
+        INSERT INTO comments (blog_id,content,user_id)
+        VALUES($1,$2,$3)
+        RETURNING id;
+        ''')
+    UPDATE=hot('''
+        WITH c AS (
+            UPDATE comments
+            SET content=$1
+            WHERE id=$2 AND ($3::bigint IS NULL OR user_id=$3)
+            RETURNING id,blog_id
+        ),
+        edited AS (
+            INSERT INTO comment_edits (blog_id,edits)
+            SELECT blog_id,1 FROM c WHERE blog_id IS NOT NULL
+            ON CONFLICT (blog_id) DO UPDATE SET edits=comment_edits.edits+1
+        )
+        SELECT id,blog_id FROM c;
+        ''')
+    DELETE=hot('''
+        WITH c AS (
+            DELETE FROM comments
+            WHERE id=$1 AND ($2::bigint IS NULL OR user_id=$2)
+            RETURNING id,blog_id
+        ),
+        edited AS (
+            INSERT INTO comment_edits (blog_id,edits)
+            SELECT blog_id,1 FROM c WHERE blog_id IS NOT NULL
+            ON CONFLICT (blog_id) DO UPDATE SET edits=comment_edits.edits+1
+        )
+        SELECT id,blog_id FROM c;
+        ''')
+    READ_OWNER=hot('''
+        SELECT user_id FROM comments
+        WHERE id=$1;
+        ''')
+    READ_VERSION=hot('''
+        SELECT concat_ws('.',c.count,c.max,coalesce(e.edits,0))
+        FROM blogs b
+        CROSS JOIN LATERAL (SELECT count(*),coalesce(max(id),0) AS max FROM comments WHERE blog_id=b.id) c
+        LEFT JOIN comment_edits e ON e.blog_id=b.id
+        WHERE b.id=$1;
+        ''')
+    READ_ALL_FROM_BLOG=hot('''
+        SELECT id,blog_id,user_id,content FROM comments
+        WHERE blog_id=$1;
+        ''')
+    READ_ALL_FROM_USER=hot('''
+        SELECT id,blog_id,user_id,content FROM comments
+        WHERE user_id=$1;
+        ''')
+    SEARCH=hot('''
+        WITH q AS (SELECT websearch_to_tsquery('english',$1) AS query),
+        page AS (
+            SELECT id,blog_id,user_id,content,rank FROM (
+                SELECT c.id,c.blog_id,c.user_id,c.content,ts_rank(c.search,q.query) AS rank
+                FROM comments c,q
+                WHERE c.search @@ q.query
+            ) hits
+            WHERE $2::real IS NULL OR (rank,id)<($2::real,$3::bigint)
+            ORDER BY rank DESC,id DESC
+            LIMIT $4
+        )
+        SELECT page.id,page.blog_id,page.user_id,page.rank,
+            ts_headline('english',coalesce(page.content,''),q.query,$5) AS snippet
+        FROM page,q
+        ORDER BY page.rank DESC,page.id DESC;
+        ''')
+    EXPORT_COLUMNS=("id","blog_id","user_id","content")
+    EXPORT='''
+        SELECT id,blog_id,user_id,content FROM comments
+        WHERE ($1::bigint IS NULL OR user_id=$1)
+        AND id>=coalesce($2::bigint,0)
+        AND ($3::bigint IS NULL OR id<=$3)
+        ORDER BY id;
+        '''
+
     @staticmethod
     async def create(blog_id:int,content:str,user_id:int,db:Pool):
-        row=await db.fetchrow(
-            '''INSERT INTO comments (blog_id,content,user_id)
-            Values($1,$2,$3)
-            RETURNING id;''',blog_id,content,user_id
-        )
+        row=await db.fetchrow(CommentService.CREATE,blog_id,content,user_id)
+        trending.comment(blog_id)
+        await events.emit(db,[("comments",blog_id)])
         return row["id"]
-    
+
     @staticmethod
-    async def update(comment_id:int,content:str,db:Pool):
-        result=await db.execute(
-            '''UPDATE comments 
-            SET content=$1
-            WHERE id=$2;
-            ''',
-            content,comment_id
+    async def committed(per_blog:Counter,db:Pool):
+        # for writers inside a transaction: call with the pool once it has
+        # committed, with the number of comments created per blog
+        for blog_id,count in per_blog.items():
+            trending.comment(blog_id,count)
+        await events.emit(db,[("comments",b) for b in per_blog])
+
+    @staticmethod
+    def export(db:Pool,user_id:Optional[int]=None,min_id:Optional[int]=None,max_id:Optional[int]=None)->AsyncIterator[Record]:
+        return stream(CommentService.EXPORT,user_id,min_id,max_id,db=db)
+
+    @staticmethod
+    async def create_many(comments:list[tuple[int,str]],user_id:int,db:Connection)->list[int]:
+        ids=await reserve_ids("comments",len(comments),db)
+        await db.copy_records_to_table(
+            "comments",
+            records=[(comment_id,blog_id,content,user_id) for comment_id,(blog_id,content) in zip(ids,comments)],
+            columns=["id","blog_id","content","user_id"],
         )
-        if result != "UPDATE 1":
+        logger.info(f"Created {len(ids)} comments for user_id={user_id}")
+        return ids
+    
+    @staticmethod
+    async def update(comment_id:int,content:str,db:Pool,user_id:Optional[int]=None):
+        row=await db.fetchrow(CommentService.UPDATE,content,comment_id,user_id)
+        if row is None:
             logger.info(f"Comment(id={comment_id})Failed to Update")
             return False
+        # legacy comments may have no blog, and so no listing to invalidate
+        if row["blog_id"] is not None:
+            await events.emit(db,[("comments",row["blog_id"])])
         
         logger.info(f"Comment(id={comment_id}) Updated successfully")
         return True
     
     @staticmethod
-    async def delete(comment_id:int,db:Pool):
-        result=await db.execute('''
-            DELETE FROM comments
-            WHERE id=$1;
-            ''',comment_id)
-        if result != "DELETE 1":
+    async def delete(comment_id:int,db:Pool,user_id:Optional[int]=None):
+        row=await db.fetchrow(CommentService.DELETE,comment_id,user_id)
+        if row is None:
             logger.info(f"Comment(id={comment_id})Failed to Delete")
             return False
+        if row["blog_id"] is not None:
+            await events.emit(db,[("comments",row["blog_id"])])
         
         logger.info(f"Comment(id={comment_id}) Deleted successfully")
         return True
         
+    @staticmethod
+    async def owner(comment_id:int,db:Pool)->Optional[int]:
+        return await db.fetchval(CommentService.READ_OWNER,comment_id)
+
     @staticmethod
     async def read(comment_id:int,db:Pool):
         result=await db.fetchrow('''
-            SELECT * FROM comments
+            SELECT id,blog_id,user_id,content FROM comments
             WHERE id=$1;
             ''',comment_id)
         return result
     
 
+    @staticmethod
+    async def read_listing(blog_id:int,db:Pool)->dict:
+        # {"version","comments"}; the version is read first, so it is never
+        # newer than the comments cached alongside it
+        key=comments_key(blog_id)
+        cached=await read_cache.get(key)
+        if cached is not MISSING:
+            return cached
+        started=invalidations.started()
+        version=await db.fetchval(CommentService.READ_VERSION,blog_id)
+        result=await db.fetch(CommentService.READ_ALL_FROM_BLOG,blog_id)
+        listing={"version":version,"comments":[dict(i) for i in result]}
+        if not is_replica(db) and invalidations.may_cache(key,started):
+            await read_cache.set(key,listing)
+        return listing
+
+    @staticmethod
+    async def version(blog_id:int,db:Pool)->Optional[int]:
+        cached=await read_cache.get(comments_key(blog_id))
+        if cached is not MISSING:
+            return cached.get("version")
+        return await db.fetchval(CommentService.READ_VERSION,blog_id)
+
     @staticmethod
     async def read_all_from_blog(blog_id:int,db:Pool):
-        result=await db.fetch('''
-            SELECT * FROM comments
-            WHERE blog_id=$1;
-            ''',blog_id)
-        parsed=[dict(i) for i in result]
-        return parsed
+        return (await CommentService.read_listing(blog_id,db))["comments"]
     
+    @staticmethod
+    async def search(q:str,db:Pool,limit:int=DEFAULT_LIMIT,after:Optional[str]=None):
+        rank,last_id=after_rank(after)
+        result=await db.fetch(CommentService.SEARCH,q,rank,last_id,limit+1,HEADLINE_OPTIONS)
+        return result[:limit],next_cursor(result,limit,"rank","id")
+
     @staticmethod
     async def read_all_from_user(user_id:int,db:Pool):
-        result=await db.fetch('''
-            SELECT * FROM comments
-            WHERE user_id=$1;
-            ''',user_id)
-        parsed=[dict(i) for i in result]
-        return parsed
\ No newline at end of file
+        return await db.fetch(CommentService.READ_ALL_FROM_USER,user_id)
+
+
+@named_statements
+class LikeService:
+    # blog_likes decides whether a click changes anything; the count itself
+    # goes through like_buffer so hot blogs are not updated row-by-row
+    LIKE=hot('''
+        INSERT INTO blog_likes (blog_id,user_id)
+        VALUES($1,$2)
+        ON CONFLICT DO NOTHING
+        RETURNING blog_id;
+        ''')
+    UNLIKE=hot('''
+        DELETE FROM blog_likes
+        WHERE blog_id=$1 AND user_id=$2
+        RETURNING blog_id;
+        ''')
+
+    @staticmethod
+    async def like(blog_id:int,user_id:int,db:Pool)->bool:
+        if await db.fetchval(LikeService.LIKE,blog_id,user_id) is None:
+            return False
+        like_buffer.add(blog_id,1)
+        trending.like(blog_id,1)
+        return True
+
+    @staticmethod
+    async def unlike(blog_id:int,user_id:int,db:Pool)->bool:
+        if await db.fetchval(LikeService.UNLIKE,blog_id,user_id) is None:
+            return False
+        like_buffer.add(blog_id,-1)
+        trending.like(blog_id,-1)
+        return True
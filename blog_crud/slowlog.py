@@ -0,0 +1,107 @@
+from collections import deque
+from blog_crud.config import load_config
+from typing import Any, Optional, Sequence
+import asyncio
+import random
+import json
+import time
+import re
+import os
+import logging
+
+from blog_crud.metrics import registry
+
+logger=logging.getLogger(__name__)
+load_config()
+
+# queries at or above this many milliseconds are logged; 0 turns it off
+DB_SLOW_QUERY_MS=float(os.environ.get("DB_SLOW_QUERY_MS","200"))
+DB_SLOW_QUERY_EXPLAIN_RATE=float(os.environ.get("DB_SLOW_QUERY_EXPLAIN_RATE","0.1"))
+DB_SLOW_QUERY_EXPLAIN_TIMEOUT=float(os.environ.get("DB_SLOW_QUERY_EXPLAIN_TIMEOUT","5"))
+DB_SLOW_QUERY_BUFFER=int(os.environ.get("DB_SLOW_QUERY_BUFFER","100"))
+
+_READ_ONLY=re.compile(r"^\s*(select|with)\b",re.I)
+_WRITES=re.compile(r"\b(insert|update|delete)\b|\bnextval\s*\(|\bpg_notify\s*\(",re.I)
+_EXPLAINABLE=re.compile(r"^\s*(select|with|insert|update|delete)\b",re.I)
+
+slow_total=registry.counter("db_slow_queries_total","Queries over DB_SLOW_QUERY_MS",["statement"])
+explains_total=registry.counter("db_slow_query_explains_total","EXPLAIN captures for slow queries",["outcome"])
+
+
+def redact(args:Sequence[Any])->list[str]:
+    # values never leave the process; their types are usually enough to
+    # reproduce a plan
+    return [type(a).__name__ for a in args]
+
+
+class SlowQueryLog:
+    # Logs queries over the threshold as one JSON line each and keeps the
+    # latest ones in a ring buffer for /admin/slow-queries. A sampled fraction
+    # is re-run under EXPLAIN on another pooled connection, inside a
+    # transaction that is always rolled back. Only side-effect-free SELECTs
+    # get ANALYZE; writes are explained without running them, so capturing a
+    # plan never takes row locks or burns sequence values.
+    def __init__(self,threshold_ms:float=DB_SLOW_QUERY_MS,explain_rate:float=DB_SLOW_QUERY_EXPLAIN_RATE,
+                 size:int=DB_SLOW_QUERY_BUFFER,explain_timeout:float=DB_SLOW_QUERY_EXPLAIN_TIMEOUT):
+        self.threshold_ms=threshold_ms
+        self.threshold=threshold_ms/1000 if threshold_ms>0 else float("inf")
+        self.explain_rate=explain_rate
+        self.explain_timeout=explain_timeout
+        self.entries:deque[dict]=deque(maxlen=size)
+        self._explaining=False
+        self._tasks:set[asyncio.Task]=set()
+
+    def record(self,statement:str,query:str,args:Sequence[Any],seconds:float,pool=None)->dict:
+        entry={
+            "event":"slow_query",
+            "at":time.time(),
+            "statement":statement,
+            "duration_ms":round(seconds*1000,3),
+            "query":" ".join(query.split()),
+            "params":redact(args),
+            "explain":None,
+        }
+        slow_total.inc(statement=statement)
+        logger.warning(json.dumps(entry))
+        self.entries.append(entry)
+        if pool is not None and self._should_explain(query):
+            self._explaining=True
+            task=asyncio.get_running_loop().create_task(self._explain(entry,query,args,pool))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return entry
+
+    def _should_explain(self,query:str)->bool:
+        # one capture at a time: a slow database should not get busier
+        return (not self._explaining and self.explain_rate>0
+                and _EXPLAINABLE.match(query) is not None and random.random()<self.explain_rate)
+
+    async def _explain(self,entry:dict,query:str,args:Sequence[Any],pool):
+        analyze=_READ_ONLY.match(query) is not None and _WRITES.search(query) is None
+        options="ANALYZE, BUFFERS, FORMAT JSON" if analyze else "FORMAT JSON"
+        try:
+            async with pool.acquire(timeout=self.explain_timeout) as conn:
+                tr=conn.transaction()
+                await tr.start()
+                try:
+                    await conn.execute(f"SET LOCAL statement_timeout={int(self.explain_timeout*1000)};")
+                    plan=await conn.fetchval(f"EXPLAIN ({options}) {query}",*args)
+                finally:
+                    await tr.rollback()
+            entry["explain"]=json.loads(plan) if isinstance(plan,str) else plan
+            entry["explain_analyzed"]=analyze
+            explains_total.inc(outcome="captured")
+            logger.warning(json.dumps({"event":"slow_query_plan","statement":entry["statement"],
+                                       "at":entry["at"],"plan":entry["explain"]}))
+        except Exception as e:
+            entry["explain_error"]=str(e)
+            explains_total.inc(outcome="failed")
+        finally:
+            self._explaining=False
+
+    def recent(self,limit:Optional[int]=None)->list[dict]:
+        entries=list(reversed(self.entries))
+        return entries[:limit] if limit else entries
+
+
+slow_queries=SlowQueryLog()
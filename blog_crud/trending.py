@@ -0,0 +1,175 @@
+from asyncpg.pool import Pool
+from blog_crud.config import load_config
+from datetime import datetime, timezone
+from typing import Callable, Iterable, Optional
+import asyncio
+import time
+import os
+import logging
+
+from blog_crud.metrics import registry
+from blog_crud.db import named_statements
+
+logger=logging.getLogger(__name__)
+load_config()
+
+TRENDING_HALF_LIFE_HOURS=float(os.environ.get("TRENDING_HALF_LIFE_HOURS","6"))
+TRENDING_LIKE_WEIGHT=float(os.environ.get("TRENDING_LIKE_WEIGHT","1"))
+TRENDING_COMMENT_WEIGHT=float(os.environ.get("TRENDING_COMMENT_WEIGHT","2"))
+TRENDING_REFRESH_SECONDS=float(os.environ.get("TRENDING_REFRESH_SECONDS","60"))
+# blogs ranked per worker; pages past this are empty
+TRENDING_SIZE=int(os.environ.get("TRENDING_SIZE","1000"))
+# advisory lock key held around REFRESH MATERIALIZED VIEW blog_activity, so
+# one worker per interval recomputes the view; distinct from migrate's key
+TRENDING_LOCK_ID=0x74726e64
+
+refreshes=registry.counter("trending_refreshes_total","Trending reconciliations from blog_activity",["outcome"])
+refresh_duration=registry.histogram("trending_refresh_seconds","Time spent refreshing and reloading blog_activity")
+
+
+@named_statements
+class TrendingBoard:
+    # Top blogs by likes and comments over the last day, exponentially
+    # decayed. Scores use forward decay: an event at time t adds
+    # weight*2^((t-landmark)/half_life), so scores never need rescaling as
+    # time passes and the order only changes when an event arrives. The order
+    # is kept sorted by moving each changed entry up or down past its
+    # neighbours, so a page read is a slice.
+    #
+    # Writes made by this worker are added as they happen; everything else
+    # (other workers, deletes, activity ageing out of the window) arrives
+    # with the periodic reload from blog_activity, which also rebases the
+    # landmark to the reload time. Local writes made after the refresh took
+    # its snapshot are missing from the view, so they are replayed on top.
+    REFRESH='''
+        REFRESH MATERIALIZED VIEW CONCURRENTLY blog_activity;
+        '''
+    TOP='''
+        SELECT blog_id,sum(($1::float8*likes+$2::float8*comments)
+            *power(2,extract(epoch FROM hour+interval '30 minutes'-$3::timestamptz)::float8/$4)) AS score
+        FROM blog_activity
+        GROUP BY blog_id
+        ORDER BY score DESC
+        LIMIT $5;
+        '''
+
+    def __init__(self,size:int=TRENDING_SIZE,half_life_hours:float=TRENDING_HALF_LIFE_HOURS,
+                 interval:float=TRENDING_REFRESH_SECONDS,clock:Callable[[],float]=time.time):
+        self.size=size
+        self.half_life=half_life_hours*3600
+        self.interval=interval
+        self.clock=clock
+        self.landmark=clock()
+        self.scores:dict[int,float]={}
+        self.order:list[int]=[]
+        self.position:dict[int,int]={}
+        self._task:Optional[asyncio.Task]=None
+        # (blog_id, weight, at) added since the running reload began
+        self._since_reload:Optional[list[tuple[int,float,float]]]=None
+        registry.gauge("trending_blogs","Blogs on this worker's trending board",fn=lambda:len(self.order))
+
+    def _boost(self,at:float)->float:
+        return 2**((at-self.landmark)/self.half_life)
+
+    def add(self,blog_id:int,weight:float):
+        at=self.clock()
+        if self._since_reload is not None:
+            self._since_reload.append((blog_id,weight,at))
+        self._apply(blog_id,weight,at)
+
+    def _apply(self,blog_id:int,weight:float,at:float):
+        if blog_id not in self.scores:
+            self.scores[blog_id]=0.0
+            self.position[blog_id]=len(self.order)
+            self.order.append(blog_id)
+        self.scores[blog_id]+=weight*self._boost(at)
+        self._move(blog_id)
+        while len(self.order)>self.size:
+            dropped=self.order.pop()
+            del self.scores[dropped],self.position[dropped]
+
+    def like(self,blog_id:int,delta:int=1):
+        self.add(blog_id,delta*TRENDING_LIKE_WEIGHT)
+
+    def comment(self,blog_id:int,count:int=1):
+        self.add(blog_id,count*TRENDING_COMMENT_WEIGHT)
+
+    def _move(self,blog_id:int):
+        order,position,scores=self.order,self.position,self.scores
+        i=position[blog_id]
+        score=scores[blog_id]
+        while i>0 and scores[order[i-1]]<score:
+            order[i]=order[i-1]
+            position[order[i]]=i
+            i-=1
+        while i<len(order)-1 and scores[order[i+1]]>score:
+            order[i]=order[i+1]
+            position[order[i]]=i
+            i+=1
+        order[i]=blog_id
+        position[blog_id]=i
+
+    def replace(self,ranked:Iterable[tuple[int,float]],landmark:float):
+        # ranked must be best first, scored relative to landmark
+        ranked=list(ranked)[:self.size]
+        self.landmark=landmark
+        self.order=[blog_id for blog_id,_ in ranked]
+        self.scores=dict(ranked)
+        self.position={blog_id:i for i,blog_id in enumerate(self.order)}
+
+    def top(self,limit:int,offset:int=0)->list[tuple[int,float]]:
+        # (blog_id, score decayed to now)
+        decay=1/self._boost(self.clock())
+        return [(blog_id,self.scores[blog_id]*decay) for blog_id in self.order[offset:offset+limit]]
+
+    async def reload(self,db:Pool):
+        # every worker reloads; only the one holding the lock refreshes the
+        # view, so it is recomputed once per interval however many run
+        start=time.perf_counter()
+        landmark=self.clock()
+        try:
+            async with db.acquire() as conn:
+                if await conn.fetchval("SELECT pg_try_advisory_lock($1);",TRENDING_LOCK_ID):
+                    try:
+                        await conn.execute(TrendingBoard.REFRESH)
+                    finally:
+                        await conn.execute("SELECT pg_advisory_unlock($1);",TRENDING_LOCK_ID)
+            # writes recorded from here on committed after the refresh's
+            # snapshot; earlier ones may already be in the view, and replaying
+            # them would count them twice
+            self._since_reload=[]
+            rows=await db.fetch(TrendingBoard.TOP,TRENDING_LIKE_WEIGHT,TRENDING_COMMENT_WEIGHT,
+                                datetime.fromtimestamp(landmark,timezone.utc),self.half_life,self.size)
+        except Exception:
+            refreshes.inc(outcome="failed")
+            raise
+        finally:
+            refresh_duration.observe(time.perf_counter()-start)
+            recent,self._since_reload=self._since_reload or [],None
+        self.replace(((r["blog_id"],r["score"]) for r in rows),landmark)
+        for blog_id,weight,at in recent:
+            self._apply(blog_id,weight,at)
+        refreshes.inc(outcome="ok")
+
+    def start(self,db:Pool):
+        self._task=asyncio.create_task(self._run(db))
+
+    async def _run(self,db:Pool):
+        while True:
+            try:
+                await self.reload(db)
+            except Exception as e:
+                logger.warning(f"Trending refresh failed, keeping the current board: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task=None
+
+
+trending=TrendingBoard()
@@ -1,11 +1,22 @@
+import uuid
 import pytest
 from fastapi.testclient import TestClient
+from blog_crud import ratelimit
 from blog_crud.main import app
 from blog_crud.schema import BlogRequest, CommentRequest
 
 # -----------------------------------------------------------------------------
 # Fixtures
 # -----------------------------------------------------------------------------
+@pytest.fixture(scope="module", autouse=True)
+def no_rate_limits():
+    # the whole module is one client IP and a few users; limits are covered
+    # in test_ratelimit
+    enabled = ratelimit.RATE_LIMITS_ENABLED
+    ratelimit.RATE_LIMITS_ENABLED = False
+    yield
+    ratelimit.RATE_LIMITS_ENABLED = enabled
+
 @pytest.fixture(scope="module")
 def client():
     # lifespan context triggers DB connect/disconnect
@@ -30,6 +41,11 @@ def signup_and_login(client):
 # -----------------------------------------------------------------------------
 # Tests: Users
 # -----------------------------------------------------------------------------
+def test_ready_after_startup(client):
+    resp = client.get("/ready")
+    assert resp.status_code == 200
+    assert resp.json() == {"status": "ready"}
+
 def test_signup_new_user(client):
     resp = client.post("/signup", json={"name": "unique_user", "password": "pw"})
     assert resp.status_code in (200, 403)  # user may already exist
@@ -53,6 +69,27 @@ def test_get_all_blogs(client, signup_and_login):
     data = resp.json()
     assert "blogs" in data
 
+def test_blogs_keyset_pagination(client, signup_and_login):
+    for title in ("page one", "page two"):
+        payload = BlogRequest(title=title, content="paged").model_dump()
+        assert client.post("/blog", headers=signup_and_login, json=payload).status_code == 200
+    first = client.get("/blogs", headers=signup_and_login, params={"limit": 1})
+    assert first.status_code == 200
+    cursor = first.json()["next_cursor"]
+    assert cursor
+    second = client.get("/blogs", headers=signup_and_login, params={"limit": 1, "after": cursor})
+    assert second.status_code == 200
+    assert second.json()["blogs"][0]["id"] > first.json()["blogs"][0]["id"]
+
+def test_blogs_summary_omits_content(client, signup_and_login):
+    resp = client.get("/blogs", headers=signup_and_login, params={"summary": True})
+    assert resp.status_code == 200
+    assert all("content" not in blog for blog in resp.json()["blogs"])
+
+def test_blogs_rejects_bad_cursor(client, signup_and_login):
+    resp = client.get("/blogs", headers=signup_and_login, params={"after": "not-a-cursor"})
+    assert resp.status_code == 400
+
 def test_get_blog_by_id(client, signup_and_login):
     # create a blog first
     new_blog = BlogRequest(title="temp", content="temp").model_dump()
@@ -74,6 +111,19 @@ def test_delete_blog(client, signup_and_login):
     resp = client.delete(f"/blog/{blog_id}", headers=signup_and_login)
     assert resp.status_code == 200
 
+def test_create_blogs_batch(client, signup_and_login):
+    payload = [BlogRequest(title=f"batch {i}", content="bulk").model_dump() for i in range(3)]
+    resp = client.post("/blogs:batch", headers=signup_and_login, json=payload)
+    assert resp.status_code == 200, resp.text
+    ids = resp.json()["ids"]
+    assert len(ids) == 3
+    assert client.get(f"/blog/{ids[-1]}", headers=signup_and_login).status_code == 200
+
+def test_create_blogs_batch_rejects_invalid_row(client, signup_and_login):
+    payload = [BlogRequest(title="ok", content="ok").model_dump(), {"title": "no content"}]
+    resp = client.post("/blogs:batch", headers=signup_and_login, json=payload)
+    assert resp.status_code == 422
+
 # -----------------------------------------------------------------------------
 # Tests: Comments
 # -----------------------------------------------------------------------------
@@ -94,6 +144,168 @@ def test_add_comment_and_fetch(client, signup_and_login):
     assert resp.status_code == 200
     assert "comments" in resp.json()
 
+def test_new_comment_visible_after_cached_read(client, signup_and_login):
+    blog = BlogRequest(title="cached comments", content="stuff").model_dump()
+    blog_id = client.post("/blogs:batch", headers=signup_and_login, json=[blog]).json()["ids"][0]
+    assert client.get(f"/blog/comments/{blog_id}", headers=signup_and_login).json()["comments"] == []
+    comment = CommentRequest(blog_id=blog_id, content="fresh").model_dump()
+    assert client.post("/comment", headers=signup_and_login, json=comment).status_code == 200
+    comments = client.get(f"/blog/comments/{blog_id}", headers=signup_and_login).json()["comments"]
+    assert [c["content"] for c in comments] == ["fresh"]
+
+def test_add_comments_batch_ndjson(client, signup_and_login):
+    blog = BlogRequest(title="batch comments", content="stuff").model_dump()
+    blog_id = client.post("/blogs:batch", headers=signup_and_login, json=[blog]).json()["ids"][0]
+    lines = [CommentRequest(blog_id=blog_id, content=f"c{i}").model_dump_json() for i in range(2)]
+    resp = client.post(
+        "/comments:batch",
+        headers={**signup_and_login, "Content-Type": "application/x-ndjson"},
+        content="\n".join(lines),
+    )
+    assert resp.status_code == 200, resp.text
+    assert len(resp.json()["ids"]) == 2
+
 def test_user_comments_endpoint(client, signup_and_login):
     resp = client.get("/user/comments", headers=signup_and_login)
     assert resp.status_code == 200
+
+# -----------------------------------------------------------------------------
+# Tests: Export
+# -----------------------------------------------------------------------------
+def test_export_blogs_ndjson(client, signup_and_login):
+    resp = client.get("/export/blogs", headers=signup_and_login, params={"min_id": 1})
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    lines = [line for line in resp.text.splitlines() if line]
+    assert lines and all(line.startswith("{") for line in lines)
+
+def test_export_comments_csv(client, signup_and_login):
+    resp = client.get("/export/comments", headers=signup_and_login, params={"format": "csv"})
+    assert resp.status_code == 200
+    assert resp.text.splitlines()[0] == "id,blog_id,user_id,content"
+
+# -----------------------------------------------------------------------------
+# Tests: Metrics
+# -----------------------------------------------------------------------------
+def test_metrics_exposes_hash_pool(client, signup_and_login):
+    resp = client.get("/metrics")
+    assert resp.status_code == 200
+    assert "hash_pool_in_flight" in resp.text
+    assert 'hash_pool_duration_seconds_count{op="verify"}' in resp.text
+
+def test_blog_etag_revalidates(client, signup_and_login):
+    blog = BlogRequest(title="etag", content="v1").model_dump()
+    blog_id = client.post("/blogs:batch", headers=signup_and_login, json=[blog]).json()["ids"][0]
+    resp = client.get(f"/blog/{blog_id}", headers=signup_and_login)
+    etag = resp.headers["ETag"]
+    resp = client.get(f"/blog/{blog_id}", headers={**signup_and_login, "If-None-Match": etag})
+    assert resp.status_code == 304
+    assert resp.content == b""
+
+def test_comments_etag_changes_with_new_comment(client, signup_and_login):
+    blog = BlogRequest(title="etag comments", content="stuff").model_dump()
+    blog_id = client.post("/blogs:batch", headers=signup_and_login, json=[blog]).json()["ids"][0]
+    etag = client.get(f"/blog/comments/{blog_id}", headers=signup_and_login).headers["ETag"]
+    conditional = {**signup_and_login, "If-None-Match": etag}
+    assert client.get(f"/blog/comments/{blog_id}", headers=conditional).status_code == 304
+    comment = CommentRequest(blog_id=blog_id, content="new").model_dump()
+    client.post("/comment", headers=signup_and_login, json=comment)
+    resp = client.get(f"/blog/comments/{blog_id}", headers=conditional)
+    assert resp.status_code == 200
+    assert resp.headers["ETag"] != etag
+
+def test_blogs_page_etag(client, signup_and_login):
+    etag = client.get("/blogs?limit=2", headers=signup_and_login).headers["ETag"]
+    resp = client.get("/blogs?limit=2", headers={**signup_and_login, "If-None-Match": etag})
+    assert resp.status_code == 304
+    resp = client.get("/blogs?limit=2&summary=true", headers={**signup_and_login, "If-None-Match": etag})
+    assert resp.status_code == 200
+
+def test_search_ranks_and_highlights(client, signup_and_login):
+    word = f"zebra{uuid.uuid4().hex[:8]}"
+    blogs = [
+        BlogRequest(title=f"{word} migration", content=f"herds of {word} crossing the river").model_dump(),
+        BlogRequest(title="river notes", content=f"a {word} was seen once").model_dump(),
+    ]
+    client.post("/blogs:batch", headers=signup_and_login, json=blogs)
+    resp = client.get("/search", headers=signup_and_login, params={"q": word, "limit": 1})
+    assert resp.status_code == 200, resp.text
+    page = resp.json()
+    assert page["blogs"][0]["title"] == f"{word} migration"
+    assert "<mark>" in page["blogs"][0]["snippet"]
+    resp = client.get("/search", headers=signup_and_login, params={"q": word, "limit": 1, "after": page["next_cursor"]})
+    assert resp.json()["blogs"][0]["title"] == "river notes"
+
+def test_search_comments(client, signup_and_login):
+    word = f"quokka{uuid.uuid4().hex[:8]}"
+    blog_id = client.post("/blogs:batch", headers=signup_and_login, json=[BlogRequest(title="t", content="c").model_dump()]).json()["ids"][0]
+    client.post("/comment", headers=signup_and_login, json=CommentRequest(blog_id=blog_id, content=f"{word} sighting").model_dump())
+    resp = client.get("/search", headers=signup_and_login, params={"q": word, "scope": "comments"})
+    assert [c["blog_id"] for c in resp.json()["comments"]] == [blog_id]
+
+def test_like_is_idempotent(client, signup_and_login):
+    blog_id = client.post("/blogs:batch", headers=signup_and_login, json=[BlogRequest(title="t", content="c").model_dump()]).json()["ids"][0]
+    assert client.post(f"/blog/{blog_id}/like", headers=signup_and_login).text == "Successfully liked"
+    assert client.post(f"/blog/{blog_id}/like", headers=signup_and_login).text == "Already liked"
+    assert client.delete(f"/blog/{blog_id}/like", headers=signup_and_login).text == "Successfully unliked"
+    assert client.delete(f"/blog/{blog_id}/like", headers=signup_and_login).text == "Not liked"
+
+def test_trending_ranks_recent_activity(client, signup_and_login):
+    blog_id = client.post("/blogs:batch", headers=signup_and_login, json=[BlogRequest(title="hot", content="c").model_dump()]).json()["ids"][0]
+    comments = [CommentRequest(blog_id=blog_id, content=f"c{i}").model_dump() for i in range(50)]
+    assert client.post("/comments:batch", headers=signup_and_login, json=comments).status_code == 200
+    client.post(f"/blog/{blog_id}/like", headers=signup_and_login)
+    resp = client.get("/blogs/trending", headers=signup_and_login, params={"limit": 100})
+    assert resp.status_code == 200, resp.text
+    hot = [b for b in resp.json()["blogs"] if b["id"] == blog_id]
+    assert hot and hot[0]["title"] == "hot" and hot[0]["score"] > 0
+
+def test_blog_full_embeds_comments_and_authors(client, signup_and_login):
+    blog_id = client.post("/blogs:batch", headers=signup_and_login, json=[BlogRequest(title="full", content="page").model_dump()]).json()["ids"][0]
+    for text in ("first", "second"):
+        client.post("/comment", headers=signup_and_login, json=CommentRequest(blog_id=blog_id, content=text).model_dump())
+    resp = client.get(f"/blog/{blog_id}/full", headers=signup_and_login, params={"comments": 1})
+    assert resp.status_code == 200, resp.text
+    blog = resp.json()
+    assert blog["author"] == "tester"
+    assert blog["comment_count"] == 2
+    assert [c["content"] for c in blog["comments"]] == ["first"]
+    assert blog["comments"][0]["author"] == "tester"
+
+def test_blogs_with_counts(client, signup_and_login):
+    resp = client.get("/blogs", headers=signup_and_login, params={"counts": True})
+    assert resp.status_code == 200
+    assert all("comment_count" in b and "author" in b for b in resp.json()["blogs"])
+
+@pytest.fixture(scope="module")
+def other_user(client):
+    client.post("/signup", json={"name": "other_tester", "password": "secret"})
+    resp = client.post("/login", data={"username": "other_tester", "password": "secret"})
+    return {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+def test_patch_blog_updates_fields_and_etag(client, signup_and_login):
+    blog_id = client.post("/blogs:batch", headers=signup_and_login, json=[BlogRequest(title="before", content="body").model_dump()]).json()["ids"][0]
+    etag = client.get(f"/blog/{blog_id}", headers=signup_and_login).headers["ETag"]
+    resp = client.patch(f"/blog/{blog_id}", headers=signup_and_login, json={"title": "after"})
+    assert resp.status_code == 200
+    resp = client.get(f"/blog/{blog_id}", headers={**signup_and_login, "If-None-Match": etag})
+    assert resp.status_code == 200
+    assert (resp.json()["title"], resp.json()["content"]) == ("after", "body")
+
+def test_mutations_check_ownership(client, signup_and_login, other_user):
+    blog_id = client.post("/blogs:batch", headers=signup_and_login, json=[BlogRequest(title="mine", content="c").model_dump()]).json()["ids"][0]
+    assert client.patch(f"/blog/{blog_id}", headers=other_user, json={"title": "x"}).status_code == 403
+    assert client.delete(f"/blog/{blog_id}", headers=other_user).status_code == 403
+    assert client.delete("/blog/999999999", headers=other_user).status_code == 404
+    assert client.get(f"/blog/{blog_id}", headers=signup_and_login).json()["title"] == "mine"
+
+def test_update_and_delete_comment(client, signup_and_login, other_user):
+    blog_id = client.post("/blogs:batch", headers=signup_and_login, json=[BlogRequest(title="t", content="c").model_dump()]).json()["ids"][0]
+    comment_id = client.post("/comments:batch", headers=signup_and_login, json=[CommentRequest(blog_id=blog_id, content="draft").model_dump()]).json()["ids"][0]
+    assert client.patch(f"/comment/{comment_id}", headers=other_user, json={"content": "x"}).status_code == 403
+    assert client.patch(f"/comment/{comment_id}", headers=signup_and_login, json={"content": "final"}).status_code == 200
+    assert [c["content"] for c in client.get(f"/blog/comments/{blog_id}", headers=signup_and_login).json()["comments"]] == ["final"]
+    assert client.delete(f"/comment/{comment_id}", headers=signup_and_login).status_code == 200
+    assert client.delete(f"/comment/{comment_id}", headers=signup_and_login).status_code == 404
+    # the blog the comment was on is untouched
+    assert client.get(f"/blog/{blog_id}", headers=signup_and_login).status_code == 200
@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+
+from blog_crud.cache import CacheBackend, LRUCache, LocalBackend, PrincipalCache, MISSING, hits, misses, read_cache, _hit_ratios
+from blog_crud.events import events
+from blog_crud.service import BlogService, blog_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache("test_lru", maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "b" is now the oldest
+    cache.set("c", 3)
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = LRUCache("test_ttl", maxsize=10, ttl=5, clock=clock)
+    cache.set("k", "v")
+    clock.now = 4.9
+    assert cache.get("k") == "v"
+    clock.now = 5.0
+    assert cache.get("k") is MISSING
+    assert len(cache) == 0
+
+
+def test_hit_and_miss_counters():
+    cache = LRUCache("test_counters", maxsize=10, ttl=60)
+    cache.set(1, "x")
+    cache.get(1)
+    cache.get(2)
+    assert hits.value(cache="test_counters") == 1
+    assert misses.value(cache="test_counters") == 1
+
+
+def test_principal_revoke_leaves_tombstone():
+    cache = PrincipalCache("test_principals", maxsize=10, ttl=60)
+    cache.set(7, {"id": 7, "name": "x"})
+    cache.revoke(7)
+    assert cache.get(7) is None
+    cache.invalidate(7)
+    assert cache.get(7) is MISSING
+
+
+def test_local_backend_read_through_and_delete():
+    backend = LocalBackend("test_backend", maxsize=10, ttl=60)
+
+    async def scenario():
+        assert await backend.get("blog:1") is MISSING
+        await backend.set("blog:1", {"id": 1})
+        assert await backend.get("blog:1") == {"id": 1}
+        await backend.delete("blog:1", "comments:1")
+        assert await backend.get("blog:1") is MISSING
+
+    asyncio.run(scenario())
+    assert _hit_ratios()["test_backend"] == 1 / 3
+
+
+class FakeReadPool:
+    def __init__(self, replica):
+        self.replica = replica
+
+    async def fetchrow(self, query, *args):
+        return {"id": args[0], "title": "old", "revision": 1}
+
+
+def test_backend_must_implement_the_whole_interface():
+    class GetOnly(CacheBackend):
+        async def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        GetOnly()
+
+
+def test_replica_reads_are_not_cached():
+    async def scenario():
+        await BlogService.read(9001, FakeReadPool(replica=True))
+        assert await read_cache.get(blog_key(9001)) is MISSING
+        await BlogService.read(9001, FakeReadPool(replica=False))
+        assert (await read_cache.get(blog_key(9001)))["title"] == "old"
+        await read_cache.delete(blog_key(9001))
+
+    asyncio.run(scenario())
+
+
+class InvalidatedDuringReadPool(FakeReadPool):
+    async def fetchrow(self, query, *args):
+        row = await super().fetchrow(query, *args)
+        # the update commits and its event arrives while this read is in flight
+        await events.dispatch({"entity": "blog", "id": args[0], "version": 2})
+        return row
+
+
+class FakeVersionPool:
+    async def fetchval(self, query, *args):
+        return 2
+
+
+def test_in_flight_read_does_not_cache_over_an_invalidation():
+    async def scenario():
+        await BlogService.read(9002, InvalidatedDuringReadPool(replica=False))
+        assert await read_cache.get(blog_key(9002)) is MISSING
+        # a row older than the announced version is not served either
+        await read_cache.set(blog_key(9002), {"id": 9002, "title": "old", "revision": 1})
+        assert await BlogService.version(9002, FakeVersionPool()) == 2
+        await read_cache.delete(blog_key(9002))
+
+    asyncio.run(scenario())
@@ -0,0 +1,145 @@
+import asyncio
+
+import pytest
+
+from blog_crud.db import Database, InstrumentedPool, named_statements, statement_name, query_latency, query_rows, query_errors
+
+
+class FakeConnection:
+    async def fetchval(self, query, *args, column=0, timeout=None):
+        return 1
+
+    async def fetch(self, query, *args, timeout=None, record_class=None):
+        if "missing_table" in query:
+            raise RuntimeError("relation does not exist")
+        return [{"id": 1}, {"id": 2}]
+
+
+class FakePool:
+    """Stands in for an asyncpg pool; refuses connections when ``down``."""
+
+    def __init__(self, dsn):
+        self.dsn = dsn
+        self.down = False
+        self.hung = False
+        self.closed = False
+
+    async def acquire(self, timeout=None):
+        if self.hung:
+            await asyncio.Event().wait()
+        if self.down:
+            raise OSError("connection refused")
+        return FakeConnection()
+
+    async def release(self, conn):
+        pass
+
+    async def close(self):
+        self.closed = True
+
+
+async def fake_factory(dsn):
+    return FakePool(dsn)
+
+
+def connected(replicas=("replica-a", "replica-b")):
+    database = Database(dsn="primary", replica_dsns=replicas, pool_factory=fake_factory)
+
+    async def connect():
+        await database.connect()
+        # the background health loop is exercised through check_replicas
+        database._health_task.cancel()
+
+    if replicas:
+        asyncio.run(connect())
+    else:
+        asyncio.run(database.connect())
+    return database
+
+
+def target(database, user_id=None):
+    return database.reader(user_id)._pool.dsn
+
+
+def test_reads_round_robin_across_replicas():
+    database = connected()
+    assert [target(database) for _ in range(4)] == ["replica-a", "replica-b", "replica-a", "replica-b"]
+
+
+def test_reads_fall_back_to_primary_without_replicas():
+    database = connected(replicas=())
+    assert target(database) == "primary"
+
+
+def test_unhealthy_replica_is_skipped():
+    database = connected()
+    database.replicas[0]._pool.down = True
+    asyncio.run(database.check_replicas())
+    assert database.healthy == [False, True]
+    assert {target(database) for _ in range(4)} == {"replica-b"}
+
+    database.replicas[1]._pool.down = True
+    asyncio.run(database.check_replicas())
+    assert target(database) == "primary"
+
+    database.replicas[0]._pool.down = False
+    asyncio.run(database.check_replicas())
+    assert target(database) == "replica-a"
+
+
+def test_hung_replica_fails_the_health_check(monkeypatch):
+    monkeypatch.setattr("blog_crud.db.DB_REPLICA_HEALTH_TIMEOUT", 0.01)
+    database = connected()
+    database.replicas[0]._pool.hung = True
+    asyncio.run(database.check_replicas())
+    assert database.healthy == [False, True]
+
+
+def test_failed_replica_read_falls_back_to_primary():
+    database = connected()
+    database.replicas[0]._pool.down = True
+    pool = database.reader()
+    assert pool._pool.dsn == "replica-a"
+    assert asyncio.run(pool.fetchval("SELECT 1;")) == 1
+    assert database.healthy == [False, True]
+    assert {target(database) for _ in range(4)} == {"replica-b"}
+
+
+def test_recent_writer_reads_from_primary():
+    database = connected()
+    database.note_write(42)
+    assert target(database, user_id=42) == "primary"
+    assert target(database, user_id=7).startswith("replica")
+
+
+def test_disconnect_closes_every_pool():
+    database = connected()
+    pools = [database.pool._pool, *(r._pool for r in database.replicas)]
+    asyncio.run(database.disconnect())
+    assert all(p.closed for p in pools)
+
+
+@named_statements
+class Statements:
+    READ_TWO = "SELECT id FROM pairs;"
+
+
+def test_statement_names():
+    assert statement_name(Statements.READ_TWO) == "Statements.READ_TWO"
+    assert statement_name("UPDATE blogs SET likes=0;") == "update blogs"
+    assert statement_name("WITH x AS (SELECT 1) DELETE FROM comments;") == "delete comments"
+    assert statement_name("SELECT 1;") == "other"
+
+
+def test_queries_are_timed_and_rows_counted():
+    pool = InstrumentedPool(FakePool("primary"))
+
+    async def scenario():
+        await pool.fetch(Statements.READ_TWO)
+        with pytest.raises(RuntimeError):
+            await pool.fetch("SELECT * FROM missing_table;")
+
+    asyncio.run(scenario())
+    assert query_latency.count(statement="Statements.READ_TWO") == 1
+    assert query_rows.value(statement="Statements.READ_TWO") == 2
+    assert query_errors.value(statement="select missing_table") == 1
@@ -0,0 +1,28 @@
+from blog_crud.etag import make_etag, page_etag, matches
+
+
+def test_etag_is_strong_and_stable():
+    etag = make_etag("blog", 1, 3)
+    assert etag.startswith('"') and etag.endswith('"')
+    assert etag == make_etag("blog", 1, 3)
+    assert etag != make_etag("blog", 1, 4)
+
+
+def test_page_etag_covers_every_row():
+    assert page_etag([(1, 1), (2, 1)], "blogs") != page_etag([(1, 1), (2, 2)], "blogs")
+    assert page_etag([(1, 1)], "blogs", False) != page_etag([(1, 1)], "blogs", True)
+
+
+def test_if_none_match_lists_wildcard_and_weak_tags():
+    etag = make_etag("blog", 1, 1)
+    assert matches(etag, etag)
+    assert matches(f'"other", {etag}', etag)
+    assert matches(f"W/{etag}", etag)
+    assert matches("*", etag)
+    assert not matches('"other"', etag)
+    assert not matches(None, etag)
+
+
+def test_representation_suffix_still_matches():
+    etag = make_etag("blog", 1, 1)
+    assert matches(etag[:-1] + '-msgpack-gzip"', etag)
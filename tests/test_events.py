@@ -0,0 +1,146 @@
+import asyncio
+import json
+
+from blog_crud import db as db_module
+from blog_crud.db import Database, Listener
+from blog_crud.events import Dispatcher
+from blog_crud.service import CommentService
+
+
+class RecordingPool:
+    def __init__(self):
+        self.calls = []
+
+    async def execute(self, query, *args):
+        self.calls.append(args)
+
+
+def test_emit_runs_local_handlers_and_publishes():
+    dispatcher = Dispatcher(channel="test_channel")
+    seen = []
+    dispatcher.subscribe("blog", lambda event: seen.append(event["id"]))
+    pool = RecordingPool()
+    asyncio.run(dispatcher.emit(pool, [("blog", 1, 4), ("comments", 1)]))
+    assert seen == [1]
+    channel, origin, entities, ids, versions = pool.calls[0]
+    assert (channel, origin, entities, ids) == ("test_channel", dispatcher.origin, ["blog", "comments"], [1, 1])
+    # the blog's revision travels with the event; comments had none to send
+    assert versions == [4, None]
+
+
+def test_notifications_from_self_are_ignored():
+    dispatcher = Dispatcher()
+    seen = []
+
+    async def handler(event):
+        seen.append(event["id"])
+
+    dispatcher.subscribe("blog", handler)
+
+    async def scenario():
+        own = {"origin": dispatcher.origin, "entity": "blog", "id": 1, "version": 10}
+        other = {"origin": "another-worker", "entity": "blog", "id": 2, "version": 11}
+        dispatcher.on_notification(None, 0, dispatcher.channel, json.dumps(own))
+        dispatcher.on_notification(None, 0, dispatcher.channel, json.dumps(other))
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+    assert seen == [2]
+
+
+def test_two_instances_stay_coherent():
+    # needs the DATABASE_URL Postgres, like test_app
+    channel = "blog_crud_test_events"
+
+    async def scenario():
+        caches = {"a": {"blog:1": "old"}, "b": {"blog:1": "old"}}
+        instances = []
+        for name in caches:
+            database, dispatcher = Database(replica_dsns=()), Dispatcher(channel=channel)
+            dispatcher.subscribe("blog", lambda event, name=name: caches[name].pop(f"blog:{event['id']}", None))
+            await database.connect()
+            database.listen(channel, dispatcher.on_notification)
+            instances.append((database, dispatcher))
+        try:
+            for _ in range(100):
+                if all(database.listener.connected for database, _ in instances):
+                    break
+                await asyncio.sleep(0.05)
+            writer_db, writer = instances[0]
+            await writer.emit(writer_db.pool, [("blog", 1)])
+            for _ in range(100):
+                if not caches["b"]:
+                    break
+                await asyncio.sleep(0.05)
+            return caches
+        finally:
+            for database, _ in instances:
+                await database.disconnect()
+
+    assert asyncio.run(scenario()) == {"a": {}, "b": {}}
+
+
+class FakeListenConnection:
+    def __init__(self):
+        self.on_close = None
+        self.closed = False
+
+    def add_termination_listener(self, callback):
+        self.on_close = callback
+
+    async def add_listener(self, channel, callback):
+        pass
+
+    async def execute(self, query, timeout=None):
+        pass
+
+    def is_closed(self):
+        return self.closed
+
+    def terminate(self):
+        self.closed = True
+
+
+def test_listener_reconnects_and_resyncs(monkeypatch):
+    monkeypatch.setattr(db_module, "DB_LISTEN_BACKOFF_MIN", 0.001)
+    connections, resyncs = [], []
+
+    async def connect(dsn):
+        if len(connections) == 1:
+            connections.append(None)
+            raise OSError("connection refused")
+        conn = FakeListenConnection()
+        connections.append(conn)
+        return conn
+
+    async def on_reconnect():
+        resyncs.append(len(connections))
+
+    async def scenario():
+        listener = Listener("dsn", "channel", lambda *args: None, on_reconnect, connect=connect)
+        listener.start()
+        await asyncio.sleep(0.01)
+        assert listener.connected and resyncs == []
+        connections[0].on_close(connections[0])
+        for _ in range(100):
+            if resyncs:
+                break
+            await asyncio.sleep(0.01)
+        await listener.stop()
+
+    asyncio.run(scenario())
+    # first connection, one refused attempt, then a reconnect that resyncs
+    assert resyncs == [3]
+
+
+class LegacyCommentPool(RecordingPool):
+    async def fetchrow(self, query, *args):
+        return {"id": 7, "blog_id": None}
+
+
+def test_legacy_comment_without_blog_still_updates():
+    pool = LegacyCommentPool()
+    assert asyncio.run(CommentService.update(7, "edited", pool, user_id=1))
+    assert asyncio.run(CommentService.delete(7, pool, user_id=1))
+    # no blog, so no listing to invalidate
+    assert pool.calls == []
@@ -0,0 +1,30 @@
+import asyncio
+
+from blog_crud import export
+from blog_crud.export import csv_stream, ndjson_stream
+
+ROWS = [{"id": 1, "title": "a, b", "content": "x"}, {"id": 2, "title": "c", "content": None}]
+
+
+async def rows():
+    for row in ROWS:
+        yield row
+
+
+async def collect(stream):
+    return [chunk async for chunk in stream]
+
+
+def test_ndjson_one_object_per_line():
+    body = b"".join(asyncio.run(collect(ndjson_stream(rows()))))
+    assert body == b'{"id": 1, "title": "a, b", "content": "x"}\n{"id": 2, "title": "c", "content": null}\n'
+
+
+def test_csv_has_header_and_quotes():
+    body = b"".join(asyncio.run(collect(csv_stream(rows(), ["id", "title"]))))
+    assert body.decode().splitlines() == ["id,title", '1,"a, b"', "2,c"]
+
+
+def test_output_is_flushed_in_chunks(monkeypatch):
+    monkeypatch.setattr(export, "EXPORT_FLUSH_BYTES", 1)
+    assert len(asyncio.run(collect(ndjson_stream(rows())))) == 2
@@ -0,0 +1,143 @@
+import asyncio
+
+from blog_crud.feed import CommentFeed, Subscriber, message, sse_stream
+
+
+class CommentsPool:
+    """Answers the feed's queries from an in-memory comments list.
+
+    Every comment counts as recent; ``commit`` controls visibility, so a
+    lower id can show up after a higher one.
+    """
+
+    def __init__(self):
+        self.comments = []
+        self.next_id = 1
+
+    def add(self, blog_id, content, commit=True):
+        comment = {"id": self.next_id, "blog_id": blog_id, "user_id": 1, "content": content}
+        self.next_id += 1
+        if commit:
+            self.commit(comment)
+        return comment
+
+    def commit(self, comment):
+        self.comments.append(comment)
+        self.comments.sort(key=lambda c: c["id"])
+
+    async def fetchval(self, query, blog_id):
+        return max((c["id"] for c in self.comments if c["blog_id"] == blog_id), default=0)
+
+    async def fetch(self, query, blog_id, after, limit):
+        if "created_at" in query:
+            return [c for c in self.comments if c["blog_id"] == blog_id and c["id"] <= after]
+        return [c for c in self.comments if c["blog_id"] == blog_id and c["id"] > after][:limit]
+
+
+def make_feed(**kwargs):
+    pool = CommentsPool()
+    feed = CommentFeed(**kwargs)
+    feed.bind(lambda: pool)
+    return feed, pool
+
+
+async def settle(feed):
+    while feed._tasks:
+        await asyncio.gather(*list(feed._tasks))
+
+
+def test_new_comments_reach_every_subscriber_of_the_blog():
+    feed, pool = make_feed()
+
+    async def scenario():
+        pool.add(1, "before")
+        a, b = await feed.subscribe(1), await feed.subscribe(1)
+        other = await feed.subscribe(2)
+        await settle(feed)
+        pool.add(1, "hello")
+        feed.on_event({"entity": "comments", "id": 1})
+        await settle(feed)
+        return [s.queue.get_nowait().id for s in (a, b)], other.queue.qsize()
+
+    assert asyncio.run(scenario()) == ([2, 2], 0)
+
+
+def test_slow_consumer_is_closed():
+    sub = Subscriber(1, size=2)
+    for i in range(1, 4):
+        sub.offer(message({"id": i}))
+    assert sub.closed
+    assert sub.queue.get_nowait() is None
+
+
+def test_resume_replays_missed_comments_once():
+    feed, pool = make_feed()
+
+    async def scenario():
+        for text in ("a", "b", "c"):
+            pool.add(1, text)
+        await feed.subscribe(1)
+        sub = await feed.subscribe(1, after=1)
+        feed.on_event({"entity": "comments", "id": 1})
+        await settle(feed)
+        return [sub.queue.get_nowait().id for _ in range(sub.queue.qsize())]
+
+    assert asyncio.run(scenario()) == [2, 3]
+
+
+def test_sse_stream_frames_and_unsubscribes():
+    feed, pool = make_feed()
+
+    async def scenario():
+        stream = sse_stream(feed, 1, heartbeat=1)
+        frames = [await stream.__anext__()]
+        (sub,) = feed.topics[1].subscribers
+        sub.offer(message(pool.add(1, "hi")))
+        sub.queue.put_nowait(None)
+        frames += [frame async for frame in stream]
+        return frames, feed.count
+
+    frames, count = asyncio.run(scenario())
+    assert frames[0].startswith(b"retry:")
+    assert frames[1].startswith(b"id: 1\nevent: comment\ndata: {")
+    assert frames[-1].startswith(b"event: overflow")
+    assert count == 0
+
+
+def test_sse_stream_never_started_holds_no_subscriber():
+    feed, _ = make_feed()
+    sse_stream(feed, 1)
+    assert feed.count == 0
+
+
+def test_late_commit_is_delivered_once():
+    feed, pool = make_feed()
+
+    async def scenario():
+        sub = await feed.subscribe(1)
+        slow = pool.add(1, "slow", commit=False)
+        pool.add(1, "fast")
+        feed.on_event({"entity": "comments", "id": 1})
+        await settle(feed)
+        pool.commit(slow)
+        for _ in range(2):
+            feed.on_event({"entity": "comments", "id": 1})
+            await settle(feed)
+        return [sub.queue.get_nowait() for _ in range(sub.queue.qsize())]
+
+    fast, slow = asyncio.run(scenario())
+    assert (fast.id, slow.id) == (2, 1)
+    assert slow.sse.startswith(b"event: comment")
+
+
+def test_subscriber_limit():
+    feed, _ = make_feed(max_subscribers=1)
+
+    async def scenario():
+        await feed.subscribe(1)
+        try:
+            await feed.subscribe(1)
+        except Exception as e:
+            return type(e).__name__
+
+    assert asyncio.run(scenario()) == "FeedFull"
@@ -0,0 +1,61 @@
+import json
+
+import pytest
+from fastapi import FastAPI, Request, Response
+from fastapi.testclient import TestClient
+
+from blog_crud.ingest import read_chunks, BatchError, BatchTooLarge
+from blog_crud.schema import BlogRequest
+
+app = FastAPI()
+
+
+@app.post("/chunks")
+async def chunks(request: Request, max_line: int = 1024):
+    try:
+        sizes = [len(chunk) async for chunk in read_chunks(request, BlogRequest, chunk_size=2, max_rows=5,
+                                                            max_line=max_line)]
+        return {"chunks": sizes}
+    except BatchTooLarge as e:
+        return Response(status_code=413, content=str(e))
+    except BatchError as e:
+        return Response(status_code=422, content=str(e))
+
+
+@pytest.fixture(scope="module")
+def client():
+    return TestClient(app)
+
+
+def blog(i):
+    return {"title": f"t{i}", "content": f"c{i}"}
+
+
+def test_json_array_is_chunked(client):
+    resp = client.post("/chunks", json=[blog(i) for i in range(5)])
+    assert resp.json() == {"chunks": [2, 2, 1]}
+
+
+def test_ndjson_is_chunked(client):
+    body = "\n".join(json.dumps(blog(i)) for i in range(3)) + "\n\n"
+    resp = client.post("/chunks", content=body, headers={"Content-Type": "application/x-ndjson"})
+    assert resp.json() == {"chunks": [2, 1]}
+
+
+def test_invalid_row_reports_its_index(client):
+    rows = [blog(0), {"title": "missing content"}]
+    resp = client.post("/chunks", json=rows)
+    assert resp.status_code == 422
+    assert resp.text.startswith("Row 1:")
+
+
+def test_row_limit(client):
+    resp = client.post("/chunks", json=[blog(i) for i in range(6)])
+    assert resp.status_code == 413
+
+
+def test_ndjson_line_limit(client):
+    body = json.dumps(blog(0)) + "\n" + json.dumps({"title": "t", "content": "x" * 200})
+    resp = client.post("/chunks", params={"max_line": 100}, content=body,
+                       headers={"Content-Type": "application/x-ndjson"})
+    assert resp.status_code == 413
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+from blog_crud.likes import LikeBuffer
+
+
+class RecordingPool:
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+
+    async def execute(self, query, *args):
+        if self.fail:
+            raise OSError("connection lost")
+        self.calls.append(args)
+
+
+def test_deltas_are_aggregated_per_blog():
+    buffer = LikeBuffer()
+    for blog_id, delta in [(2, 1), (1, 1), (2, 1), (3, 1), (3, -1)]:
+        buffer.add(blog_id, delta)
+    pool = RecordingPool()
+    assert asyncio.run(buffer.flush(pool)) == 2
+    # blog 3 netted to zero and is not written
+    assert pool.calls == [([1, 2], [1, 2])]
+    assert asyncio.run(buffer.flush(pool)) == 0
+
+
+def test_failed_flush_keeps_deltas():
+    buffer = LikeBuffer()
+    buffer.add(1, 1)
+    with pytest.raises(OSError):
+        asyncio.run(buffer.flush(RecordingPool(fail=True)))
+    buffer.add(1, 1)
+    assert buffer.pending(1) == 2
+
+
+def test_stop_flushes_remaining_deltas():
+    buffer = LikeBuffer(interval=60)
+    pool = RecordingPool()
+
+    async def scenario():
+        buffer.start(pool)
+        buffer.add(5, 1)
+        await buffer.stop()
+
+    asyncio.run(scenario())
+    assert pool.calls == [([5], [1])]
+
+
+class SlowPool(RecordingPool):
+    def __init__(self):
+        super().__init__()
+        self.started = asyncio.Event()
+
+    async def execute(self, query, *args):
+        self.started.set()
+        await asyncio.sleep(0.05)
+        self.calls.append(args)
+
+
+def test_cancelled_flush_finishes_the_write_once():
+    buffer = LikeBuffer()
+    buffer.add(1, 1)
+    pool = SlowPool()
+
+    async def scenario():
+        task = asyncio.create_task(buffer.flush(pool))
+        await pool.started.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+    assert pool.calls == [([1], [1])]
+    # written, so not queued again
+    assert buffer.pending(1) == 0
+
+
+def test_stop_waits_for_inflight_flush():
+    buffer = LikeBuffer(interval=60)
+    pool = SlowPool()
+
+    async def scenario():
+        buffer.start(pool)
+        buffer.add(5, 1)
+        buffer._wake.set()
+        await pool.started.wait()
+        buffer.add(6, 1)
+        await buffer.stop()
+
+    asyncio.run(scenario())
+    assert pool.calls == [([5], [1]), ([6], [1])]
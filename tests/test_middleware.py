@@ -0,0 +1,26 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from blog_crud.middleware import MetricsMiddleware, in_flight, request_latency, responses
+
+app = FastAPI()
+app.add_middleware(MetricsMiddleware)
+
+
+@app.get("/items/{item_id}")
+async def item(item_id: int):
+    assert in_flight.value() == 1
+    return {"id": item_id}
+
+
+def test_requests_are_labelled_by_route_template():
+    client = TestClient(app)
+    client.get("/items/1")
+    client.get("/items/2")
+    client.get("/items/x")
+    client.get("/nowhere")
+    assert request_latency.count(method="GET", route="/items/{item_id}") == 3
+    assert responses.value(method="GET", route="/items/{item_id}", status="200") == 2
+    assert responses.value(method="GET", route="/items/{item_id}", status="422") == 1
+    assert responses.value(method="GET", route="unmatched", status="404") == 1
+    assert in_flight.value() == 0
@@ -0,0 +1,53 @@
+import asyncio
+import contextlib
+
+from blog_crud.migrate import MIGRATION_TIMEOUT, Migration, load_migrations, migrate
+
+
+def test_migrations_are_ordered_and_unique():
+    migrations = load_migrations()
+    versions = [m.version for m in migrations]
+    assert versions == sorted(set(versions))
+    assert versions[0] == 1
+
+
+def test_query_indexes_migration_present():
+    sql = {m.name: m.sql for m in load_migrations()}["query_indexes"]
+    for index in ("users_name_key", "blogs_user_id_idx", "comments_blog_id_idx", "comments_user_id_idx"):
+        assert index in sql
+
+
+class RecordingConn:
+    def __init__(self):
+        self.executed = []
+
+    async def execute(self, query, *args, timeout=None):
+        self.executed.append((query.strip(), timeout))
+
+    async def fetch(self, query):
+        return []
+
+    def transaction(self):
+        return contextlib.nullcontext()
+
+
+class EmptyPool:
+    def __init__(self):
+        self.conn = RecordingConn()
+
+    async def fetchval(self, query):
+        return 0
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        yield self.conn
+
+
+def test_lock_wait_and_ddl_use_the_migration_timeout(monkeypatch):
+    pool = EmptyPool()
+    ddl = "CREATE TABLE t();"
+    monkeypatch.setattr("blog_crud.migrate.load_migrations", lambda: [Migration(1, "t", ddl)])
+    asyncio.run(migrate(pool))
+    timeouts = dict(pool.conn.executed)
+    assert timeouts["SELECT pg_advisory_lock($1);"] == MIGRATION_TIMEOUT
+    assert timeouts[ddl] == MIGRATION_TIMEOUT
@@ -0,0 +1,20 @@
+import pytest
+
+from blog_crud.pagination import InvalidCursor, after_id, after_rank, encode_cursor, next_cursor
+
+
+def test_next_cursor_only_for_full_pages():
+    rows = [{"id": i} for i in range(1, 4)]
+    assert next_cursor(rows, 3) is None
+    assert after_id(next_cursor(rows, 2)) == 2
+
+
+def test_rank_cursor_round_trips():
+    rows = [{"id": 9, "rank": 0.6079271}, {"id": 4, "rank": 0.25}, {"id": 3, "rank": 0.1}]
+    assert after_rank(next_cursor(rows, 2, "rank", "id")) == (0.25, 4)
+    assert after_rank(None) == (None, None)
+
+
+def test_rank_cursor_rejects_id_only_cursor():
+    with pytest.raises(InvalidCursor):
+        after_rank(encode_cursor(id=4))
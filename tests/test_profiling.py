@@ -0,0 +1,86 @@
+import threading
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+
+from blog_crud.middleware import ServerTimingMiddleware
+from blog_crud.profiling import Sampler, ServerTiming, TimedRoute, add_span, current_spans, server_timing
+from blog_crud.responses import RowsResponse
+
+
+class Item(BaseModel):
+    id: int
+
+
+def make_app(timing):
+    app = FastAPI()
+    app.router.route_class = TimedRoute
+    app.add_middleware(ServerTimingMiddleware, timing=timing)
+
+    @app.get("/item", response_model=Item)
+    async def item():
+        spans = current_spans.get()
+        if spans is not None:
+            add_span(spans, "db", 0.002)
+            add_span(spans, "db", 0.001)
+        return {"id": 1}
+
+    @app.get("/rows")
+    async def rows(request: Request):
+        return RowsResponse({"rows": [{"id": 1}]}, request)
+
+    return app
+
+
+def test_sampled_requests_get_server_timing():
+    timing = ServerTiming(1.0)
+    client = TestClient(make_app(timing))
+    header = client.get("/item").headers["Server-Timing"]
+    assert 'db;dur=3.00;desc="2 calls"' in header
+    assert "validate;dur=" in header and "app;dur=" in header
+    assert "serialize;dur=" in client.get("/rows").headers["Server-Timing"]
+
+
+def test_timing_off_adds_no_header():
+    timing = ServerTiming(0)
+    client = TestClient(make_app(timing))
+    assert "Server-Timing" not in client.get("/item").headers
+    assert client.get("/item").json() == {"id": 1}
+    with pytest.raises(ValueError):
+        timing.set_rate(2)
+
+
+def test_server_timing_format():
+    assert server_timing({"auth": [0.0012, 1], "db": [0.004, 3]}) == 'auth;dur=1.20, db;dur=4.00;desc="3 calls"'
+
+
+def spin_in_marked_function(stop):
+    while not stop.is_set():
+        pass
+
+
+def test_sampler_collapses_other_threads_stacks():
+    stop = threading.Event()
+    worker = threading.Thread(target=spin_in_marked_function, args=(stop,), name="busy")
+    worker.start()
+    try:
+        sampler = Sampler(interval=0.001)
+        stacks, ticks = sampler.sample(0.05)
+    finally:
+        stop.set()
+        worker.join()
+    assert ticks > 0
+    busy = [stack for stack in stacks if stack.startswith("busy;")]
+    assert busy and all("spin_in_marked_function (test_profiling.py:" in stack for stack in busy)
+    line = Sampler.collapsed(stacks).splitlines()[0]
+    assert line.rsplit(" ", 1)[1].isdigit()
+
+
+def test_one_profile_at_a_time():
+    sampler = Sampler(interval=0.001)
+    with sampler.lock:
+        assert sampler.busy()
+        with pytest.raises(RuntimeError):
+            sampler.sample(0.01)
@@ -0,0 +1,97 @@
+import asyncio
+import math
+
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+from blog_crud import ratelimit
+from blog_crud.ratelimit import AdmissionControl, Overloaded, RateLimited, RateLimiter, limit_by_ip, parse_rate
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_parse_rate():
+    assert parse_rate("10/60") == (10, 60.0)
+    assert parse_rate("off") is None
+    assert parse_rate("0") is None
+    with pytest.raises(ValueError):
+        parse_rate("-1/10")
+
+
+def test_bucket_allows_burst_then_refills():
+    clock = FakeClock()
+    limiter = RateLimiter("test_burst", 3, 3, clock=clock)
+    assert [limiter.hit("ip") for _ in range(3)] == [0, 0, 0]
+    assert limiter.hit("ip") == pytest.approx(1.0)
+    clock.now = 1.0
+    assert limiter.hit("ip") == 0
+    assert limiter.hit("ip") > 0
+    # other keys have their own bucket
+    assert limiter.hit("other") == 0
+
+
+def test_idle_buckets_are_evicted():
+    clock = FakeClock()
+    limiter = RateLimiter("test_idle", 2, 10, maxsize=100, clock=clock)
+    limiter.hit("a")
+    limiter.hit("b")
+    assert len(limiter.buckets) == 2
+    # both refilled completely; the next write sweeps them out
+    clock.now = 11
+    limiter.hit("c")
+    assert len(limiter.buckets) == 1
+
+
+def test_bucket_memory_is_bounded():
+    limiter = RateLimiter("test_bounded", 5, 60, maxsize=10)
+    for i in range(1000):
+        limiter.hit(i)
+    assert len(limiter.buckets) == 10
+
+
+def test_rejections_answer_429_with_retry_after(monkeypatch):
+    monkeypatch.setattr(ratelimit, "RATE_LIMITS_ENABLED", True)
+    monkeypatch.setenv("RATE_LIMIT_TEST_ROUTE", "2/60")
+    app = FastAPI()
+
+    @app.exception_handler(RateLimited)
+    async def rate_limited(request, exc):
+        return JSONResponse(status_code=429, content={}, headers={"Retry-After": str(math.ceil(exc.retry_after))})
+
+    @app.get("/", dependencies=[Depends(limit_by_ip("test_route"))])
+    async def route():
+        return {}
+
+    client = TestClient(app)
+    assert [client.get("/").status_code for _ in range(3)] == [200, 200, 429]
+    assert client.get("/").headers["Retry-After"] == "30"
+
+
+def test_admission_queues_then_sheds():
+    async def scenario():
+        admission = AdmissionControl(limit=1, max_waiting=1, wait=0.05)
+        await admission.acquire()
+        waiter = asyncio.ensure_future(admission.acquire())
+        await asyncio.sleep(0)
+        assert admission.waiting == 1
+        # the queue is full
+        with pytest.raises(Overloaded):
+            await admission.acquire()
+        admission.release()
+        await waiter
+        assert admission.in_use == 1 and admission.waiting == 0
+        # nobody releases: the next waiter times out
+        with pytest.raises(Overloaded):
+            await admission.acquire()
+        admission.release()
+        assert admission.in_use == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,65 @@
+import json
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from blog_crud import responses
+from blog_crud.etag import matches, not_modified
+from blog_crud.responses import RowsResponse, pick_encoding
+
+app = FastAPI()
+ROWS = [{"id": i, "user_id": 1, "title": f"t{i}", "content": "x" * 100} for i in range(50)]
+
+
+@app.get("/rows")
+async def rows(request: Request, n: int = 50):
+    if matches(request.headers.get("if-none-match"), '"abc"'):
+        return not_modified('"abc"', request)
+    return RowsResponse({"blogs": ROWS[:n]}, request, headers={"ETag": '"abc"'})
+
+
+@pytest.fixture(scope="module")
+def client():
+    return TestClient(app)
+
+
+def test_large_bodies_are_gzipped(client):
+    resp = client.get("/rows", headers={"Accept-Encoding": "gzip"})
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert resp.headers["ETag"] == '"abc-gzip"'
+    assert resp.json() == {"blogs": ROWS}
+
+
+def test_small_bodies_are_not_compressed(client):
+    resp = client.get("/rows", params={"n": 1}, headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in resp.headers
+    assert resp.headers["ETag"] == '"abc"'
+    assert json.loads(resp.content) == {"blogs": ROWS[:1]}
+
+
+def test_not_modified_repeats_the_variant_etag(client):
+    etag = client.get("/rows", headers={"Accept-Encoding": "gzip"}).headers["ETag"]
+    resp = client.get("/rows", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+    assert resp.status_code == 304
+    assert resp.headers["ETag"] == etag == '"abc-gzip"'
+    assert resp.headers["Vary"] == "Accept, Accept-Encoding"
+    # a body under the threshold was sent uncompressed, and so is its tag
+    resp = client.get("/rows", params={"n": 1}, headers={"Accept-Encoding": "gzip", "If-None-Match": '"abc"'})
+    assert resp.status_code == 304
+    assert resp.headers["ETag"] == '"abc"'
+
+
+def test_encoding_negotiation(monkeypatch):
+    monkeypatch.setattr(responses, "brotli", None)
+    assert pick_encoding("gzip, br") == "gzip"
+    assert pick_encoding("gzip;q=0") is None
+    assert pick_encoding("identity") is None
+    assert pick_encoding("*") == "gzip"
+
+
+def test_msgpack_when_accepted(client):
+    msgpack = pytest.importorskip("msgpack")
+    resp = client.get("/rows", headers={"Accept": "application/msgpack", "Accept-Encoding": "identity"})
+    assert resp.headers["Content-Type"] == "application/msgpack"
+    assert msgpack.unpackb(resp.content) == {"blogs": ROWS}
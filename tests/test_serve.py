@@ -0,0 +1,42 @@
+import asyncio
+import signal
+
+from fastapi.testclient import TestClient
+
+from blog_crud.main import app
+from blog_crud.serve import Drain
+
+
+def test_sigterm_starts_draining_then_reaches_uvicorn():
+    seen, drained = [], []
+    original = signal.signal(signal.SIGTERM, lambda sig, frame: seen.append(sig))
+    try:
+        drain = Drain()
+
+        async def scenario():
+            drain.install(lambda: drained.append(True))
+            signal.raise_signal(signal.SIGTERM)
+            await asyncio.sleep(0)
+
+        asyncio.run(scenario())
+    finally:
+        signal.signal(signal.SIGTERM, original)
+    assert drain.draining
+    assert drained == [True]
+    assert seen == [signal.SIGTERM]
+
+
+def test_not_ready_before_startup():
+    # no lifespan has run, so the pool is not warm
+    resp = TestClient(app).get("/ready")
+    assert resp.status_code == 503
+    assert resp.json() == {"status": "starting"}
+
+
+def test_defaults_are_shared_between_workers(monkeypatch):
+    from blog_crud.config import per_worker
+    monkeypatch.delenv("SERVE_WORKERS", raising=False)
+    assert per_worker(64) == 64
+    monkeypatch.setenv("SERVE_WORKERS", "16")
+    assert per_worker(64) == 4
+    assert per_worker(8) == 1
@@ -0,0 +1,89 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+
+import pytest
+from fastapi import HTTPException
+
+from blog_crud.auth import get_admin_user
+from blog_crud.slowlog import SlowQueryLog
+
+
+class FakeTransaction:
+    def __init__(self, conn):
+        self.conn = conn
+
+    async def start(self):
+        self.conn.log.append("BEGIN")
+
+    async def rollback(self):
+        self.conn.log.append("ROLLBACK")
+
+
+class FakeConnection:
+    def __init__(self):
+        self.log = []
+
+    def transaction(self):
+        return FakeTransaction(self)
+
+    async def execute(self, query):
+        self.log.append(query)
+
+    async def fetchval(self, query, *args):
+        self.log.append(query)
+        return json.dumps([{"Plan": {"Node Type": "Seq Scan"}}])
+
+
+class FakePool:
+    def __init__(self):
+        self.conn = FakeConnection()
+
+    @asynccontextmanager
+    async def acquire(self, timeout=None):
+        yield self.conn
+
+
+def capture(query, args=("secret", 7)):
+    log, pool = SlowQueryLog(threshold_ms=10, explain_rate=1, size=2), FakePool()
+
+    async def scenario():
+        entry = log.record("BlogService.READ", query, args, 0.5, pool)
+        await asyncio.gather(*log._tasks)
+        return entry
+
+    return log, pool.conn.log, asyncio.run(scenario())
+
+
+def test_parameters_are_redacted():
+    _, _, entry = capture("SELECT * FROM blogs WHERE title=$1 AND id=$2;")
+    assert entry["params"] == ["str", "int"]
+    assert "secret" not in json.dumps(entry)
+
+
+def test_selects_are_analyzed_inside_a_rolled_back_transaction():
+    _, statements, entry = capture("SELECT * FROM blogs WHERE id=$1;")
+    assert statements[0] == "BEGIN" and statements[-1] == "ROLLBACK"
+    assert statements[2].startswith("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) SELECT")
+    assert entry["explain"][0]["Plan"]["Node Type"] == "Seq Scan"
+
+
+def test_writes_are_explained_without_running():
+    _, statements, entry = capture("UPDATE blogs SET likes=0 WHERE id=$1;")
+    assert statements[2].startswith("EXPLAIN (FORMAT JSON) UPDATE")
+    assert entry["explain_analyzed"] is False
+
+
+def test_ring_buffer_keeps_latest():
+    log = SlowQueryLog(threshold_ms=10, explain_rate=0, size=2)
+    for i in range(3):
+        log.record(f"s{i}", "SELECT 1;", (), 1.0)
+    assert [e["statement"] for e in log.recent()] == ["s2", "s1"]
+
+
+def test_admin_is_granted_by_id_not_name(monkeypatch):
+    monkeypatch.setattr("blog_crud.auth.ADMIN_USER_IDS", {1})
+    assert asyncio.run(get_admin_user({"id": 1, "name": "ops"}))["id"] == 1
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(get_admin_user({"id": 2, "name": "ops"}))
+    assert exc.value.status_code == 403
@@ -0,0 +1,105 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+from blog_crud.migrate import load_migrations
+from blog_crud.trending import TrendingBoard
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def ids(board, limit=10):
+    return [blog_id for blog_id, _ in board.top(limit)]
+
+
+def test_adds_keep_the_board_sorted():
+    board = TrendingBoard(size=10, half_life_hours=1, clock=FakeClock())
+    board.add(1, 1)
+    board.add(2, 3)
+    board.add(3, 2)
+    assert ids(board) == [2, 3, 1]
+    board.add(1, 5)
+    assert ids(board) == [1, 2, 3]
+    # an unlike moves an entry down
+    board.add(1, -5.5)
+    assert ids(board) == [2, 3, 1]
+    assert board.position == {2: 0, 3: 1, 1: 2}
+
+
+def test_newer_activity_outweighs_older():
+    clock = FakeClock()
+    board = TrendingBoard(size=10, half_life_hours=1, clock=clock)
+    board.add(1, 2)
+    clock.now = 2 * 3600
+    # two half-lives later one event is worth the earlier two
+    board.add(2, 1)
+    board.add(2, 1.01)
+    assert ids(board) == [2, 1]
+    scores = dict(board.top(10))
+    assert scores[1] == pytest.approx(0.5)
+
+
+def test_board_is_bounded():
+    board = TrendingBoard(size=3, half_life_hours=1, clock=FakeClock())
+    for blog_id in range(10):
+        board.add(blog_id, blog_id)
+    assert ids(board) == [9, 8, 7]
+    assert len(board.scores) == len(board.position) == 3
+
+
+def test_replace_rebases_the_landmark():
+    clock = FakeClock()
+    board = TrendingBoard(size=2, half_life_hours=1, clock=clock)
+    board.add(5, 1)
+    clock.now = 3600
+    board.replace([(1, 4.0), (2, 2.0), (3, 1.0)], landmark=clock.now)
+    assert ids(board) == [1, 2]
+    assert board.top(1, offset=1) == [(2, 2.0)]
+    board.add(2, 3)
+    assert ids(board) == [2, 1]
+
+
+def test_activity_view_can_refresh_concurrently():
+    sql = {m.name: m.sql for m in load_migrations()}["trending"]
+    assert "MATERIALIZED VIEW IF NOT EXISTS blog_activity" in sql
+    assert "UNIQUE INDEX IF NOT EXISTS blog_activity_blog_hour_idx" in sql
+
+
+class ReloadingPool:
+    """Refreshes and serves blog_activity, with local likes landing mid-reload.
+
+    The like made during the refresh is in the view already; the one made
+    while the board is read is not.
+    """
+
+    def __init__(self, board):
+        self.board = board
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self
+
+    async def fetchval(self, query, *args):
+        return True
+
+    async def execute(self, query, *args):
+        if "REFRESH" in query:
+            self.board.like(3)
+
+    async def fetch(self, query, *args):
+        self.board.like(2)
+        return [{"blog_id": 3, "score": 2.0}, {"blog_id": 1, "score": 1.5}]
+
+
+def test_reload_replays_only_writes_after_the_refresh():
+    board = TrendingBoard(size=10, half_life_hours=1, clock=FakeClock())
+    asyncio.run(board.reload(ReloadingPool(board)))
+    assert dict(board.top(10)) == {3: 2.0, 1: 1.5, 2: 1.0}
+    assert board._since_reload is None